@@ -3,10 +3,11 @@ ThinkFlow - Active Thinking Partner
 Context-Aware UX: Guidance Mode, Gap Analysis, Clean Design (no emojis).
 """
 
+import hashlib
 import logging
 import os
 import sys
-import tempfile
+import uuid
 from pathlib import Path
 from datetime import datetime
 
@@ -15,6 +16,7 @@ sys.path.insert(0, str(Path(__file__).resolve().parent))
 
 import streamlit as st  # type: ignore[reportMissingImports]
 
+from utils import profiling
 from utils.helpers import format_dday
 
 logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
@@ -44,37 +46,378 @@ def _clean_display_text(s: str) -> str:
     return s.replace("**", "").strip()
 
 
+def _session_id() -> str:
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+
+def _put_context(key: str, text: str, pinned: bool = False) -> str:
+    """
+    Store a context blob and return the stored text. A context over half the session
+    quota (the shown plan's version keeps a second copy) is cut to that size, keeping
+    the start, rather than failing the run.
+    """
+    from core.session_store import get_session_store
+    store = get_session_store()
+    limit = store.quota_bytes // 2
+    raw = text.encode("utf-8")
+    if len(raw) > limit:
+        text = raw[:limit].decode("utf-8", "ignore")
+        if pinned:
+            st.session_state.job_notices.append("입력이 너무 길어 수정 요청에는 앞부분만 참고해요.")
+    store.put(_session_id(), key, text, pinned=pinned)
+    return text
+
+
+def _get_last_context() -> str:
+    """Accumulated context lives in the session store; session_state only keeps the key."""
+    key = st.session_state.get("last_context_key")
+    if not key:
+        return ""
+    from core.session_store import get_session_store
+    return get_session_store().get_text(_session_id(), key)
+
+
+def _set_last_context(text: str) -> None:
+    if text:
+        # Pinned: refinements rebuild from it, so quota eviction must never drop it.
+        _put_context("last_context", text, pinned=True)
+        st.session_state.last_context_key = "last_context"
+    else:
+        from core.session_store import get_session_store
+        get_session_store().delete(_session_id(), "last_context")
+        st.session_state.last_context_key = None
+
+
+def _store_ics(result: dict) -> None:
+    """Generate ICS for the result's actions and keep only its store key in the result."""
+    from core.session_store import get_session_store
+    from utils.helpers import generate_ics
+    with profiling.timed("generate_ics"):
+        ics_bytes = generate_ics(result.get("actions", []))
+    store = get_session_store()
+    if ics_bytes and len(ics_bytes) <= store.quota_bytes:
+        result["_ics_key"] = store.put(_session_id(), "ics", ics_bytes)
+    else:
+        store.delete(_session_id(), "ics")
+        result["_ics_key"] = None
+
+
+def _load_ics(result: dict) -> bytes:
+    """Stored ICS for the result; rebuilt from its actions if it was too large to store."""
+    key = result.get("_ics_key")
+    if not key:
+        if not result.get("actions"):
+            return b""
+        from utils.helpers import generate_ics
+        return generate_ics(result["actions"])
+    from core.session_store import get_session_store
+    return get_session_store().get(_session_id(), key) or b""
+
+
+def _record_session_usage() -> None:
+    """
+    Expose per-session memory (session_state payload + store bytes) as metrics. A session
+    holding nothing has no gauges; the store drops them when the session expires.
+    """
+    from core.session_store import get_session_store
+    from utils import metrics
+    sid = _session_id()
+    result = st.session_state.get("thinkflow_result")
+    store_bytes = get_session_store().usage(sid)
+    if result is None and "plan_history" not in st.session_state and not store_bytes:
+        metrics.remove_gauges(session=sid)
+        return
+    state_bytes = len(repr(result).encode("utf-8"))
+    if "plan_history" in st.session_state:
+        state_bytes += st.session_state.plan_history.approx_bytes()
+    metrics.set_gauge("session_state_bytes", state_bytes, session=sid)
+    metrics.set_gauge("session_memory_bytes", state_bytes + store_bytes, session=sid)
+
+
+def _debug_enabled() -> bool:
+    """THINKFLOW_DEBUG env var or the ?debug= query parameter."""
+    flags = (os.environ.get("THINKFLOW_DEBUG", ""), st.query_params.get("debug") or "")
+    return any(v.strip().lower() in ("1", "true", "on") for v in flags)
+
+
+def _render_metrics_panel() -> None:
+    """Opt-in sidebar panel: this session's memory gauges and the process-wide metrics snapshot."""
+    from utils import metrics
+    snap = metrics.snapshot()
+    gauges = snap["gauges"]
+    sid = _session_id()
+    with st.sidebar.expander("운영 지표"):
+        for name, label in (
+            ("session_memory_bytes", "세션 메모리"),
+            ("session_store_bytes", "세션 저장소"),
+            ("session_state_bytes", "화면 상태"),
+        ):
+            value = gauges.get(f"{name}{{session={sid}}}")
+            if value is not None:
+                st.metric(label, f"{value / 1024:,.1f} KiB")
+        st.json(snap, expanded=False)
+
+
 def _run_refinement(result: dict | None, user_input: str) -> None:
     """Accumulate context and regenerate plan with ThinkFlow AI."""
     if not result or not user_input.strip():
         return
-    prev_plan = ""
-    if not result.get("need_clarification"):
-        exec_s = result.get("executive_summary") or {}
-        prev_plan = f"[이전 계획]\n주제: {exec_s.get('subject', '')}\n개요: {exec_s.get('overview', '')}\n"
-        for i, a in enumerate(result.get("actions", [])[:10], 1):
-            prev_plan += f"{i}. {a.get('summary', '')} (마감: {a.get('due_date', '-')})\n"
-    combined = (st.session_state.last_context or "").strip()
-    if prev_plan:
-        combined += "\n\n" + prev_plan
-    combined += "\n\n[사용자 수정 요청]\n" + user_input.strip()
+    from core.pipeline import compact_refinement_context, plan_summary
+    previous = _get_last_context()
+    if not previous and st.session_state.get("last_context_key"):
+        # The session's stored input expired (idle past THINKFLOW_SESSION_TTL).
+        st.session_state.job_notices.append("이전 입력이 만료되어 현재 계획과 수정 요청만으로 다시 만들어요.")
+    combined = compact_refinement_context(previous, plan_summary(result), user_input)
     if not combined.strip():
         return
-    with st.spinner("수정 요청을 반영해 다시 생성 중..."):
-        try:
-            from core.agent import ThinkFlowAgent
-            from utils.helpers import generate_ics
-            agent = ThinkFlowAgent()
-            new_result = agent.analyze(combined)
-            if new_result.get("need_clarification"):
-                st.session_state.thinkflow_result = new_result
-            else:
-                new_result["_ics_bytes"] = generate_ics(new_result.get("actions", []))
-                st.session_state.thinkflow_result = new_result
-                st.session_state.last_context = combined
+    _submit_analysis(combined, [], note=f"수정 요청: {user_input.strip()}")
+
+
+def _plan_history():
+    from core.plan_history import PlanHistory
+    if "plan_history" not in st.session_state:
+        st.session_state.plan_history = PlanHistory()
+    return st.session_state.plan_history
+
+
+def _record_plan(result: dict, note: str) -> None:
+    """
+    Keep the shown plan as a version (unchanged sections and actions are shared with the
+    previous one). Its input goes to the session store under a content key, so versions
+    made from the same input share one blob; blobs of dropped versions are deleted.
+    """
+    from core.session_store import get_session_store
+    store = get_session_store()
+    context = _get_last_context()
+    key = None
+    if context:
+        key = "plan_context:" + hashlib.sha256(context.encode("utf-8")).hexdigest()[:16]
+        _put_context(key, context)
+    history = _plan_history()
+    history.commit(result, key, note)
+    for released in history.released_contexts():
+        store.delete(_session_id(), released)
+
+
+def _drop_plan_history() -> None:
+    """Forget the session's plan versions and delete their stored inputs (new topic)."""
+    history = st.session_state.pop("plan_history", None)
+    if history is not None:
+        from core.session_store import get_session_store
+        store = get_session_store()
+        for key in history.context_keys():
+            store.delete(_session_id(), key)
+
+
+def _restore_plan(version_id: int) -> None:
+    """Show an earlier plan again: a history lookup plus local ICS rebuild, no LLM call."""
+    history = _plan_history()
+    version = history.get(version_id)
+    if version is None:
+        return
+    from core.session_store import get_session_store
+    context = get_session_store().get_text(_session_id(), version.context_key) if version.context_key else ""
+    if version.context_key and not context:
+        st.session_state.job_notices.append("이 버전을 만든 입력은 보관 한도를 넘어 지워졌어요. 수정 요청은 계획 내용만 참고해요.")
+    result = history.checkout(version_id)
+    _store_ics(result)
+    st.session_state.thinkflow_result = result
+    _set_last_context(context)
+    st.session_state.suggestion_pending = None
+
+
+JOB_POLL_SECONDS = 0.5
+# Result sections by chain name, for the notice shown when a deadline cut chains off.
+SECTION_LABELS = {"executive": "핵심 요약", "structure": "논리 트리", "action": "액션 플랜", "strategic": "전략 코멘트"}
+
+
+def _submit_analysis(thought_text: str, files: list[tuple[str, object]], note: str = "새 분석") -> None:
+    """
+    Queue the analysis pipeline as a background job; the job id also goes into ?job= so a
+    refresh can reattach. note labels the resulting plan version.
+    """
+    from core.jobs import get_job_service
+    from core.pipeline import analysis_job
+    from core.quota import INTERACTIVE, caller
+    with caller(_session_id(), INTERACTIVE):
+        job_id = get_job_service().submit("analysis", analysis_job, thought_text, files)
+    st.session_state.active_job = job_id
+    st.session_state.active_job_note = note
+    st.query_params["job"] = job_id
+    st.rerun()
+
+
+def _sync_preparse(uploaded_files: list | None) -> None:
+    """
+    Whenever the uploads change, parse all of them in one background job (one dedupe
+    scope, like the analysis) on the separate pre-parse pool. Parses are cached by file
+    hash, so resubmitting is cheap and the analysis job only waits for what is still
+    running. The previous job is cancelled only when a file was removed.
+    Tracked per session as {"files": [file_id], "job": job_id}.
+    """
+    from core.jobs import get_preparse_service
+    from core.pipeline import preparse_job
+    from core.quota import BATCH, caller
+    current = [f.file_id for f in uploaded_files or []]
+    tracked = st.session_state.preparse_jobs
+    if tracked.get("files", []) == current:
+        return
+    service = get_preparse_service()
+    if tracked.get("job") and not set(tracked["files"]) <= set(current):
+        service.cancel(tracked["job"])
+    st.session_state.preparse_jobs = {"files": current, "job": None}
+    if not current:
+        return
+    files = [(f.name or "file", f.getvalue()) for f in uploaded_files]
+    # Speculative work: queued behind interactive calls for the API quota.
+    with caller(_session_id(), BATCH):
+        st.session_state.preparse_jobs["job"] = service.submit("preparse", preparse_job, files)
+
+
+def _reset_preparse() -> None:
+    """Cancel the session's pre-parse and forget its uploads (new topic)."""
+    job_id = st.session_state.preparse_jobs.get("job")
+    if job_id:
+        from core.jobs import get_preparse_service
+        get_preparse_service().cancel(job_id)
+    st.session_state.preparse_jobs = {}
+
+
+def _cancel_active_job() -> None:
+    """Stop the session's running analysis (its in-flight API calls are abandoned)."""
+    job_id = st.session_state.get("active_job")
+    if job_id:
+        from core.jobs import get_job_service
+        get_job_service().cancel(job_id)
+    _clear_active_job()
+
+
+def _clear_active_job() -> None:
+    st.session_state.active_job = None
+    if "job" in st.query_params:
+        del st.query_params["job"]
+
+
+def _apply_analysis_output(output: dict) -> None:
+    st.session_state.job_notices = list(output.get("warnings") or [])
+    new_result = output.get("result")
+    if new_result is None:
+        st.session_state.job_notices.append("내용을 입력하거나 참고 자료를 올려 주세요.")
+        return
+    if new_result.get("partial"):
+        failed = new_result.get("failed") or []
+        timed_out = [s for s in new_result.get("skipped", []) if s not in failed]
+        if timed_out:
+            labels = ", ".join(SECTION_LABELS.get(s, s) for s in timed_out)
+            st.session_state.job_notices.append(f"시간 제한을 넘겨 일부만 완성했어요. 비어 있는 항목: {labels}")
+        if failed:
+            labels = ", ".join(SECTION_LABELS.get(s, s) for s in failed)
+            st.session_state.job_notices.append(f"일부 항목을 만들지 못했어요. 다시 시도해 주세요. 비어 있는 항목: {labels}")
+    if "similar_to_previous" in new_result:
+        st.session_state.job_notices.append(
+            f"이전 분석과 거의 같은 입력이라 그 결과를 다시 보여 드려요 (유사도 {new_result['similar_to_previous']:.0%})."
+        )
+    if new_result.get("need_clarification"):
+        st.session_state.thinkflow_result = new_result
+    else:
+        _store_ics(new_result)
+        st.session_state.thinkflow_result = new_result
+        _set_last_context(output.get("context") or "")
+        _record_plan(new_result, st.session_state.get("active_job_note") or "새 분석")
+
+
+def _poll_active_job() -> None:
+    """Show progress for the session's running job, if any (see _job_progress)."""
+    if st.session_state.get("active_job"):
+        _job_progress()
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def _job_progress() -> None:
+    """
+    Progress bar and cancel button, re-run on their own every JOB_POLL_SECONDS so the
+    rest of the page stays usable. When the job finishes, its output moves into
+    session_state and the whole app reruns.
+    """
+    job_id = st.session_state.get("active_job")
+    if not job_id:
+        return
+    from core.jobs import FINISHED_STATES, JobCancelledError, get_job_service
+    service = get_job_service()
+    status = service.poll(job_id)
+    if status is None:
+        _clear_active_job()
+        st.rerun()
+    if status["status"] not in FINISHED_STATES:
+        st.progress(status["progress"], text=status["message"] or "생각을 정리하고 있어요...")
+        if st.button("취소", key="cancel_job"):
+            _cancel_active_job()
             st.rerun()
-        except Exception as e:
-            st.error(f"오류: {e}")
+        return
+    try:
+        output = service.result(job_id, timeout=0)
+    except TimeoutError:
+        # Finished per its status row but the result is not readable yet (another backend): next tick.
+        return
+    except JobCancelledError:
+        _clear_active_job()
+        st.rerun()
+    except Exception as e:
+        _clear_active_job()
+        st.session_state.job_notices.append(f"오류: {e}")
+        st.rerun()
+    _clear_active_job()
+    _apply_analysis_output(output)
+    st.rerun()
+
+
+def _render_tree_detail_controls(tree: dict) -> None:
+    """Pick folded logic-tree branches to draw in full (state in session_state.tree_expanded)."""
+    labels = {**tree["expanded"], **{n: f"{c['label']} (+{c['hidden']})" for n, c in tree["collapsed"].items()}}
+    options = list(labels)
+    if not options:
+        return
+    # Drop branches that are not in this tree (e.g. after a new analysis) before the widget is built.
+    st.session_state.tree_expanded = [n for n in st.session_state.get("tree_expanded") or [] if n in options]
+    if tree["collapsed"]:
+        st.caption(f"노드 {tree['nodes']}개 중 {tree['shown']}개를 보여 드려요. 접힌 가지를 골라 펼칠 수 있어요.")
+    st.multiselect(
+        "펼칠 가지",
+        options=options,
+        format_func=lambda n: labels.get(n, n),
+        key="tree_expanded",
+        label_visibility="collapsed",
+        placeholder="펼칠 가지 선택",
+    )
+
+
+def _render_plan_history(history) -> None:
+    """Sidebar version list: undo to the previous plan or jump to any kept version, with what changed."""
+    from core.plan_history import describe_delta
+    st.markdown("---")
+    st.markdown('<p style="font-size:0.85rem;font-weight:600;color:#4b5563;margin-bottom:0.35rem;">계획 기록</p>', unsafe_allow_html=True)
+    undo_to = history.undo_target()
+    if undo_to is not None and st.button("이전 계획으로 되돌리기", key="plan_undo", use_container_width=True):
+        _restore_plan(undo_to)
+        st.rerun()
+    versions = list(reversed(history.versions()))
+    labels = {v.id: f"v{v.id}{' (현재)' if v.id == history.current else ''} · {v.note or '-'}"[:60] for v in versions}
+    selected = st.selectbox(
+        "버전",
+        options=[v.id for v in versions],
+        format_func=labels.get,
+        key="plan_version",
+        label_visibility="collapsed",
+    )
+    if selected is not None and selected != history.current:
+        st.caption(f"현재 계획 대비: {describe_delta(history.diff(history.current, selected))}")
+        if st.button("이 버전 보기", key="plan_checkout", use_container_width=True):
+            _restore_plan(selected)
+            st.rerun()
+    elif selected is not None:
+        st.caption(f"직전 버전 대비: {describe_delta(history.get(selected).delta)}")
 
 
 # ---- Clean design: mild colors, no emojis ----
@@ -139,13 +482,22 @@ STYLES = """
 
 
 def main():
+    # Opt-in per-rerun profile (THINKFLOW_PROFILE=1 or ?profile=1), see utils.profiling.
+    enabled = profiling.profiling_enabled(st.query_params.get("profile"))
+    with profiling.rerun(enabled, label=_session_id() if enabled else ""):
+        _render()
+
+
+def _render():
     st.set_page_config(
         page_title="ThinkFlow - Thinking Partner",
         page_icon="",  # no emoji
         layout="wide",
         initial_sidebar_state="expanded",
     )
+    profiling.lap("styles")
     st.markdown(STYLES, unsafe_allow_html=True)
+    profiling.lap("setup")
     _inject_secrets_to_env()
 
     if not check_api_key():
@@ -161,12 +513,21 @@ def main():
         st.session_state.thinkflow_result = None
     if "thought_dump" not in st.session_state:
         st.session_state.thought_dump = ""
-    if "last_context" not in st.session_state:
-        st.session_state.last_context = ""
+    if "last_context_key" not in st.session_state:
+        st.session_state.last_context_key = None
     if "suggestion_pending" not in st.session_state:
         st.session_state.suggestion_pending = None
+    if "active_job" not in st.session_state:
+        st.session_state.active_job = st.query_params.get("job")
+    if "job_notices" not in st.session_state:
+        st.session_state.job_notices = []
+    if "preparse_jobs" not in st.session_state:
+        st.session_state.preparse_jobs = {}
+    if "uploader_generation" not in st.session_state:
+        st.session_state.uploader_generation = 0
 
     # ----- Sidebar: Logo, Dumping Zone, File Upload -----
+    profiling.lap("sidebar")
     with st.sidebar:
         st.markdown('<p class="thinkflow-logo">ThinkFlow</p>', unsafe_allow_html=True)
         st.markdown("---")
@@ -187,9 +548,10 @@ def main():
             "PDF 또는 이미지 업로드",
             type=["pdf", "png", "jpg", "jpeg"],
             accept_multiple_files=True,
-            key="ref_files",
+            key=f"ref_files_{st.session_state.uploader_generation}",
             label_visibility="collapsed",
         )
+        _sync_preparse(uploaded_files)
 
         has_input = bool((thought_input or "").strip()) or bool(uploaded_files)
         st.markdown("---")
@@ -201,8 +563,13 @@ def main():
             st.markdown("---")
             st.markdown('<div class="success-box"><strong>분석 완료</strong><br/>전략 맵과 액션 플랜이 준비되었어요. 아래에서 보완할 내용을 추가할 수 있습니다.</div>', unsafe_allow_html=True)
             if st.button("새로운 주제로 시작", use_container_width=True):
+                _cancel_active_job()
+                _reset_preparse()
+                # A new uploader key starts the next topic with no files attached.
+                st.session_state.uploader_generation += 1
                 st.session_state.thinkflow_result = None
-                st.session_state.last_context = ""
+                _set_last_context("")
+                _drop_plan_history()
                 st.rerun()
             st.markdown("---")
             st.markdown('<p style="font-size:0.85rem;font-weight:600;color:#4b5563;margin-bottom:0.35rem;">ThinkFlow에게 수정 요청</p>', unsafe_allow_html=True)
@@ -216,50 +583,27 @@ def main():
             if st.button("보내기", key="sidebar_send", use_container_width=True) and (sidebar_chat or "").strip():
                 _run_refinement(st.session_state.thinkflow_result, sidebar_chat.strip())
 
+        history = st.session_state.get("plan_history")
+        if history is not None and len(history) > 1:
+            _render_plan_history(history)
+
         st.markdown('<p class="footer-text">Powered by Upstage</p>', unsafe_allow_html=True)
 
-    # ----- Run analysis -----
+    # ----- Run analysis (background job) -----
+    profiling.lap("job")
+    for notice in st.session_state.job_notices:
+        st.sidebar.warning(notice)
+    st.session_state.job_notices = []
     if run_clicked:
-        context_parts = []
-        if (thought_input or "").strip():
-            context_parts.append(thought_input.strip())
-        if uploaded_files:
-            try:
-                from core.processor import process_documents
-                paths: list[Path] = []
-                with tempfile.TemporaryDirectory() as tmp:
-                    for f in uploaded_files:
-                        path = Path(tmp) / (f.name or "file")
-                        path.write_bytes(f.getvalue())
-                        paths.append(path)
-                    file_text = process_documents(paths)
-                if file_text and file_text.strip():
-                    context_parts.append(file_text.strip())
-            except Exception as e:
-                st.sidebar.warning(f"참고 자료 처리 중 오류: {e}")
-        combined_context = "\n\n".join(context_parts) if context_parts else ""
-
-        if not combined_context:
-            st.sidebar.info("내용을 입력하거나 참고 자료를 올려 주세요.")
-        else:
-            with st.spinner("생각을 정리하고 있어요..."):
-                try:
-                    from core.agent import ThinkFlowAgent
-                    from utils.helpers import generate_ics
-                    agent = ThinkFlowAgent()
-                    result = agent.analyze(combined_context)
-                    if result.get("need_clarification"):
-                        st.session_state.thinkflow_result = result
-                        st.rerun()
-                    else:
-                        result["_ics_bytes"] = generate_ics(result.get("actions", []))
-                        st.session_state.thinkflow_result = result
-                        st.session_state.last_context = combined_context
-                        st.rerun()
-                except Exception as e:
-                    st.sidebar.error(f"오류: {e}")
+        # Plain bytes: the UploadedFile objects belong to this script run, not to the worker thread.
+        files = [(f.name or "file", f.getvalue()) for f in uploaded_files or []]
+        _submit_analysis(thought_input or "", files)
+    _poll_active_job()
 
     result = st.session_state.thinkflow_result
+    _record_session_usage()
+    if _debug_enabled():
+        _render_metrics_panel()
 
     # ----- Main: State 1 Empty -----
     if result is None:
@@ -292,6 +636,7 @@ def main():
         return
 
     # ----- Main: State 3 Dashboard -----
+    profiling.lap("executive_summary")
     exec_sum = result.get("executive_summary") or {}
     subject = exec_sum.get("subject") or exec_sum.get("title") or "전략 요약"
     overview = exec_sum.get("overview") or exec_sum.get("summary") or ""
@@ -309,15 +654,20 @@ def main():
         st.markdown(f'<div class="card-box"><p class="card-label">하위 성과 지표</p><p class="card-value">{sub_metrics or "-"}</p></div>', unsafe_allow_html=True)
 
     st.markdown("---")
+    profiling.lap("logic_tree")
     st.markdown('<p class="section-title">LOGIC TREE</p>', unsafe_allow_html=True)
     st.markdown('<p style="font-size:0.85rem;color:#6b7280;margin-top:-0.25rem;">전략적 사고의 구조적 가시화</p>', unsafe_allow_html=True)
     mermaid = result.get("mermaid", "")
     if mermaid:
         import streamlit.components.v1 as components  # type: ignore[reportMissingImports]
-        from utils.helpers import render_mermaid
-        html_block = render_mermaid(mermaid, height=500)
+        from utils.helpers import limit_mermaid_detail, render_mermaid
+        # Large trees are drawn to a depth/node budget; folded branches can be opened below.
+        tree = limit_mermaid_detail(mermaid, expanded=st.session_state.get("tree_expanded") or ())
+        with profiling.timed("render_mermaid"):
+            html_block = render_mermaid(tree["code"], height=500)
         if html_block:
             components.html(html_block, height=600, scrolling=True)
+            _render_tree_detail_controls(tree)
             with st.expander("Logic Tree 코드 보기", expanded=False):
                 st.code(mermaid, language="mermaid")
         else:
@@ -326,6 +676,7 @@ def main():
         st.info("생성된 구조가 없습니다.")
 
     st.markdown("---")
+    profiling.lap("action_plan")
     st.markdown('<p class="section-title">ACTION PLAN</p>', unsafe_allow_html=True)
     st.markdown('<p style="font-size:0.85rem;color:#6b7280;margin-top:-0.25rem;">우선순위에 기반한 실행 목록 · <span style="color:#8b7aa8;">이런 것도 필요하신가요?</span> 아래 제안은 이 액션 전후로 할 만한 일을 추천합니다.</p>', unsafe_allow_html=True)
     actions = result.get("actions", [])
@@ -370,8 +721,8 @@ def main():
                             insert_idx = pair if before else pair + 1
                             actions.insert(insert_idx, new_item)
                         result["actions"] = actions
-                        from utils.helpers import generate_ics
-                        result["_ics_bytes"] = generate_ics(actions)
+                        _store_ics(result)
+                        _record_plan(result, f"제안 추가: {_clean_display_text(pending.get('suggestion', ''))[:30]}")
                         st.session_state.suggestion_pending = None
                         st.toast("실행 계획에 추가되었습니다.")
                         st.rerun()
@@ -412,7 +763,7 @@ def main():
                             st.rerun()
                     else:
                         st.caption("-")
-        ics_bytes = result.get("_ics_bytes") or b""
+        ics_bytes = _load_ics(result)
         if ics_bytes:
             st.download_button(
                 label="📅 캘린더 (.ics) 다운로드",
@@ -422,6 +773,7 @@ def main():
             )
 
     st.markdown("---")
+    profiling.lap("timeline")
     st.markdown('<p class="section-title">TIMELINE</p>', unsafe_allow_html=True)
     st.markdown('<p style="font-size:0.85rem;color:#6b7280;margin-top:-0.25rem;">단계별 마일스톤 및 일정 로드맵</p>', unsafe_allow_html=True)
     if not actions:
@@ -473,6 +825,7 @@ def main():
                     )
 
     # ----- Strategic Comments -----
+    profiling.lap("strategic_comments")
     strat = result.get("strategic_comments") or {}
     if strat and (strat.get("must_finish_by") or strat.get("prioritize") or strat.get("can_skip")):
         st.markdown("---")
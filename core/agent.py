@@ -3,13 +3,15 @@ Solar Pro Reasoning Logic (Chain).
 LangChain-based reasoning for mindmap & action extraction.
 """
 
-import json
+import os
 import re
-from typing import Any
+from functools import lru_cache
+from typing import Any, Callable, Optional
 
 from langchain_upstage import ChatUpstage
+from openai import BadRequestError, UnprocessableEntityError
+from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
 
 from utils.prompts import (
     STRUCTURE_PROMPT,
@@ -19,48 +21,142 @@ from utils.prompts import (
     STRATEGIC_COMMENTS_PROMPT,
 )
 from utils.helpers import clean_mermaid
+from core import structured
+from core.deadline import Deadline, DeadlineExceeded
+from core.profiles import get_profile, record_output, route_model
+from core.quota import get_scheduler
+from core.retrieval import estimate_tokens, select_context
+from utils import metrics
+
+CHAIN_PROMPTS = {
+    "gap": GAP_ANALYSIS_PROMPT,
+    "executive": EXECUTIVE_SUMMARY_PROMPT,
+    "structure": STRUCTURE_PROMPT,
+    "action": ACTION_PROMPT,
+    "strategic": STRATEGIC_COMMENTS_PROMPT,
+}
+# Extra runs of a JSON chain whose output fails schema validation.
+SECTION_RETRIES = int(os.environ.get("THINKFLOW_SECTION_RETRIES", 1))
+
+# Models that rejected response_format in this process; their JSON chains fall back to prompt-only.
+_unstructured_models: set[str] = set()
+# Error code/param fragments that mean the API refused the output schema itself.
+_SCHEMA_ERROR_FIELDS = ("response_format", "json_schema")
+
+
+def _rejects_schema(error: Exception) -> bool:
+    """True if a 400/422 names response_format/json_schema in its code or param."""
+    fields = (getattr(error, "code", None), getattr(error, "param", None))
+    return any(f and any(s in str(f) for s in _SCHEMA_ERROR_FIELDS) for f in fields)
+
+
+def _text(value: Any) -> str:
+    """Stripped string for an optional JSON field (null becomes "", not "None")."""
+    return "" if value is None else str(value).strip()
+
+
+@lru_cache(maxsize=16)
+def _llm(model: str, max_tokens: int, temperature: float, timeout: float) -> ChatUpstage:
+    """Shared client per generation profile (keeps HTTP connections across agents)."""
+    return ChatUpstage(model=model, max_tokens=max_tokens, temperature=temperature, timeout=timeout)
 
 
 class ThinkFlowAgent:
     """
     Agent that runs structure (mindmap), action extraction, and executive summary chains.
     Returns {'mermaid': str, 'actions': list, 'executive_summary': dict}.
+    Long contexts are narrowed per chain by core.retrieval (BM25, per-chain token budget).
+    Each chain uses its own generation profile and model route (core.profiles); with a
+    deadline, each call's timeout is cut to the remaining budget and chains that do not
+    fit are skipped (the result is then marked partial).
     """
 
-    def __init__(self, model: str = "solar-pro"):
-        self.llm = ChatUpstage(model=model)
-        self._structure_chain = (
-            {"context": RunnablePassthrough()}
-            | STRUCTURE_PROMPT
-            | self.llm
-            | StrOutputParser()
-        )
-        self._action_chain = (
-            {"context": RunnablePassthrough()}
-            | ACTION_PROMPT
-            | self.llm
-            | StrOutputParser()
-        )
-        self._executive_chain = (
-            {"context": RunnablePassthrough()}
-            | EXECUTIVE_SUMMARY_PROMPT
-            | self.llm
-            | StrOutputParser()
-        )
-        self._gap_chain = (
-            {"context": RunnablePassthrough()}
-            | GAP_ANALYSIS_PROMPT
-            | self.llm
-            | StrOutputParser()
-        )
-        self._strategic_chain = (
-            {"context": RunnablePassthrough(), "actions_summary": RunnablePassthrough()}
-            | STRATEGIC_COMMENTS_PROMPT
-            | self.llm
-            | StrOutputParser()
+    def __init__(self, model: Optional[str] = None):
+        # An explicit model applies to every chain and disables routing.
+        self.model = model
+        self._parser = StrOutputParser()
+
+    def _chain(self, name: str, model: str, timeout: Optional[float] = None, constrained: bool = False) -> Any:
+        profile = get_profile(name)
+        llm = _llm(model, profile["max_tokens"], profile["temperature"], profile["timeout"])
+        kwargs: dict[str, Any] = {}
+        if timeout is not None and timeout < profile["timeout"]:
+            kwargs["timeout"] = timeout
+        if constrained:
+            kwargs["response_format"] = structured.response_format(name)
+        return CHAIN_PROMPTS[name] | (llm.bind(**kwargs) if kwargs else llm)
+
+    def _invoke(
+        self, name: str, inputs: dict[str, str], deadline: Optional[Deadline] = None, schema: bool = True
+    ) -> str:
+        """
+        Run one chain on its routed model within the deadline and record its output size.
+        schema=False requests prompt-only JSON for this call.
+        """
+        deadline = deadline or Deadline()
+        profile = get_profile(name)
+        model = self.model or route_model(name, estimate_tokens(inputs.get("context", "")))
+        constrained = (
+            schema and bool(profile["structured"]) and name in structured.SCHEMAS and model not in _unstructured_models
         )
+        # Quota reservation: prompt + inputs + the output cap; settled with actual usage.
+        input_tokens = estimate_tokens(CHAIN_PROMPTS[name].template) + sum(estimate_tokens(v) for v in inputs.values())
+        try:
+            with get_scheduler("chat").acquire(input_tokens + profile["max_tokens"], deadline) as slot:
+                # Timeout from what is left of the budget after queueing for the quota.
+                chain = self._chain(name, model, deadline.timeout(profile["timeout"]), constrained)
+                message = deadline.call(chain.invoke, inputs)
+                text = self._parser.invoke(message)
+                usage = getattr(message, "usage_metadata", None) or {}
+                output_tokens = usage.get("output_tokens") or estimate_tokens(text)
+                slot.settle(usage.get("total_tokens") or input_tokens + output_tokens)
+        except (InterruptedError, DeadlineExceeded):
+            raise
+        except Exception as e:
+            # A 400/422 on a constrained call: retry this call without the schema, and stop
+            # asking this model for one only if the error says the schema was the problem
+            # (other 400s, e.g. context length, fail again on the retry).
+            if not (constrained and isinstance(e, (BadRequestError, UnprocessableEntityError))):
+                raise
+            if _rejects_schema(e):
+                _unstructured_models.add(model)
+            return self._invoke(name, inputs, deadline, schema=False)
+        metadata = message.response_metadata if isinstance(message, BaseMessage) else {}
+        record_output(name, model, output_tokens, metadata.get("finish_reason") == "length")
+        return text
+
+    def _run_section(self, name: str, inputs: dict[str, str], deadline: Deadline, skipped: list[str]) -> Optional[str]:
+        """_invoke, or None (name appended to skipped) when the deadline passes first."""
+        try:
+            return self._invoke(name, inputs, deadline)
+        except DeadlineExceeded:
+            skipped.append(name)
+            return None
 
-    def check_gaps(self, context: str) -> dict[str, Any]:
+    def _run_json(self, name: str, inputs: dict[str, str], deadline: Deadline, skipped: list[str]) -> Any:
+        """
+        _run_section for JSON chains: load and validate the output (core.structured),
+        re-running only this chain, up to SECTION_RETRIES times, while it fails validation.
+        Returns the last value that parsed at all (callers salvage what they can), or None.
+        """
+        value = None
+        for attempt in range(1 + SECTION_RETRIES):
+            try:
+                raw = self._invoke(name, inputs, deadline)
+            except DeadlineExceeded:
+                if attempt == 0:
+                    skipped.append(name)
+                break
+            parsed, outcome = structured.parse(name, raw)
+            if parsed is not None:
+                value = parsed
+            if outcome != structured.INVALID:
+                break
+            if attempt < SECTION_RETRIES:
+                metrics.incr("chain_retries", chain=name)
+        return value
+
+    def check_gaps(self, context: str, deadline: Optional[Deadline] = None) -> dict[str, Any]:
         """
         Check if input has enough critical info (goal, deadline, assignee).
         Returns: {"ready": bool, "missing": list[str]}.
@@ -68,22 +164,14 @@ class ThinkFlowAgent:
         if not (context and context.strip()):
             return {"ready": False, "missing": ["목표", "마감일", "담당자"]}
         try:
-            raw = self._gap_chain.invoke({"context": context.strip()})
-            return self._parse_gap(raw)
+            data = self._run_json("gap", {"context": select_context(context, "gap")}, deadline or Deadline(), [])
+            return self._parse_gap(data)
+        except InterruptedError:
+            raise
         except Exception:
             return {"ready": True, "missing": []}
 
-    def _parse_gap(self, raw: str) -> dict[str, Any]:
-        if not raw or not raw.strip():
-            return {"ready": True, "missing": []}
-        text = raw.strip()
-        code_match = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
-        if code_match:
-            text = code_match.group(1).strip()
-        try:
-            data = json.loads(text)
-        except json.JSONDecodeError:
-            return {"ready": True, "missing": []}
+    def _parse_gap(self, data: Any) -> dict[str, Any]:
         if not isinstance(data, dict):
             return {"ready": True, "missing": []}
         ready = data.get("ready", True)
@@ -92,19 +180,45 @@ class ThinkFlowAgent:
             missing = []
         return {"ready": ready, "missing": missing}
 
-    def analyze(self, context: str) -> dict[str, Any]:
+    def analyze(
+        self,
+        context: str,
+        on_step: Optional[Callable[[str], None]] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> dict[str, Any]:
         """
         Run gap check first. If info missing, return need_clarification.
         Else run structure, action extraction, and executive summary.
 
+        Args:
+            context: Combined user text and parsed documents.
+            on_step: Optional callback invoked with the chain name ("gap", "executive",
+                "structure", "action", "strategic") before each chain runs.
+            deadline: Overall time budget and cancellation token (core.deadline).
+
         Returns:
             Either { "need_clarification": True, "missing": [...] }
-            Or { "mermaid", "actions", "executive_summary" }
+            Or { "mermaid", "actions", "executive_summary", "strategic_comments" },
+            plus "partial": True and "skipped": [chain names] if the deadline cut
+            some chains off or they failed (their sections are empty); failed chains
+            are also listed under "failed".
+
+        Raises:
+            InterruptedError: If the deadline's token is cancelled.
         """
         if not (context and context.strip()):
             return {"mermaid": "", "actions": [], "executive_summary": {}}
+        deadline = deadline or Deadline()
+        skipped: list[str] = []
+        # Chains that raised (API error, timeout) or never produced a usable value.
+        failed: list[str] = []
+
+        def step(name: str) -> None:
+            if on_step is not None:
+                on_step(name)
 
-        gap = self.check_gaps(context)
+        step("gap")
+        gap = self.check_gaps(context, deadline)
         if not gap.get("ready", True):
             return {
                 "need_clarification": True,
@@ -112,63 +226,76 @@ class ThinkFlowAgent:
             }
 
         # Executive summary
+        step("executive")
         try:
-            exec_raw = self._executive_chain.invoke({"context": context.strip()})
-            executive_summary = self._parse_executive_summary(exec_raw)
+            exec_data = self._run_json("executive", {"context": select_context(context, "executive")}, deadline, skipped)
+        except InterruptedError:
+            raise
         except Exception:
-            executive_summary = {}
+            exec_data = None
+        if exec_data is None and "executive" not in skipped:
+            failed.append("executive")
+        executive_summary = self._parse_executive_summary(exec_data)
 
         # Run structure chain
+        step("structure")
         try:
-            mermaid_raw = self._structure_chain.invoke({"context": context.strip()})
-        except Exception as e:
-            mermaid_raw = f"[Structure generation failed: {e}]"
-        mermaid_out = self._safe_mermaid_output(mermaid_raw)
+            mermaid_raw = self._run_section("structure", {"context": select_context(context, "structure")}, deadline, skipped)
+        except InterruptedError:
+            raise
+        except Exception:
+            mermaid_raw = None
+            failed.append("structure")
+        mermaid_out = self._safe_mermaid_output(mermaid_raw) if mermaid_raw is not None else ""
 
         # Run action chain
+        step("action")
         try:
-            action_raw = self._action_chain.invoke({"context": context.strip()})
+            action_data = self._run_json("action", {"context": select_context(context, "action")}, deadline, skipped)
+        except InterruptedError:
+            raise
         except Exception:
-            action_raw = "[]"
-        actions = self._parse_actions(action_raw)
+            action_data = None
+        if action_data is None and "action" not in skipped:
+            failed.append("action")
+        actions = self._parse_actions(action_data)
 
         actions_summary = "\n".join(f"- {a.get('summary', '')} (마감: {a.get('due_date', '-')})" for a in actions[:15])
-        strategic_comments = {}
+        step("strategic")
         try:
-            strat_raw = self._strategic_chain.invoke({
-                "context": context.strip(),
+            strat_data = self._run_json("strategic", {
+                "context": select_context(context, "strategic"),
                 "actions_summary": actions_summary,
-            })
-            strategic_comments = self._parse_strategic_comments(strat_raw)
+            }, deadline, skipped)
+        except InterruptedError:
+            raise
         except Exception:
-            pass
+            strat_data = None
+        if strat_data is None and "strategic" not in skipped:
+            failed.append("strategic")
+        strategic_comments = self._parse_strategic_comments(strat_data)
 
-        return {
+        result = {
             "mermaid": mermaid_out,
             "actions": actions,
             "executive_summary": executive_summary,
             "strategic_comments": strategic_comments,
         }
+        if skipped or failed:
+            result.update(partial=True, skipped=skipped + failed)
+        if failed:
+            result["failed"] = failed
+        return result
 
-    def _parse_executive_summary(self, raw: str) -> dict[str, Any]:
-        """Parse JSON object from LLM output. Return empty dict on failure."""
-        if not raw or not raw.strip():
-            return {}
-        text = raw.strip()
-        code_match = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
-        if code_match:
-            text = code_match.group(1).strip()
-        try:
-            data = json.loads(text)
-        except json.JSONDecodeError:
-            return {}
+    def _parse_executive_summary(self, data: Any) -> dict[str, Any]:
+        """Normalize the parsed summary object (field aliases, defaults). Return empty dict on failure."""
         if not isinstance(data, dict):
             return {}
         return {
-            "subject": str(data.get("subject", "")).strip() or str(data.get("title", "")).strip() or "전략 요약",
-            "overview": str(data.get("overview", "")).strip() or str(data.get("summary", "")).strip() or "",
-            "main_kpi": str(data.get("main_kpi", "")).strip() or str(data.get("core_value", "")).strip() or "",
-            "sub_metrics": str(data.get("sub_metrics", "")).strip() or str(data.get("growth_driver", "")).strip() or "",
+            "subject": _text(data.get("subject")) or _text(data.get("title")) or "전략 요약",
+            "overview": _text(data.get("overview")) or _text(data.get("summary")),
+            "main_kpi": _text(data.get("main_kpi")) or _text(data.get("core_value")),
+            "sub_metrics": _text(data.get("sub_metrics")) or _text(data.get("growth_driver")),
         }
 
     def _safe_mermaid_output(self, raw: str) -> str:
@@ -180,18 +307,8 @@ class ThinkFlowAgent:
             return cleaned
         return raw.strip() if raw else cleaned
 
-    def _parse_strategic_comments(self, raw: str) -> dict[str, Any]:
-        """Parse strategic comments JSON. Returns {must_finish_by, prioritize, can_skip}."""
-        if not raw or not raw.strip():
-            return {}
-        text = raw.strip()
-        code_match = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
-        if code_match:
-            text = code_match.group(1).strip()
-        try:
-            data = json.loads(text)
-        except json.JSONDecodeError:
-            return {}
+    def _parse_strategic_comments(self, data: Any) -> dict[str, Any]:
+        """Normalize parsed strategic comments. Returns {must_finish_by, prioritize, can_skip}."""
         if not isinstance(data, dict):
             return {}
         out: dict[str, list[str]] = {}
@@ -205,18 +322,8 @@ class ThinkFlowAgent:
                 out[key] = []
         return out
 
-    def _parse_actions(self, raw: str) -> list[dict[str, Any]]:
-        """Parse JSON array from LLM output. Return empty list on failure."""
-        if not raw or not raw.strip():
-            return []
-        text = raw.strip()
-        code_match = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
-        if code_match:
-            text = code_match.group(1).strip()
-        try:
-            data = json.loads(text)
-        except json.JSONDecodeError:
-            return []
+    def _parse_actions(self, data: Any) -> list[dict[str, Any]]:
+        """Normalize the parsed action array. Return empty list on failure."""
         if not isinstance(data, list):
             return []
         out: list[dict[str, Any]] = []
@@ -231,13 +338,13 @@ class ThinkFlowAgent:
             except (ValueError, TypeError):
                 level = 1
             level = 1 if level not in (1, 2) else level
-            dep = str(item.get("dependency", "")).strip() or ""
-            suggestion = str(item.get("ai_suggestion", "")).strip() or ""
-            conditions = str(item.get("conditions", "")).strip() or ""
-            estimated_time = str(item.get("estimated_time", "")).strip() or ""
+            dep = _text(item.get("dependency"))
+            suggestion = _text(item.get("ai_suggestion"))
+            conditions = _text(item.get("conditions"))
+            estimated_time = _text(item.get("estimated_time"))
             is_optional = bool(item.get("is_optional", False))
             out.append({
-                "summary": str(item.get("summary", "")).strip() or "(제목 없음)",
+                "summary": _text(item.get("summary")) or "(제목 없음)",
                 "due_date": item.get("due_date"),
                 "priority": item.get("priority") or "Medium",
                 "level": level,
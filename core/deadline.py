@@ -0,0 +1,94 @@
+"""
+Deadlines & Cancellation.
+An overall time budget plus a cancellation token for one pipeline run, and a helper
+that runs a blocking remote call (LLM chain, OCR request) while watching both.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional
+
+_WAIT_SLICE_SECONDS = 0.1
+# Never hand a remote call less than this, even when the budget is nearly spent.
+MIN_CALL_TIMEOUT_SECONDS = 1.0
+# Helper threads for Deadline.call across the process (THINKFLOW_CALL_THREADS).
+DEFAULT_CALL_THREADS = 32
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _call_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = int(os.environ.get("THINKFLOW_CALL_THREADS", DEFAULT_CALL_THREADS))
+            _executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="deadline-call")
+        return _executor
+
+
+class DeadlineExceeded(TimeoutError):
+    """The run's time budget is used up."""
+
+
+class Deadline:
+    """
+    Time budget and cancellation token. Cancellation raises InterruptedError (as
+    elsewhere in the pipeline); running out of time raises DeadlineExceeded.
+    Deadline() with no arguments never expires and is never cancelled.
+    """
+
+    def __init__(self, seconds: Optional[float] = None, cancel_event: Optional[threading.Event] = None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self.cancel_event = cancel_event or threading.Event()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None without a time limit."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+
+    def check(self) -> None:
+        if self.cancelled():
+            raise InterruptedError("cancelled")
+        if self.expired():
+            raise DeadlineExceeded("deadline exceeded")
+
+    def timeout(self, cap: Optional[float] = None) -> Optional[float]:
+        """Per-call timeout: cap, shortened to what is left of the budget."""
+        left = self.remaining()
+        if left is None:
+            return cap
+        left = max(left, MIN_CALL_TIMEOUT_SECONDS)
+        return min(cap, left) if cap else left
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run fn(*args, **kwargs) on a shared, bounded pool of helper threads and wait for
+        it, giving up as soon as the run is cancelled or out of time. A call abandoned
+        before it started is dropped; one already running finishes in the background
+        and its result is discarded, so fn must carry a request timeout of its own
+        (see timeout()) to give its thread back.
+        """
+        self.check()
+        context = contextvars.copy_context()
+        future = _call_executor().submit(context.run, fn, *args, **kwargs)
+        try:
+            while not wait([future], timeout=_WAIT_SLICE_SECONDS).done:
+                self.check()
+        except BaseException:
+            future.cancel()
+            raise
+        return future.result()
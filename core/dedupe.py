@@ -0,0 +1,176 @@
+"""
+Paragraph Dedupe.
+Drop exact and near-duplicate paragraphs across the thought dump and uploaded documents
+before analysis (MinHash over character shingles + LSH banding, roughly linear time).
+The first occurrence is kept; removed paragraphs are reported with provenance.
+Near-duplicates that differ in a number (dates, amounts) or a person are not removed:
+those are usually successive drafts, and the change is the part that matters.
+"""
+
+import re
+import zlib
+from typing import Any, Optional
+
+from core.retrieval import estimate_tokens
+from utils import metrics
+
+NUM_PERM = 64
+LSH_BANDS = 16
+SHINGLE_CHARS = 5
+NEAR_DUPLICATE_JACCARD = 0.8
+# Paragraphs shorter than this (normalized) are never removed (headings, list markers).
+MIN_PARAGRAPH_CHARS = 12
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPLIT_RE = re.compile(r"\n\s*\n|(?<=</p>)|(?<=</h\d>)|(?<=</li>)|(?<=</table>)")
+_EMPTY = 1 << 32  # signature bin that received no shingle
+_NUMBER_RE = re.compile(r"\d+")
+# A person as drafts name them: Hangul name + title ("김 대리", "박과장님"), or a capitalized Latin name.
+_TITLES = "대리|과장|차장|부장|팀장|실장|본부장|이사|상무|전무|대표|사원|주임|선임|책임|수석|매니저|교수|선생|선배|후배|님|씨"
+_PERSON_RE = re.compile(rf"([가-힣]{{1,4}}?)\s?({_TITLES})|(?<![A-Za-z])([A-Z][a-z]+)(?![a-z])")
+
+
+def normalize(text: str) -> str:
+    """Strip tags/punctuation, lowercase, collapse whitespace."""
+    s = _TAG_RE.sub(" ", text or "").lower()
+    s = re.sub(r"[^\w\s]", " ", s)
+    return " ".join(s.split())
+
+
+def shingles(text: str, k: int = SHINGLE_CHARS) -> set[int]:
+    """crc32 of overlapping k-character shingles of normalized text (works for Hangul and Latin)."""
+    s = normalize(text).replace(" ", "")
+    if len(s) <= k:
+        return {zlib.crc32(s.encode("utf-8"))} if s else set()
+    return {zlib.crc32(s[i:i + k].encode("utf-8")) for i in range(len(s) - k + 1)}
+
+
+def minhash(shingle_set: set[int], num_perm: int = NUM_PERM) -> tuple[int, ...]:
+    """
+    num_perm-bin MinHash signature (one-permutation hashing: each shingle hash goes to
+    one bin, which keeps its minimum). One pass per shingle instead of num_perm.
+    """
+    sig = [_EMPTY] * num_perm
+    for x in shingle_set:
+        h = (x * 0x9E3779B1) & 0xFFFFFFFF
+        b = h % num_perm
+        v = h // num_perm
+        if v < sig[b]:
+            sig[b] = v
+    return tuple(sig)
+
+
+def jaccard_estimate(sig_a: tuple[int, ...], sig_b: tuple[int, ...]) -> float:
+    """Share of matching bins among bins that are non-empty in either signature."""
+    used = matched = 0
+    for x, y in zip(sig_a, sig_b):
+        if x == _EMPTY and y == _EMPTY:
+            continue
+        used += 1
+        if x == y:
+            matched += 1
+    return matched / used if used else 0.0
+
+
+def identifiers(text: str) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """(sorted numbers, sorted person mentions) of a paragraph; near-duplicates must agree on both."""
+    plain = _TAG_RE.sub(" ", text or "")
+    people = sorted("".join(m.groups(default="")) for m in _PERSON_RE.finditer(plain))
+    return tuple(sorted(_NUMBER_RE.findall(plain))), tuple(people)
+
+
+def split_paragraphs(text: str) -> list[str]:
+    """Paragraphs split on blank lines and block-level HTML tags."""
+    return [p.strip() for p in _SPLIT_RE.split(text or "") if p and p.strip()]
+
+
+class _LSH:
+    """Band the signature; paragraphs sharing any band bucket become candidates."""
+
+    def __init__(self, bands: int = LSH_BANDS):
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self.buckets: list[dict[tuple[int, ...], list[int]]] = [{} for _ in range(bands)]
+
+    def candidates(self, sig: tuple[int, ...]) -> set[int]:
+        found: set[int] = set()
+        for band in range(self.bands):
+            key = sig[band * self.rows:(band + 1) * self.rows]
+            found.update(self.buckets[band].get(key, ()))
+        return found
+
+    def add(self, idx: int, sig: tuple[int, ...]) -> None:
+        for band in range(self.bands):
+            key = sig[band * self.rows:(band + 1) * self.rows]
+            self.buckets[band].setdefault(key, []).append(idx)
+
+
+def dedupe_sources(sources: list[tuple[str, str]], threshold: float = NEAR_DUPLICATE_JACCARD) -> dict[str, Any]:
+    """
+    Remove repeated paragraphs across sources, keeping the first occurrence.
+
+    Args:
+        sources: (label, text) pairs in priority order (e.g. thought dump first, then files).
+        threshold: Estimated Jaccard similarity at or above which paragraphs are near-duplicates
+            (if their numbers and person mentions also match, see identifiers()).
+
+    Returns:
+        {"texts": [deduplicated text per source, same order],
+         "removed": [{"source", "paragraph", "duplicate_of": {"source", "paragraph"}, "similarity"}],
+         "tokens_removed": int}
+        Paragraph indexes are 0-based within each source. Sources with nothing removed
+        are returned unchanged.
+    """
+    exact: dict[str, tuple[int, int]] = {}
+    sigs: list[tuple[int, ...]] = []
+    idents: list[tuple[tuple[str, ...], tuple[str, ...]]] = []
+    origins: list[tuple[int, int]] = []
+    lsh = _LSH()
+    removed: list[dict[str, Any]] = []
+    texts: list[str] = []
+    tokens_removed = 0
+
+    for s_idx, (_, text) in enumerate(sources):
+        paragraphs = split_paragraphs(text)
+        kept: list[str] = []
+        dropped_any = False
+        for p_idx, para in enumerate(paragraphs):
+            norm = normalize(para)
+            if len(norm) < MIN_PARAGRAPH_CHARS:
+                kept.append(para)
+                continue
+            match: Optional[tuple[int, int]] = exact.get(norm)
+            similarity = 1.0
+            sig = minhash(shingles(para))
+            if match is None:
+                best = 0.0
+                ident = identifiers(para)
+                for cand in lsh.candidates(sig):
+                    if idents[cand] != ident:
+                        continue
+                    sim = jaccard_estimate(sig, sigs[cand])
+                    if sim >= threshold and sim > best:
+                        best, match = sim, origins[cand]
+                similarity = best
+            if match is not None:
+                dropped_any = True
+                tokens_removed += estimate_tokens(para)
+                removed.append({
+                    "source": sources[s_idx][0],
+                    "paragraph": p_idx,
+                    "duplicate_of": {"source": sources[match[0]][0], "paragraph": match[1]},
+                    "similarity": round(similarity, 3),
+                })
+                continue
+            exact[norm] = (s_idx, p_idx)
+            lsh.add(len(sigs), sig)
+            sigs.append(sig)
+            idents.append(identifiers(para))
+            origins.append((s_idx, p_idx))
+            kept.append(para)
+        texts.append("\n\n".join(kept) if dropped_any else text)
+
+    if removed:
+        metrics.incr("dedupe_paragraphs_removed", len(removed))
+        metrics.incr("dedupe_tokens_removed", tokens_removed)
+    return {"texts": texts, "removed": removed, "tokens_removed": tokens_removed}
@@ -0,0 +1,264 @@
+"""
+Background Job Service.
+Runs document parsing and analysis off the Streamlit script thread.
+Local backend: thread pool workers + SQLite job table (status survives a browser refresh).
+"""
+
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+from core.session_store import data_dir
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+_KEEP_FINISHED_IN_MEMORY = 64
+_JOB_ROW_TTL_SECONDS = 24 * 60 * 60
+
+
+class JobCancelledError(Exception):
+    """Raised inside a job when cancellation was requested."""
+
+
+class JobContext:
+    """Passed to every job function: progress reporting and cooperative cancellation."""
+
+    def __init__(self, job_id: str, on_progress: Callable[[str, float, str], None]):
+        self.job_id = job_id
+        self.cancel_event = threading.Event()
+        self._on_progress = on_progress
+
+    def report(self, progress: float, message: str = "") -> None:
+        """Report progress in [0, 1] with a short user-facing message."""
+        self._on_progress(self.job_id, max(0.0, min(1.0, progress)), message)
+
+    def is_cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancel_event.is_set():
+            raise JobCancelledError(self.job_id)
+
+
+class JobBackend(ABC):
+    """Interface for job brokers (local thread pool today, a real queue later)."""
+
+    @abstractmethod
+    def submit(self, kind: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> str:
+        """Queue fn(ctx, *args, **kwargs) and return a job id."""
+
+    @abstractmethod
+    def poll(self, job_id: str) -> Optional[dict[str, Any]]:
+        """Return {"id", "kind", "status", "progress", "message", "error"} or None if unknown."""
+
+    @abstractmethod
+    def cancel(self, job_id: str) -> bool:
+        """Request cancellation. Returns False if the job already finished or is unknown."""
+
+    @abstractmethod
+    def result(self, job_id: str, timeout: Optional[float] = None) -> Any:
+        """
+        Wait for and return the job result.
+
+        Raises:
+            TimeoutError: If the job is not finished within timeout.
+            JobCancelledError: If the job was cancelled.
+            RuntimeError: If the job failed (message carries the original error).
+        """
+
+
+class LocalJobBackend(JobBackend):
+    """
+    In-process worker pool. Job state and JSON-serializable results are mirrored to
+    SQLite so a new script run (or a refreshed page) can reattach by job id.
+    """
+
+    def __init__(self, path: Union[str, Path, None] = None, max_workers: int = 4):
+        self.path = Path(path) if path else data_dir() / "jobs.sqlite3"
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thinkflow-job")
+        self._lock = threading.Lock()
+        self._futures: dict[str, Future] = {}
+        self._contexts: dict[str, JobContext] = {}
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL,"
+            " progress REAL NOT NULL DEFAULT 0, message TEXT NOT NULL DEFAULT '',"
+            " error TEXT, result TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        # Jobs left running by a previous process can never finish.
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, error = ? WHERE status IN (?, ?)",
+            (FAILED, "worker restarted", PENDING, RUNNING),
+        )
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        ctx = JobContext(job_id, self._set_progress)
+        with self._lock:
+            self._prune_locked(now)
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, created, updated) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, PENDING, now, now),
+            )
+            self._contexts[job_id] = ctx
+            # Context variables (e.g. the quota caller, core.quota) follow the job to its worker.
+            run_in_context = contextvars.copy_context().run
+            fut = self._executor.submit(run_in_context, self._run, ctx, fn, args, kwargs)
+            self._futures[job_id] = fut
+        # Outside the lock: the callback runs here at once if the job already finished.
+        fut.add_done_callback(lambda f: self._finish(job_id, f))
+        return job_id
+
+    def poll(self, job_id: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, progress, message, error FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "kind", "status", "progress", "message", "error")
+        return dict(zip(keys, row))
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            ctx = self._contexts.get(job_id)
+            fut = self._futures.get(job_id)
+        if ctx is None or fut is None or fut.done():
+            return False
+        ctx.cancel_event.set()
+        fut.cancel()
+        return True
+
+    def result(self, job_id: str, timeout: Optional[float] = None) -> Any:
+        with self._lock:
+            fut = self._futures.get(job_id)
+        if fut is not None:
+            try:
+                return fut.result(timeout=timeout)
+            except TimeoutError:
+                raise
+            except JobCancelledError:
+                raise
+            except Exception as e:
+                if fut.cancelled():
+                    raise JobCancelledError(job_id) from e
+                raise RuntimeError(str(e)) from e
+        # Job from an earlier script run / process: read what was persisted.
+        with self._lock:
+            row = self._conn.execute("SELECT status, error, result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown job: {job_id}")
+        status, error, payload = row
+        if status == CANCELLED:
+            raise JobCancelledError(job_id)
+        if status == FAILED:
+            raise RuntimeError(error or "job failed")
+        if status != DONE:
+            raise TimeoutError(f"Job {job_id} is {status}")
+        if payload is None:
+            raise RuntimeError("job result is no longer available")
+        return json.loads(payload)
+
+    def _prune_locked(self, now: float) -> None:
+        """Bound memory (finished futures) and disk (old job rows)."""
+        finished = [jid for jid, fut in self._futures.items() if fut.done()]
+        for jid in finished[:-_KEEP_FINISHED_IN_MEMORY]:
+            self._futures.pop(jid, None)
+            self._contexts.pop(jid, None)
+        self._conn.execute(
+            "DELETE FROM jobs WHERE updated < ? AND status IN (?, ?, ?)",
+            (now - _JOB_ROW_TTL_SECONDS, *FINISHED_STATES),
+        )
+
+    def _run(self, ctx: JobContext, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        if ctx.is_cancelled():
+            raise JobCancelledError(ctx.job_id)
+        self._set_status(ctx.job_id, RUNNING)
+        return fn(ctx, *args, **kwargs)
+
+    def _finish(self, job_id: str, fut: Future) -> None:
+        """
+        Done callback: the terminal status is written only after the future resolved, so
+        once poll() reports a finished job, result(job_id, timeout=0) never times out.
+        """
+        if fut.cancelled():
+            self._set_status(job_id, CANCELLED)
+            return
+        error = fut.exception()
+        if isinstance(error, JobCancelledError):
+            self._set_status(job_id, CANCELLED)
+        elif error is not None:
+            self._set_status(job_id, FAILED, error=str(error))
+        else:
+            try:
+                payload: Optional[str] = json.dumps(fut.result(), ensure_ascii=False)
+            except (TypeError, ValueError):
+                payload = None
+            self._set_status(job_id, DONE, result=payload)
+
+    def _set_progress(self, job_id: str, progress: float, message: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, message = ?, updated = ? WHERE id = ?",
+                (progress, message, time.time(), job_id),
+            )
+
+    def _set_status(self, job_id: str, status: str, error: Optional[str] = None, result: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, result = ?, updated = ?,"
+                " progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END WHERE id = ?",
+                (status, error, result, time.time(), status, job_id),
+            )
+
+
+_service: Optional[JobBackend] = None
+_service_lock = threading.Lock()
+
+
+def get_job_service() -> JobBackend:
+    """Process-wide job backend (THINKFLOW_JOB_WORKERS sets the local pool size)."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            workers = int(os.environ.get("THINKFLOW_JOB_WORKERS", "4"))
+            _service = LocalJobBackend(max_workers=workers)
+        return _service
+
+
+_preparse_service: Optional[JobBackend] = None
+
+
+def get_preparse_service() -> JobBackend:
+    """
+    Separate, smaller pool for speculative upload parsing (THINKFLOW_PREPARSE_WORKERS),
+    so pre-parses never hold the workers analyses run on.
+    """
+    global _preparse_service
+    with _service_lock:
+        if _preparse_service is None:
+            workers = int(os.environ.get("THINKFLOW_PREPARSE_WORKERS", "2"))
+            _preparse_service = LocalJobBackend(data_dir() / "preparse-jobs.sqlite3", max_workers=max(1, workers))
+        return _preparse_service
+
+
+def set_job_service(backend: JobBackend) -> None:
+    """Install a different backend (e.g. a real queue client) for the whole process."""
+    global _service
+    with _service_lock:
+        _service = backend
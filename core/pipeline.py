@@ -0,0 +1,256 @@
+"""
+Analysis Pipeline.
+Document parsing + ThinkFlow analysis as job functions (see core.jobs).
+Runs on worker threads: no Streamlit calls here.
+"""
+
+import hashlib
+import os
+import re
+from functools import lru_cache
+from typing import Any, Optional
+
+from core.deadline import Deadline, DeadlineExceeded
+from core.jobs import JobCancelledError, JobContext
+from core.retrieval import DOCUMENT_MARKER, REFINE_PLAN_MARKER, REFINE_REQUEST_MARKER
+
+# Bump when parsing/merging logic changes in a way that invalidates stored results.
+# Prompt template and chain profile edits are picked up automatically by pipeline_version().
+PIPELINE_REVISION = "6"
+
+# Overall time budget for one analysis (parsing + all chains), in seconds.
+DEFAULT_DEADLINE_SECONDS = 240
+
+STEP_MESSAGES = {
+    "gap": "입력 정보를 검토하고 있어요...",
+    "executive": "핵심 요약을 작성하고 있어요...",
+    "structure": "논리 트리를 그리고 있어요...",
+    "action": "액션 플랜을 추출하고 있어요...",
+    "strategic": "전략적 코멘트를 정리하고 있어요...",
+}
+_STEP_ORDER = list(STEP_MESSAGES)
+
+MAX_REFINEMENT_REQUESTS = 5
+
+
+@lru_cache(maxsize=1)
+def pipeline_version() -> str:
+    """PIPELINE_REVISION plus a digest of every prompt template and the chain profiles."""
+    from core import profiles
+    from utils import prompts
+
+    h = hashlib.sha256(PIPELINE_REVISION.encode("utf-8"))
+    h.update(profiles.fingerprint().encode("ascii"))
+    for name in sorted(n for n in dir(prompts) if n.endswith("_PROMPT")):
+        h.update(getattr(prompts, name).template.encode("utf-8"))
+    return f"{PIPELINE_REVISION}-{h.hexdigest()[:12]}"
+
+
+def plan_summary(result: dict[str, Any]) -> str:
+    """The previous plan as refinement context (empty while the agent still needs clarification)."""
+    if result.get("need_clarification"):
+        return ""
+    exec_s = result.get("executive_summary") or {}
+    plan = f"{REFINE_PLAN_MARKER}\n주제: {exec_s.get('subject', '')}\n개요: {exec_s.get('overview', '')}\n"
+    for i, a in enumerate(result.get("actions", [])[:10], 1):
+        plan += f"{i}. {a.get('summary', '')} (마감: {a.get('due_date', '-')})\n"
+    return plan
+
+
+def compact_refinement_context(context: str, prev_plan: str, user_input: str) -> str:
+    """
+    Build the next refinement context without unbounded growth: the original input,
+    only the latest plan (each plan supersedes the previous one), and the most recent
+    MAX_REFINEMENT_REQUESTS user requests.
+    """
+    parts = re.split(r"\n\n(?=\[이전 계획\]|\[사용자 수정 요청\])", (context or "").strip())
+    base = parts[0] if parts and not parts[0].startswith((REFINE_PLAN_MARKER, REFINE_REQUEST_MARKER)) else ""
+    requests = [
+        p[len(REFINE_REQUEST_MARKER):].strip()
+        for p in (parts if not base else parts[1:])
+        if p.startswith(REFINE_REQUEST_MARKER)
+    ]
+    requests.append(user_input.strip())
+    combined = base.strip()
+    if prev_plan:
+        combined += "\n\n" + prev_plan.strip()
+    for req in requests[-MAX_REFINEMENT_REQUESTS:]:
+        combined += f"\n\n{REFINE_REQUEST_MARKER}\n{req}"
+    return combined.strip()
+
+
+def job_deadline(ctx: JobContext) -> Deadline:
+    """Deadline for one job: THINKFLOW_ANALYSIS_DEADLINE seconds from now, cancelled with the job."""
+    seconds = float(os.environ.get("THINKFLOW_ANALYSIS_DEADLINE", DEFAULT_DEADLINE_SECONDS))
+    return Deadline(seconds, cancel_event=ctx.cancel_event)
+
+
+def parse_documents_job(
+    ctx: JobContext, files: list[tuple[str, Any]], deadline: Optional[Deadline] = None
+) -> list[dict[str, Any]]:
+    """Parse uploaded files (name, bytes or file-like); returns core.processor.parse_documents output."""
+    from core.processor import parse_documents
+
+    ctx.raise_if_cancelled()
+    ctx.report(0.05, "참고 자료를 읽고 있어요...")
+    try:
+        return parse_documents(files, deadline or job_deadline(ctx))
+    except InterruptedError as e:
+        raise JobCancelledError(ctx.job_id) from e
+
+
+def preparse_job(ctx: JobContext, files: list[tuple[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Parse a session's uploads as soon as they arrive so the analysis job finds them in
+    the parse cache (or waits on a parse still running). All files are parsed in one
+    call, so duplicate images across files are OCR'd once, as in the analysis itself.
+    Returns [{"name", "hash", "pages"}] per file.
+    """
+    from core.processor import parse_documents
+
+    ctx.raise_if_cancelled()
+    try:
+        docs = parse_documents(files, job_deadline(ctx))
+    except InterruptedError as e:
+        raise JobCancelledError(ctx.job_id) from e
+    return [{"name": d["name"], "hash": d["hash"], "pages": len(d["pages"])} for d in docs]
+
+
+def document_hashes(files: list[tuple[str, Any]]) -> list[str]:
+    """sha256 of each upload, read in place (same buffers the parser uploads from)."""
+    from core.processor import document_hash, open_document
+
+    hashes: list[str] = []
+    for f in files:
+        with open_document(f) as (_, view):
+            hashes.append(document_hash(view))
+    return hashes
+
+
+def analyze_job(
+    ctx: JobContext, context: str, start: float = 0.0, deadline: Optional[Deadline] = None
+) -> dict[str, Any]:
+    """
+    Run ThinkFlowAgent.analyze, reporting each chain as a progress step. With the
+    similar-input cache on (core.similar_cache), a nearly identical earlier context
+    of the same session is answered from it; such results carry "similar_to_previous":
+    similarity. Refinements never use it: a small edit request is the whole point.
+    """
+    from core.agent import ThinkFlowAgent
+    from core.quota import current_session
+    from core.similar_cache import get_similar_cache, similar_cache_enabled
+
+    ctx.raise_if_cancelled()
+    use_similar = similar_cache_enabled() and REFINE_REQUEST_MARKER not in context
+    if use_similar:
+        found = get_similar_cache().lookup(context, pipeline_version(), scope=current_session())
+        if found is not None:
+            result, similarity = found
+            result["similar_to_previous"] = round(similarity, 3)
+            return result
+    span = 1.0 - start
+
+    def on_step(step: str) -> None:
+        ctx.raise_if_cancelled()
+        idx = _STEP_ORDER.index(step) if step in _STEP_ORDER else 0
+        ctx.report(start + span * idx / len(_STEP_ORDER), STEP_MESSAGES.get(step, ""))
+
+    agent = ThinkFlowAgent()
+    try:
+        result = agent.analyze(context, on_step=on_step, deadline=deadline or job_deadline(ctx))
+    except InterruptedError as e:
+        raise JobCancelledError(ctx.job_id) from e
+    if use_similar and not result.get("partial") and not result.get("need_clarification"):
+        get_similar_cache().put(context, pipeline_version(), result, scope=current_session())
+    return result
+
+
+def analysis_job(ctx: JobContext, thought_text: str, files: list[tuple[str, Any]]) -> dict[str, Any]:
+    """
+    Full pipeline: parse files, combine with the thought dump, analyze.
+    Identical requests (same text, same file bytes, same pipeline version) are served
+    from the shared result store, and concurrent duplicates wait on one computation.
+    The whole run shares one deadline (THINKFLOW_ANALYSIS_DEADLINE); when it passes,
+    the finished sections are returned with result["partial"] set.
+
+    Returns:
+        {"result": analyze() output or None, "context": combined context,
+         "warnings": [str], "documents": [{"name", "pages", "preprocess"}],
+         "dedupe": {"removed", "tokens_removed"},
+         "cache": "hit" | "coalesced" | "computed"}
+    """
+    from core.result_store import context_key, get_result_store
+
+    key = context_key(thought_text, document_hashes(files), pipeline_version())
+
+    deadline = job_deadline(ctx)
+
+    def compute() -> dict[str, Any]:
+        return _run_analysis(ctx, thought_text, files, deadline)
+
+    def should_store(out: dict[str, Any]) -> bool:
+        # Degraded runs (unreadable files, chains cut off by the deadline or failed) are not
+        # worth sharing, and approximate answers must not become exact-key entries.
+        result = out.get("result")
+        if result is None or result.get("partial") or result.get("failed") or "similar_to_previous" in result:
+            return False
+        return not out.get("warnings")
+
+    try:
+        output, status = get_result_store().get_or_compute(
+            key,
+            compute,
+            should_store=should_store,
+            should_abort=ctx.is_cancelled,
+            retry_errors=(JobCancelledError,),
+        )
+    except InterruptedError:
+        ctx.raise_if_cancelled()
+        raise
+    return dict(output, cache=status)
+
+
+def _run_analysis(
+    ctx: JobContext, thought_text: str, files: list[tuple[str, Any]], deadline: Deadline
+) -> dict[str, Any]:
+    from core.dedupe import dedupe_sources
+
+    warnings: list[str] = []
+    sources: list[tuple[str, str]] = []
+    # Per-page read method ("local" text layer, "ocr", "duplicate") and bytes saved per document.
+    documents: list[dict[str, Any]] = []
+    if (thought_text or "").strip():
+        sources.append(("메모", thought_text.strip()))
+    if files:
+        try:
+            parsed = parse_documents_job(ctx, files, deadline)
+            documents = [{"name": d["name"], "pages": d["pages"], "preprocess": d["preprocess"]} for d in parsed]
+            file_sources = [(d["name"], d["text"].strip()) for d in parsed if d["text"].strip()]
+            if file_sources:
+                sources.extend(file_sources)
+            else:
+                warnings.append("참고 자료 처리 중 오류: No content extracted from any of the given files")
+        except ValueError as e:
+            warnings.append(f"참고 자료 처리 중 오류: {e}")
+        except DeadlineExceeded:
+            warnings.append("참고 자료를 읽는 데 시간이 너무 오래 걸려 분석에서 제외했어요.")
+    # Same notes pasted in the text area and present in the PDF, or several drafts of one file.
+    deduped = dedupe_sources(sources)
+    # Documents get a header so retrieval can tell them from the thought dump (always sent whole).
+    context_parts = [
+        text if label == "메모" and i == 0 else f"{DOCUMENT_MARKER} {label}\n{text}"
+        for i, ((label, _), text) in enumerate(zip(sources, deduped["texts"]))
+        if text.strip()
+    ]
+    dedupe_report = {"removed": deduped["removed"], "tokens_removed": deduped["tokens_removed"]}
+    combined_context = "\n\n".join(context_parts) if context_parts else ""
+    if not combined_context:
+        return {"result": None, "context": "", "warnings": warnings, "documents": documents, "dedupe": dedupe_report}
+    result = analyze_job(ctx, combined_context, start=0.3 if files else 0.0, deadline=deadline)
+    return {
+        "result": result,
+        "context": combined_context,
+        "warnings": warnings,
+        "documents": documents,
+        "dedupe": dedupe_report,
+    }
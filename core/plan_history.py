@@ -0,0 +1,235 @@
+"""
+Plan History.
+Every plan a session produced (first analysis, each refinement, accepted suggestions)
+as a version: an immutable snapshot plus the delta from the version it was made from.
+Snapshots share every unchanged section and action with their parent, so a version
+costs about one pointer per action plus whatever actually changed. Switching to a
+version is a lookup (no replay, no LLM call); old versions are dropped past a count
+and a byte cap. The input each version was made from stays in the session store;
+versions keep only its key.
+"""
+
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+DEFAULT_MAX_VERSIONS = 20
+DEFAULT_MAX_BYTES = 1024 * 1024
+
+# Plan sections replaced as a whole; actions are diffed item by item.
+SECTIONS = ("executive_summary", "mermaid", "strategic_comments")
+# Per-run flags that describe how a result was produced, not the plan itself.
+_TRANSIENT_KEYS = ("_ics_key", "partial", "skipped", "similar_to_previous", "need_clarification")
+
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _summary(action: dict[str, Any]) -> str:
+    return str(action.get("summary") or "").strip()
+
+
+def diff_plans(old: dict[str, Any], new: dict[str, Any]) -> dict[str, Any]:
+    """
+    Delta between two snapshots: {"sections": [replaced section names],
+    "added": [summary], "removed": [summary], "changed": [{"summary", "fields"}]}.
+    Actions are matched by summary, in order among actions sharing one; shared
+    (identical) objects are skipped without comparing.
+    """
+    sections = [s for s in SECTIONS if old.get(s) is not new.get(s) and old.get(s) != new.get(s)]
+    old_actions: tuple = old.get("actions", ())
+    new_actions: tuple = new.get("actions", ())
+    shared = {id(a) for a in old_actions} & {id(a) for a in new_actions}
+    old_by_summary: dict[str, list[dict[str, Any]]] = {}
+    for a in old_actions:
+        if id(a) not in shared:
+            old_by_summary.setdefault(_summary(a), []).append(a)
+    new_by_summary: dict[str, list[dict[str, Any]]] = {}
+    for a in new_actions:
+        if id(a) not in shared:
+            new_by_summary.setdefault(_summary(a), []).append(a)
+    added, changed = [], []
+    for name, news in new_by_summary.items():
+        olds = old_by_summary.get(name, [])
+        for a, b in zip(news, olds):
+            if a != b:
+                fields = sorted(k for k in set(a) | set(b) if a.get(k) != b.get(k))
+                changed.append({"summary": name, "fields": fields})
+        added.extend([name] * (len(news) - len(olds)))
+    removed = []
+    for name, olds in old_by_summary.items():
+        removed.extend([name] * (len(olds) - len(new_by_summary.get(name, []))))
+    return {"sections": sections, "added": added, "removed": removed, "changed": changed}
+
+
+def describe_delta(delta: dict[str, Any]) -> str:
+    """One-line Korean summary of a delta for the UI."""
+    labels = {"executive_summary": "요약", "mermaid": "논리 트리", "strategic_comments": "전략 코멘트"}
+    parts = []
+    if delta["added"]:
+        parts.append(f"액션 {len(delta['added'])}개 추가")
+    if delta["removed"]:
+        parts.append(f"{len(delta['removed'])}개 삭제")
+    if delta["changed"]:
+        parts.append(f"{len(delta['changed'])}개 수정")
+    if delta["sections"]:
+        parts.append(", ".join(labels.get(s, s) for s in delta["sections"]) + " 변경")
+    return " · ".join(parts) or "변경 없음"
+
+
+class PlanVersion:
+    __slots__ = ("id", "parent", "snapshot", "delta", "context_key", "note", "created")
+
+    def __init__(
+        self,
+        version_id: int,
+        parent: Optional[int],
+        snapshot: dict[str, Any],
+        delta: dict[str, Any],
+        context_key: Optional[str],
+        note: str,
+    ):
+        self.id = version_id
+        self.parent = parent
+        self.snapshot = snapshot
+        self.delta = delta
+        # Session-store key of the input the plan was made from (None: no input kept).
+        self.context_key = context_key
+        self.note = note
+        self.created = time.time()
+
+
+class PlanHistory:
+    """
+    Per-session version list (kept in session_state). Snapshots are never mutated:
+    commit() builds a new one that reuses the parent's objects wherever they are
+    equal, and checkout() hands out copies. The oldest versions are dropped past
+    max_versions or once approx_bytes() exceeds max_bytes (the current one is kept).
+    """
+
+    def __init__(self, max_versions: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_versions = max_versions or int(os.environ.get("THINKFLOW_PLAN_HISTORY", DEFAULT_MAX_VERSIONS))
+        self.max_bytes = max_bytes or int(os.environ.get("THINKFLOW_PLAN_HISTORY_BYTES", DEFAULT_MAX_BYTES))
+        self._versions: "OrderedDict[int, PlanVersion]" = OrderedDict()
+        self._next_id = 1
+        self.current: Optional[int] = None
+        self._released: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def versions(self) -> list[PlanVersion]:
+        """Oldest first."""
+        return list(self._versions.values())
+
+    def get(self, version_id: int) -> Optional[PlanVersion]:
+        return self._versions.get(version_id)
+
+    def commit(self, result: dict[str, Any], context_key: Optional[str] = None, note: str = "") -> int:
+        """
+        Record result as a new version made from the current one and make it current.
+        A result identical to the current plan (and context) only returns its id.
+        """
+        parent = self._versions.get(self.current) if self.current is not None else None
+        base = parent.snapshot if parent else {}
+        snapshot = self._share(result, base)
+        if parent is not None and context_key == parent.context_key and all(snapshot[k] is base[k] for k in snapshot):
+            return parent.id
+        version = PlanVersion(
+            self._next_id,
+            parent.id if parent else None,
+            snapshot,
+            diff_plans(base, snapshot),
+            context_key,
+            note,
+        )
+        self._next_id += 1
+        self._versions[version.id] = version
+        self.current = version.id
+        while len(self._versions) > 1 and (
+            len(self._versions) > self.max_versions or self.approx_bytes() > self.max_bytes
+        ):
+            _, dropped = self._versions.popitem(last=False)
+            if dropped.context_key and dropped.context_key not in self.context_keys():
+                self._released.append(dropped.context_key)
+        return version.id
+
+    def context_keys(self) -> set[str]:
+        """Session-store keys of the inputs kept versions refer to."""
+        return {v.context_key for v in self._versions.values() if v.context_key}
+
+    def released_contexts(self) -> list[str]:
+        """Context keys no kept version refers to any more (once each), for the caller to delete."""
+        released, self._released = self._released, []
+        return released
+
+    @staticmethod
+    def _share(result: dict[str, Any], base: dict[str, Any]) -> dict[str, Any]:
+        """Snapshot of result that points at base's objects for everything unchanged."""
+        def reuse(old: Any, value: Any) -> Any:
+            return old if old is not None and old == value else _copy(value)
+
+        snapshot = {name: reuse(base.get(name), result.get(name)) for name in SECTIONS}
+        known = {_canonical(a): a for a in base.get("actions", ())}
+        actions = tuple(known.get(_canonical(a)) or _copy(a) for a in result.get("actions") or [])
+        old_actions = base.get("actions", ())
+        same = len(actions) == len(old_actions) and all(x is y for x, y in zip(actions, old_actions))
+        snapshot["actions"] = old_actions if same else actions
+        extra = {k: v for k, v in result.items() if k not in (*SECTIONS, "actions", *_TRANSIENT_KEYS)}
+        snapshot["extra"] = reuse(base.get("extra"), extra)
+        return snapshot
+
+    def checkout(self, version_id: int) -> dict[str, Any]:
+        """
+        Make version_id current and return its plan as a fresh result dict (safe to
+        mutate; the snapshot is untouched).
+
+        Raises:
+            KeyError: If the version was dropped or never existed.
+        """
+        version = self._versions[version_id]
+        self.current = version_id
+        snap = version.snapshot
+        result = _copy(snap["extra"])
+        for name in SECTIONS:
+            result[name] = _copy(snap[name])
+        result["actions"] = [_copy(a) for a in snap["actions"]]
+        return result
+
+    def undo_target(self) -> Optional[int]:
+        """The version the current one was made from, if it is still kept."""
+        version = self._versions.get(self.current) if self.current is not None else None
+        if version is None or version.parent not in self._versions:
+            return None
+        return version.parent
+
+    def diff(self, from_id: int, to_id: int) -> dict[str, Any]:
+        """Delta between any two kept versions (the stored delta when they are parent and child)."""
+        to_version = self._versions[to_id]
+        if to_version.parent == from_id:
+            return to_version.delta
+        return diff_plans(self._versions[from_id].snapshot, to_version.snapshot)
+
+    def approx_bytes(self) -> int:
+        """Rough in-memory size of the kept snapshots, counting each shared object once (contexts live in the store)."""
+        seen: set[int] = set()
+        total = 0
+        for version in self._versions.values():
+            snap = version.snapshot
+            for obj in (*(snap[s] for s in SECTIONS), *snap["actions"], snap["extra"]):
+                if id(obj) not in seen:
+                    seen.add(id(obj))
+                    total += len(_canonical(obj).encode("utf-8"))
+        return total
+
+
+def _copy(value: Any) -> Any:
+    """Deep copy through JSON-like containers, so edits to a live result never reach a snapshot."""
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_copy(v) for v in value]
+    return value
@@ -0,0 +1,196 @@
+"""
+Upload Preprocessing.
+Shrink what goes to Document Parse: downscale/re-encode large images to the resolution
+OCR needs, and drop duplicate or near-duplicate PDF pages (perceptual hashes).
+Keeps page provenance so parsed text maps back to original pages.
+"""
+
+import io
+import os
+import re
+from typing import Any, Callable, Optional
+
+from utils import metrics
+
+# Longest edge after downscaling; ~300 DPI for A4/Letter, plenty for whiteboard photos.
+MAX_IMAGE_EDGE = int(os.environ.get("THINKFLOW_MAX_IMAGE_EDGE", 2480))
+JPEG_QUALITY = 85
+# Near-duplicate test: dHash (16x16 = 256 bits) within NEAR_DUPLICATE_BITS, confirmed on a
+# 256x256 grayscale thumbnail (at most MAX_DIFF_FRACTION of pixels visibly different).
+# dHash alone cannot tell apart scanned text pages that share a template.
+DHASH_SIZE = 16
+NEAR_DUPLICATE_BITS = 12
+_THUMB_SIZE = 256
+_PIXEL_DIFF_LEVEL = 48
+MAX_DIFF_FRACTION = 0.0005
+
+
+def _load_pil():
+    """Pillow is optional (it ships with Streamlit); without it images pass through unchanged."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None, None
+    return Image, ImageOps
+
+
+def dhash(image: Any, size: int = DHASH_SIZE) -> int:
+    """Difference hash (size*size bits) of a PIL image; robust to re-encoding and small scaling."""
+    Image, _ = _load_pil()
+    gray = image.convert("L").resize((size + 1, size), Image.BILINEAR)
+    pixels = list(gray.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return bits
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def visual_fingerprint(image: Any) -> tuple[int, bytes]:
+    """(dHash, grayscale thumbnail bytes) for near-duplicate checks."""
+    Image, _ = _load_pil()
+    thumb = image.convert("L").resize((_THUMB_SIZE, _THUMB_SIZE), Image.BILINEAR)
+    return dhash(image), thumb.tobytes()
+
+
+def _thumbs_match(a: bytes, b: bytes) -> bool:
+    Image, _ = _load_pil()
+    from PIL import ImageChops
+
+    size = (_THUMB_SIZE, _THUMB_SIZE)
+    diff = ImageChops.difference(Image.frombytes("L", size, a), Image.frombytes("L", size, b))
+    changed = sum(diff.histogram()[_PIXEL_DIFF_LEVEL + 1:])
+    return changed <= MAX_DIFF_FRACTION * _THUMB_SIZE * _THUMB_SIZE
+
+
+def find_duplicate(fingerprint: Any, seen: list[tuple[Any, Any]]) -> Optional[Any]:
+    """
+    Return the label of an earlier item matching fingerprint, else None.
+    Text fingerprints must match exactly; visual ones (see visual_fingerprint) must be
+    close in dHash and in thumbnail pixels.
+    """
+    for label, other in seen:
+        if isinstance(fingerprint, tuple) and isinstance(other, tuple):
+            if hamming(fingerprint[0], other[0]) <= NEAR_DUPLICATE_BITS and _thumbs_match(fingerprint[1], other[1]):
+                return label
+        elif fingerprint == other:
+            return label
+    return None
+
+
+def prepare_image(name: str, view: memoryview) -> dict[str, Any]:
+    """
+    Downscale an image so its longest edge is at most MAX_IMAGE_EDGE and re-encode it
+    (JPEG for photos, optimized PNG otherwise). The original is kept if that is smaller.
+
+    Returns:
+        {"name", "data" (bytes or the original view), "hash" (visual fingerprint or None),
+         "bytes_in", "bytes_out"}
+    """
+    Image, ImageOps = _load_pil()
+    out = {"name": name, "data": view, "hash": None, "bytes_in": len(view), "bytes_out": len(view)}
+    if Image is None:
+        return out
+    try:
+        with Image.open(io.BytesIO(view)) as img:
+            photo = (img.format or "").upper() in ("JPEG", "MPO") or name.lower().endswith((".jpg", ".jpeg"))
+            img = ImageOps.exif_transpose(img)
+            out["hash"] = visual_fingerprint(img)
+            if max(img.size) > MAX_IMAGE_EDGE:
+                img.thumbnail((MAX_IMAGE_EDGE, MAX_IMAGE_EDGE), Image.LANCZOS)
+            buf = io.BytesIO()
+            if photo or img.mode not in ("1", "L", "P", "RGB", "RGBA", "LA"):
+                img.convert("RGB").save(buf, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+                new_name = re.sub(r"\.[^.]*$", "", name) + ".jpg"
+            else:
+                img.save(buf, format="PNG", optimize=True)
+                new_name = re.sub(r"\.[^.]*$", "", name) + ".png"
+    except Exception:
+        return out
+    data = buf.getvalue()
+    if len(data) < len(view):
+        out.update(name=new_name, data=data, bytes_out=len(data))
+    return out
+
+
+def _page_fingerprint(page: Any, classify: Callable[[str], str]) -> Optional[Any]:
+    """
+    Normalized text for pages read from their text layer (classify(text) == "local"),
+    visual fingerprint of the largest embedded image for pages going to OCR: scans often
+    share a boilerplate text layer ("Scanned with ...") that says nothing about the page.
+    """
+    try:
+        text = page.extract_text() or ""
+    except Exception:
+        text = ""
+    if classify(text) == "local":
+        return " ".join(text.split())
+    Image, _ = _load_pil()
+    if Image is None:
+        return None
+    try:
+        images = list(page.images)
+    except Exception:
+        return None
+    best = None
+    for img in images:
+        try:
+            pil = img.image
+        except Exception:
+            continue
+        if pil is not None and (best is None or pil.size[0] * pil.size[1] > best.size[0] * best.size[1]):
+            best = pil
+    return visual_fingerprint(best) if best is not None else None
+
+
+def prepare_pdf(name: str, view: memoryview, reader: Any, classify: Callable[[str], str]) -> dict[str, Any]:
+    """
+    Drop duplicate/near-duplicate pages from a PDF. classify maps a page's text layer
+    to "local" or "ocr" (core.processor.classify_page_text).
+
+    Returns:
+        {"name", "data" (new bytes, or the original view if nothing was dropped),
+         "page_map" (kept page index -> original 1-based page), "dropped"
+         ({original page: page it duplicates}), "bytes_in", "bytes_out"}
+    """
+    from pypdf import PdfWriter
+
+    seen: list[tuple[int, Any]] = []
+    page_map: list[int] = []
+    dropped: dict[int, int] = {}
+    for idx, page in enumerate(reader.pages):
+        fp = _page_fingerprint(page, classify)
+        dup_of = find_duplicate(fp, seen) if fp is not None else None
+        if dup_of is not None:
+            dropped[idx + 1] = dup_of
+            continue
+        if fp is not None:
+            seen.append((idx + 1, fp))
+        page_map.append(idx + 1)
+
+    out = {"name": name, "data": view, "page_map": page_map, "dropped": dropped, "bytes_in": len(view), "bytes_out": len(view)}
+    if not dropped:
+        return out
+    writer = PdfWriter()
+    for original in page_map:
+        writer.add_page(reader.pages[original - 1])
+    buf = io.BytesIO()
+    writer.write(buf)
+    data = buf.getvalue()
+    out.update(data=data, bytes_out=len(data))
+    return out
+
+
+def record(prepared: dict[str, Any]) -> None:
+    """Export bytes saved and dropped pages as metrics."""
+    saved = prepared["bytes_in"] - prepared["bytes_out"]
+    if saved > 0:
+        metrics.incr("preprocess_bytes_saved", saved)
+    if prepared.get("dropped"):
+        metrics.incr("preprocess_pages_dropped", len(prepared["dropped"]))
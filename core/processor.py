@@ -1,55 +1,531 @@
 """
 Upstage Document Parse Logic.
 Parse PDFs, memos into structured content for downstream agent.
+Inputs are read in place (bytes, memoryview, file-like, or memory-mapped paths);
+hashing, caching and upload all work from the same buffer. PDF pages with a usable
+text layer are extracted locally; only scanned/image pages go to remote OCR.
 """
 
+import hashlib
+import html
+import io
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Union
+from typing import BinaryIO, Iterator, Optional, Union
 
-from langchain_upstage import UpstageDocumentParseLoader
+import requests
 
+from core import preprocess
+from core.deadline import Deadline, DeadlineExceeded
+from core.quota import current_priority, current_session, get_scheduler
+from utils import metrics
 
-def process_documents(files: list[Union[str, Path]]) -> str:
+Buffer = Union[bytes, bytearray, memoryview]
+DocumentSource = Union[str, Path, Buffer, BinaryIO, tuple[str, Union[Buffer, BinaryIO]]]
+
+# File-like inputs without an in-memory buffer spill to a temp file above this size.
+SPILL_THRESHOLD_BYTES = int(os.environ.get("THINKFLOW_SPILL_BYTES", 8 * 1024 * 1024))
+_PARSE_CACHE_MAX_ENTRIES = 64
+# A PDF page is read from its embedded text layer when it has at least this many
+# non-space characters, mostly letters/digits; otherwise it is sent to OCR.
+LOCAL_TEXT_MIN_CHARS = int(os.environ.get("THINKFLOW_LOCAL_TEXT_MIN_CHARS", 40))
+_LOCAL_TEXT_MIN_RATIO = 0.6
+
+_WAIT_SLICE_SECONDS = 0.25
+
+DOCUMENT_PARSE_URL = "https://api.upstage.ai/v1/document-digitization"
+DOCUMENT_PARSE_MODEL = "document-parse"
+# Pages per Document Parse request when only some pages of a PDF are OCR'd.
+PAGES_PER_REQUEST = 10
+# Per-request timeout, shortened to what is left of the run's deadline.
+PARSE_TIMEOUT_SECONDS = float(os.environ.get("THINKFLOW_PARSE_TIMEOUT", 120))
+
+_parse_cache: "OrderedDict[str, dict]" = OrderedDict()
+# Document hash -> (event set when the thread parsing it finishes, that thread's quota
+# session); one parse per document.
+_parse_inflight: dict[str, tuple[threading.Event, str]] = {}
+_parse_cache_lock = threading.Lock()
+
+
+def _parser_endpoint() -> dict[str, str]:
     """
-    Load multiple documents via Upstage Document Parse and return concatenated text.
+    Document Parse URL (UPSTAGE_DOCUMENT_PARSE_URL overrides it, e.g. a local stand-in)
+    and API key.
+
+    Raises:
+        ValueError: If UPSTAGE_API_KEY is not set.
+    """
+    api_key = os.environ.get("UPSTAGE_API_KEY", "").strip()
+    if not api_key:
+        raise ValueError("UPSTAGE_API_KEY is not set")
+    url = os.environ.get("UPSTAGE_DOCUMENT_PARSE_URL", "").strip() or DOCUMENT_PARSE_URL
+    return {"url": url, "api_key": api_key}
+
+
+class _MemoryReader(io.RawIOBase):
+    """Read-only, seekable file object over a memoryview (no up-front copy)."""
+
+    def __init__(self, view: memoryview, name: str = "document"):
+        self._view = view
+        self._pos = 0
+        self.name = name
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = min(len(b), len(self._view) - self._pos)
+        if n <= 0:
+            return 0
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+def _sniff_name(view: memoryview) -> str:
+    head = bytes(view[:8])
+    if head.startswith(b"%PDF"):
+        return "document.pdf"
+    if head.startswith(b"\x89PNG"):
+        return "image.png"
+    if head.startswith(b"\xff\xd8"):
+        return "image.jpg"
+    return "document"
+
+
+def _map_file(fh: BinaryIO) -> memoryview:
+    size = os.fstat(fh.fileno()).st_size
+    if size == 0:
+        return memoryview(b"")
+    return memoryview(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+@contextmanager
+def open_document(source: DocumentSource) -> Iterator[tuple[str, memoryview]]:
+    """
+    Yield (file name, read-only memoryview) for any supported source without copying:
+    paths are memory-mapped, buffers are viewed directly, BytesIO-like objects expose
+    their internal buffer, other streams are read (or spilled to disk and mapped when
+    larger than SPILL_THRESHOLD_BYTES).
+
+    Raises:
+        FileNotFoundError: If a path does not exist.
+    """
+    name = ""
+    if isinstance(source, tuple):
+        name, source = source
+
+    if isinstance(source, (str, Path)):
+        path = Path(source)
+        if not path.exists():
+            raise FileNotFoundError(f"File not found: {path}")
+        with open(path, "rb") as fh:
+            view = _map_file(fh)
+            try:
+                yield name or path.name, view
+            finally:
+                view.release()
+        return
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        yield name or _sniff_name(view), view
+        return
+
+    name = name or Path(getattr(source, "name", "") or "").name
+    if hasattr(source, "getbuffer"):
+        view = source.getbuffer()
+        try:
+            yield name or _sniff_name(view), view
+        finally:
+            view.release()
+        return
+
+    source.seek(0)
+    head = source.read(SPILL_THRESHOLD_BYTES + 1)
+    if len(head) <= SPILL_THRESHOLD_BYTES:
+        view = memoryview(head)
+        yield name or _sniff_name(view), view
+        return
+    with tempfile.TemporaryFile() as spill:
+        spill.write(head)
+        del head
+        shutil.copyfileobj(source, spill)
+        spill.flush()
+        view = _map_file(spill)
+        try:
+            yield name or _sniff_name(view), view
+        finally:
+            view.release()
+
+
+def document_hash(view: memoryview) -> str:
+    """sha256 of the document bytes (hashlib reads the buffer in place)."""
+    return hashlib.sha256(view).hexdigest()
+
+
+def _is_pdf(name: str, view: memoryview) -> bool:
+    return bytes(view[:5]) == b"%PDF-" or name.lower().endswith(".pdf")
+
+
+def _meaningful_ratio(text: str) -> float:
+    chars = [c for c in text if not c.isspace()]
+    if not chars:
+        return 0.0
+    return sum(1 for c in chars if c.isalnum()) / len(chars)
+
+
+def classify_page_text(text: str) -> str:
+    """
+    Decide how one PDF page should be read: "local" if its embedded text layer is
+    usable (enough characters, mostly letters/digits rather than broken glyph
+    mappings), otherwise "ocr".
+    """
+    stripped = re.sub(r"\(cid:\d+\)", "", text or "")
+    if len("".join(stripped.split())) < LOCAL_TEXT_MIN_CHARS:
+        return "ocr"
+    if "\ufffd" in stripped or _meaningful_ratio(stripped) < _LOCAL_TEXT_MIN_RATIO:
+        return "ocr"
+    return "local"
+
+
+def _text_to_html(text: str) -> str:
+    """Wrap locally extracted text like Document Parse HTML output (one <p> per paragraph)."""
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    return "".join(f"<p>{html.escape(p)}</p>" for p in paragraphs)
+
+
+def _post_document(endpoint: dict[str, str], name: str, document: BinaryIO, timeout: Optional[float]) -> list[dict]:
+    """POST one file to Document Parse (forced OCR, HTML output); returns its elements."""
+    response = requests.post(
+        endpoint["url"],
+        headers={"Authorization": f"Bearer {endpoint['api_key']}"},
+        files={"document": (name, document)},
+        data={"model": DOCUMENT_PARSE_MODEL, "ocr": "force", "output_formats": "['html']", "coordinates": "false"},
+        timeout=timeout,
+    )
+    if response.status_code >= 400:
+        raise ValueError(f"Document Parse HTTP {response.status_code}: {response.text[:200]}")
+    return response.json().get("elements") or []
+
+
+def _element_html(element: dict) -> str:
+    return (element.get("content") or {}).get("html") or ""
+
+
+def _ocr(endpoint: dict[str, str], name: str, document: BinaryIO, deadline: Deadline) -> list[dict]:
+    """One Document Parse request, admitted by the process-wide quota scheduler."""
+    with get_scheduler("parse").acquire(deadline=deadline):
+        return deadline.call(_post_document, endpoint, name, document, deadline.timeout(PARSE_TIMEOUT_SECONDS))
+
+
+def _request_pages(
+    endpoint: dict[str, str],
+    name: str,
+    reader,
+    page_indexes: list[int],
+    deadline: Deadline,
+) -> dict[int, list[dict]]:
+    """OCR only the given pages (0-based), PAGES_PER_REQUEST per request; returns elements per original page."""
+    from pypdf import PdfWriter
+
+    by_page: dict[int, list[dict]] = {}
+    for start in range(0, len(page_indexes), PAGES_PER_REQUEST):
+        batch_pages = page_indexes[start:start + PAGES_PER_REQUEST]
+        writer = PdfWriter()
+        for idx in batch_pages:
+            writer.add_page(reader.pages[idx])
+        with io.BytesIO() as batch:
+            writer.write(batch)
+            batch.seek(0)
+            elements = _ocr(endpoint, name, batch, deadline)
+        for el in elements:
+            # Element "page" is 1-based within the uploaded batch.
+            local = int(el.get("page") or 1) - 1
+            original = batch_pages[min(max(local, 0), len(batch_pages) - 1)]
+            by_page.setdefault(original, []).append(el)
+    return by_page
+
+
+def _read_pdf(name: str, view: memoryview) -> tuple[memoryview, object, dict, list[str], dict[int, str]]:
+    """
+    Open a PDF, drop duplicate pages and classify the rest.
+    Returns (view of the kept pages, reader over it, prepare_pdf output, method per kept
+    page, locally extracted text per "local" page index).
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(_MemoryReader(view, name))
+    prepared = preprocess.prepare_pdf(name, view, reader, classify_page_text)
+    if prepared["dropped"]:
+        view = memoryview(prepared["data"])
+        reader = PdfReader(_MemoryReader(view, name))
+    methods: list[str] = []
+    local_text: dict[int, str] = {}
+    for idx, page in enumerate(reader.pages):
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            text = ""
+        methods.append(classify_page_text(text))
+        if methods[-1] == "local":
+            local_text[idx] = text
+    return view, reader, prepared, methods, local_text
+
+
+def _ocr_whole_pdf(
+    endpoint: dict[str, str], name: str, view: memoryview, deadline: Deadline
+) -> tuple[str, list[dict], dict]:
+    """Upload the file as-is and report every page Document Parse returned as OCR'd."""
+    elements = _ocr(endpoint, name, _MemoryReader(view, name), deadline)
+    by_page: dict[int, list[dict]] = {}
+    for el in elements:
+        by_page.setdefault(int(el.get("page") or 1), []).append(el)
+    text = ""
+    pages: list[dict] = []
+    for page in sorted(by_page) or [1]:
+        part = "".join(_element_html(el) for el in by_page.get(page, []))
+        pages.append({"page": page, "method": "ocr", "span": [len(text), len(text) + len(part)]})
+        text += part
+    prepared = {"name": name, "data": view, "page_map": [p["page"] for p in pages], "dropped": {},
+                "bytes_in": len(view), "bytes_out": len(view)}
+    return text, pages, prepared
+
+
+def _parse_pdf(
+    endpoint: dict[str, str],
+    name: str,
+    view: memoryview,
+    deadline: Deadline,
+) -> tuple[str, list[dict], dict]:
+    """
+    Drop duplicate pages, extract text-layer pages locally, OCR the rest, and
+    reassemble in page order. Page numbers in the report refer to the original file.
+    A PDF pypdf cannot read (truncated, malformed) is uploaded whole instead.
+    """
+    try:
+        view, reader, prepared, methods, local_text = _read_pdf(name, view)
+    except Exception:
+        # e.g. PdfStreamError on a truncated file; Document Parse usually still reads it.
+        metrics.incr("parse_local_unreadable")
+        return _ocr_whole_pdf(endpoint, name, view, deadline)
+    page_map = prepared["page_map"]
+
+    ocr_indexes = [idx for idx, m in enumerate(methods) if m == "ocr"]
+    deadline.check()
+    if len(ocr_indexes) == len(methods) and len(methods) <= PAGES_PER_REQUEST:
+        # Fully scanned and small: upload the (deduplicated) bytes as-is.
+        elements = _ocr(endpoint, name, _MemoryReader(view, name), deadline)
+        ocr_by_page: dict[int, list[dict]] = {}
+        for el in elements:
+            ocr_by_page.setdefault(int(el.get("page") or 1) - 1, []).append(el)
+    else:
+        ocr_by_page = _request_pages(endpoint, name, reader, ocr_indexes, deadline) if ocr_indexes else {}
+
+    text = ""
+    pages: list[dict] = []
+    for idx, method in enumerate(methods):
+        if idx in local_text:
+            part = _text_to_html(local_text[idx])
+        else:
+            part = "".join(_element_html(el) for el in ocr_by_page.get(idx, []))
+        # span: character range of this page's text in the document output (provenance).
+        pages.append({"page": page_map[idx], "method": method, "span": [len(text), len(text) + len(part)]})
+        text += part
+    for original, dup_of in prepared["dropped"].items():
+        pages.append({"page": original, "method": "duplicate", "duplicate_of": dup_of})
+    pages.sort(key=lambda p: p["page"])
+    return text, pages, prepared
+
+
+def _parse_image(endpoint: dict[str, str], prepared: dict, deadline: Deadline) -> tuple[str, list[dict]]:
+    data = prepared["data"]
+    view = data if isinstance(data, memoryview) else memoryview(data)
+    elements = _ocr(endpoint, prepared["name"], _MemoryReader(view, prepared["name"]), deadline)
+    text = "".join(_element_html(el) for el in elements)
+    return text, [{"page": 1, "method": "ocr", "span": [0, len(text)]}]
+
+
+def _cache_get_or_claim(
+    key: str, deadline: Deadline
+) -> tuple[Optional[dict], Optional[threading.Event]]:
+    """
+    Return (entry, None) on a cache hit, or (None, event) when the caller should parse
+    the document and then call _release(key, event). If another thread is already
+    parsing it (e.g. a pre-parse started at upload), wait for that parse first, lending
+    it this caller's quota priority so a batch parse does not hold up an interactive run.
+    """
+    while True:
+        with _parse_cache_lock:
+            entry = _parse_cache.get(key)
+            if entry is not None:
+                _parse_cache.move_to_end(key)
+                return entry, None
+            claim = _parse_inflight.get(key)
+            if claim is None:
+                event = threading.Event()
+                _parse_inflight[key] = (event, current_session())
+                return None, event
+        event, holder = claim
+        with get_scheduler("parse").boost(holder, current_priority()):
+            while not event.wait(_WAIT_SLICE_SECONDS):
+                deadline.check()
+        # Finished, failed or stopped: re-check the cache, parse ourselves if still missing.
+
+
+def _release(key: str, event: threading.Event) -> None:
+    with _parse_cache_lock:
+        claim = _parse_inflight.get(key)
+        if claim is not None and claim[0] is event:
+            del _parse_inflight[key]
+    event.set()
+
+
+def _cache_put(key: str, entry: dict) -> None:
+    with _parse_cache_lock:
+        _parse_cache[key] = entry
+        _parse_cache.move_to_end(key)
+        while len(_parse_cache) > _PARSE_CACHE_MAX_ENTRIES:
+            _parse_cache.popitem(last=False)
+
+
+def parse_documents(files: list[DocumentSource], deadline: Optional[Deadline] = None) -> list[dict]:
+    """
+    Parse each document and report how every page was read.
+    Before upload, images are downscaled/re-encoded and duplicate pages (within a PDF)
+    or duplicate images (within this call) are dropped; see core.preprocess.
+    Results are cached by content hash; a document already being parsed by another
+    thread is waited on rather than parsed twice.
 
     Args:
-        files: List of file paths (str or Path). Supported: PDF, images, etc.
+        files: See process_documents.
+        deadline: Time budget and cancellation token, checked between documents and
+            while each OCR request is in flight.
 
     Returns:
-        Concatenated text (HTML output from parser) from all documents.
+        One dict per input, in order: {"name", "hash", "text", "pages", "preprocess"}.
+        pages: [{"page", "method", "span"?, "duplicate_of"?}] where method is "local"
+        (embedded text layer), "ocr" (Upstage Document Parse) or "duplicate" (skipped),
+        and span is the page's [start, end) character range in text.
+        preprocess: {"bytes_in", "bytes_out"}.
 
     Raises:
         FileNotFoundError: If any path does not exist.
-        ValueError: If files list is empty or loader fails.
+        ValueError: If files list is empty or a document fails to load.
+        InterruptedError: If the deadline's token was cancelled.
+        DeadlineExceeded: If the time budget ran out.
     """
     if not files:
-        raise ValueError("files must be a non-empty list of file paths")
+        raise ValueError("files must be a non-empty list of documents")
 
-    all_parts: list[str] = []
+    deadline = deadline or Deadline()
+    endpoint = _parser_endpoint()
+    results: list[dict] = []
+    seen_images: list[tuple[str, tuple[int, bytes]]] = []
 
     for f in files:
-        path = Path(f) if not isinstance(f, Path) else f
-        if not path.exists():
-            raise FileNotFoundError(f"File not found: {path}")
+        with open_document(f) as (name, view):
+            if len(view) == 0:
+                raise ValueError(f"Failed to load document {name}: empty file")
+            deadline.check()
+            key = document_hash(view)
+            entry, claim = _cache_get_or_claim(key, deadline)
+            if claim is not None:
+                try:
+                    if _is_pdf(name, view):
+                        text, pages, prepared = _parse_pdf(endpoint, name, view, deadline)
+                        image_hash = None
+                    else:
+                        prepared = preprocess.prepare_image(name, view)
+                        image_hash = prepared["hash"]
+                        dup_of = preprocess.find_duplicate(image_hash, seen_images) if image_hash is not None else None
+                        if dup_of is not None:
+                            results.append(_duplicate_image(name, key, dup_of, len(view)))
+                            continue
+                        text, pages = _parse_image(endpoint, prepared, deadline)
+                    preprocess.record(prepared)
+                    entry = {
+                        "text": text,
+                        "pages": pages,
+                        "image_hash": image_hash,
+                        "preprocess": {"bytes_in": prepared["bytes_in"], "bytes_out": prepared["bytes_out"]},
+                    }
+                    _cache_put(key, entry)
+                except (InterruptedError, DeadlineExceeded):
+                    raise
+                except Exception as e:
+                    raise ValueError(f"Failed to load document {name}: {e}") from e
+                finally:
+                    _release(key, claim)
+                for p in pages:
+                    metrics.incr("parse_pages", method=p["method"])
+            elif entry["image_hash"] is not None:
+                dup_of = preprocess.find_duplicate(entry["image_hash"], seen_images)
+                if dup_of is not None:
+                    results.append(_duplicate_image(name, key, dup_of, len(view)))
+                    continue
+        if entry["image_hash"] is not None:
+            seen_images.append((name, entry["image_hash"]))
+        results.append({
+            "name": name,
+            "hash": key,
+            "text": entry["text"],
+            "pages": entry["pages"],
+            "preprocess": entry["preprocess"],
+        })
+
+    return results
+
+
+def _duplicate_image(name: str, key: str, dup_of: str, size: int) -> dict:
+    metrics.incr("parse_pages", method="duplicate")
+    return {
+        "name": name,
+        "hash": key,
+        "text": "",
+        "pages": [{"page": 1, "method": "duplicate", "duplicate_of": dup_of}],
+        "preprocess": {"bytes_in": size, "bytes_out": 0},
+    }
 
-        try:
-            loader = UpstageDocumentParseLoader(
-                str(path),
-                split="none",
-                ocr="force",
-                output_format="html",
-            )
-            docs = loader.load()
-        except Exception as e:
-            raise ValueError(f"Failed to load document {path}: {e}") from e
-
-        for doc in docs:
-            content = getattr(doc, "page_content", "") or ""
-            if content.strip():
-                all_parts.append(content.strip())
 
+def process_documents(files: list[DocumentSource], deadline: Optional[Deadline] = None) -> str:
+    """
+    Load multiple documents via Upstage Document Parse and return concatenated text.
+    PDF pages with a usable text layer are read locally; only scanned/image pages are OCR'd.
+
+    Args:
+        files: Paths (str or Path), raw buffers (bytes, bytearray, memoryview),
+            file-like objects (e.g. Streamlit UploadedFile), or (name, buffer/file)
+            tuples. Supported: PDF, images, etc.
+        deadline: Optional time budget and cancellation token (core.deadline).
+
+    Returns:
+        Concatenated text (Document Parse HTML output) from all documents.
+
+    Raises:
+        FileNotFoundError: If any path does not exist.
+        ValueError: If files list is empty or loader fails.
+        InterruptedError, DeadlineExceeded: See parse_documents.
+    """
+    all_parts = [d["text"].strip() for d in parse_documents(files, deadline) if d["text"].strip()]
     if not all_parts:
         raise ValueError("No content extracted from any of the given files")
-
     return "\n\n".join(all_parts)
@@ -0,0 +1,132 @@
+"""
+Chain Profiles & Model Routing.
+Per-chain generation settings (model, max_tokens, temperature, timeout), loaded from
+defaults, an optional JSON file (THINKFLOW_PROFILES) and THINKFLOW_<CHAIN>_<FIELD>
+environment variables. With THINKFLOW_ROUTING=auto, short inputs to cheap chains are
+routed to a smaller model (off by default).
+
+Output sizes are recorded per chain (chain_output_tokens) and suggested_max_tokens()
+turns them into caps. Print the effective profiles with:
+    python -m core.profiles
+"""
+
+import hashlib
+import json
+import os
+import sys
+from functools import lru_cache
+from typing import Any, Optional
+
+from utils import metrics
+
+DEFAULT_MODEL = "solar-pro"
+DEFAULT_SMALL_MODEL = "solar-mini"
+# Routed chains go to the small model only while their (retrieved) context stays under this.
+ROUTE_MAX_CONTEXT_TOKENS = 3000
+
+# max_tokens caps: estimates from each chain's output format, not measurements (gap is a
+# two-field JSON, the executive summary four short strings; structure/action scale with
+# the input). Re-derive them from real traffic with suggested_max_tokens().
+# structured: request schema-constrained JSON (core.structured) unless the model rejects it.
+DEFAULT_PROFILES: dict[str, dict[str, Any]] = {
+    "gap": {"model": DEFAULT_MODEL, "max_tokens": 256, "temperature": 0.0, "timeout": 30, "route": True, "structured": True},
+    "executive": {"model": DEFAULT_MODEL, "max_tokens": 768, "temperature": 0.3, "timeout": 45, "route": True, "structured": True},
+    "structure": {"model": DEFAULT_MODEL, "max_tokens": 2048, "temperature": 0.3, "timeout": 90, "route": False, "structured": False},
+    "action": {"model": DEFAULT_MODEL, "max_tokens": 3072, "temperature": 0.2, "timeout": 90, "route": False, "structured": True},
+    "strategic": {"model": DEFAULT_MODEL, "max_tokens": 1024, "temperature": 0.4, "timeout": 60, "route": False, "structured": True},
+}
+_FIELD_TYPES = {
+    "model": str,
+    "max_tokens": int,
+    "temperature": float,
+    "timeout": float,
+    "route": bool,
+    "structured": bool,
+}
+
+
+def _coerce(field: str, value: Any) -> Any:
+    kind = _FIELD_TYPES[field]
+    if kind is bool and isinstance(value, str):
+        return value.strip().lower() not in ("0", "false", "off", "no", "")
+    return kind(value)
+
+
+def routing_enabled() -> bool:
+    """Small-model routing is opt-in: THINKFLOW_ROUTING=auto (or 1/true/on)."""
+    return os.environ.get("THINKFLOW_ROUTING", "off").strip().lower() in ("auto", "1", "true", "on")
+
+
+def small_model() -> str:
+    return os.environ.get("THINKFLOW_SMALL_MODEL", DEFAULT_SMALL_MODEL).strip() or DEFAULT_SMALL_MODEL
+
+
+@lru_cache(maxsize=1)
+def load_profiles() -> dict[str, dict[str, Any]]:
+    """
+    Effective profiles: defaults, then the JSON file named by THINKFLOW_PROFILES
+    ({"action": {"max_tokens": 4096}, ...}), then e.g. THINKFLOW_ACTION_MAX_TOKENS.
+    Unknown chains and fields are ignored.
+    """
+    profiles = {name: dict(p) for name, p in DEFAULT_PROFILES.items()}
+    path = os.environ.get("THINKFLOW_PROFILES", "").strip()
+    if path:
+        with open(path, encoding="utf-8") as fh:
+            overrides = json.load(fh)
+        for name, fields in overrides.items():
+            if name in profiles and isinstance(fields, dict):
+                for field, value in fields.items():
+                    if field in _FIELD_TYPES:
+                        profiles[name][field] = _coerce(field, value)
+    for name, profile in profiles.items():
+        for field in _FIELD_TYPES:
+            value = os.environ.get(f"THINKFLOW_{name.upper()}_{field.upper()}")
+            if value is not None and value.strip():
+                profile[field] = _coerce(field, value)
+    return profiles
+
+
+def get_profile(chain: str) -> dict[str, Any]:
+    return dict(load_profiles()[chain])
+
+
+def route_model(chain: str, context_tokens: int) -> str:
+    """Model for one call: the small model for short inputs to routed chains, else the profile's model."""
+    profile = load_profiles()[chain]
+    if profile["route"] and routing_enabled() and context_tokens <= ROUTE_MAX_CONTEXT_TOKENS:
+        return small_model()
+    return profile["model"]
+
+
+def fingerprint() -> str:
+    """Digest of the effective profiles and routing, so stored results follow config changes."""
+    payload = json.dumps(
+        {"profiles": load_profiles(), "routing": routing_enabled(), "small": small_model()}, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def record_output(chain: str, model: str, output_tokens: int, truncated: bool) -> None:
+    """Track output size per chain; truncated means the call stopped at max_tokens."""
+    metrics.observe("chain_output_tokens", output_tokens, chain=chain)
+    metrics.incr("chain_calls", chain=chain, model=model)
+    if truncated:
+        metrics.incr("chain_truncated", chain=chain)
+
+
+def suggested_max_tokens(headroom: float = 1.25, snapshot: Optional[dict[str, Any]] = None) -> dict[str, int]:
+    """max_tokens per chain from recorded outputs: the largest seen plus headroom, rounded up to 64."""
+    hists = (snapshot or metrics.snapshot())["histograms"]
+    out: dict[str, int] = {}
+    for chain in DEFAULT_PROFILES:
+        h = hists.get(f"chain_output_tokens{{chain={chain}}}")
+        if h and h["count"]:
+            out[chain] = int(-(-h["max"] * headroom // 64) * 64)
+    return out
+
+
+if __name__ == "__main__":
+    json.dump(load_profiles(), sys.stdout, indent=2, ensure_ascii=False)
+    print()
+    print(f"routing: {'auto' if routing_enabled() else 'off'} (small model {small_model()}, "
+          f"context <= {ROUTE_MAX_CONTEXT_TOKENS} tokens)")
@@ -0,0 +1,259 @@
+"""
+API Quota Scheduler.
+Process-wide gate in front of every Upstage call: token buckets for requests and tokens
+per minute, served by priority class (interactive before batch) and round-robin across
+sessions, so one busy session cannot starve the rest under the account's rate limit.
+A caller waiting on another session's work (e.g. a pre-parse of the same file) lends
+that session its priority with boost(), so the work it waits on is not starved.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Iterator, Optional
+
+from core.deadline import Deadline
+from utils import metrics
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+# Per-minute limits per API; set them to the account's plan (0 = unlimited).
+DEFAULT_LIMITS = {
+    "chat": {"rpm": 100, "tpm": 200_000},
+    "parse": {"rpm": 60, "tpm": 0},
+}
+_WAIT_SLICE_SECONDS = 0.1
+
+_caller: ContextVar[tuple[str, int]] = ContextVar("quota_caller", default=("anonymous", INTERACTIVE))
+
+
+@contextmanager
+def caller(session_id: str, priority: int = INTERACTIVE) -> Iterator[None]:
+    """
+    Attribute calls made in this context (and in jobs submitted from it, see core.jobs)
+    to a session and priority class.
+    """
+    token = _caller.set((session_id, priority))
+    try:
+        yield
+    finally:
+        _caller.reset(token)
+
+
+def current_session() -> str:
+    """Session the calls in this context are attributed to ("anonymous" outside caller())."""
+    return _caller.get()[0]
+
+
+def current_priority() -> int:
+    """Priority class of the calls in this context (INTERACTIVE outside caller())."""
+    return _caller.get()[1]
+
+
+class TokenBucket:
+    """Refills continuously at per_minute / 60 per second up to per_minute. per_minute <= 0 means unlimited."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, amount: float, now: float) -> bool:
+        if self.capacity <= 0:
+            return True
+        self._refill(now)
+        return self.level >= min(amount, self.capacity)
+
+    def take(self, amount: float) -> None:
+        if self.capacity > 0:
+            self.level -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """Charge (or refund) the difference between the reserved and the actual amount."""
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level - delta)
+
+
+class _Ticket:
+    def __init__(self, session: str, priority: int, tokens: int):
+        self.session = session
+        self.priority = priority
+        self.tokens = tokens
+        self.granted = threading.Event()
+        self.enqueued = time.monotonic()
+
+
+class Slot:
+    """
+    A granted call. settle() corrects the token charge once actual usage is known; a
+    call that raises before settling gets its token reservation back.
+    """
+
+    def __init__(self, scheduler: "QuotaScheduler", ticket: _Ticket):
+        self._scheduler = scheduler
+        self._ticket = ticket
+        self.settled = False
+
+    def settle(self, actual_tokens: int) -> None:
+        self.settled = True
+        self._scheduler._settle(actual_tokens - self._ticket.tokens)
+
+
+class QuotaScheduler:
+    """
+    Strict priority between classes, round-robin between sessions within a class, FIFO
+    within a session. The head request waits for capacity rather than being overtaken,
+    so large requests are not starved by small ones.
+    """
+
+    def __init__(self, name: str, rpm: int = 0, tpm: int = 0):
+        self.name = name
+        self._lock = threading.Lock()
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._queues: dict[int, "OrderedDict[str, deque[_Ticket]]"] = {p: OrderedDict() for p in sorted(PRIORITY_NAMES)}
+        # Session -> priorities lent to it by boost() callers still waiting on it.
+        self._boosts: dict[str, list[int]] = {}
+
+    @contextmanager
+    def acquire(self, tokens: int = 0, deadline: Optional[Deadline] = None) -> Iterator[Slot]:
+        """
+        Wait for a turn and quota for one call costing about `tokens`, then run the block.
+
+        Raises:
+            InterruptedError, DeadlineExceeded: From deadline while still queued.
+        """
+        session, priority = _caller.get()
+        ticket = _Ticket(session, priority, max(0, int(tokens)))
+        with self._lock:
+            ticket.priority = min([priority, *self._boosts.get(session, ())])
+            self._queues[ticket.priority].setdefault(session, deque()).append(ticket)
+            self._dispatch_locked()
+        try:
+            while not ticket.granted.wait(_WAIT_SLICE_SECONDS):
+                if deadline is not None:
+                    deadline.check()
+                with self._lock:
+                    self._dispatch_locked()
+        except BaseException:
+            with self._lock:
+                if ticket.granted.is_set():
+                    self._requests.adjust(-1)
+                    self._tokens.adjust(-ticket.tokens)
+                else:
+                    self._remove_locked(ticket)
+                self._dispatch_locked()
+            raise
+        metrics.observe(
+            "quota_wait_seconds",
+            time.monotonic() - ticket.enqueued,
+            api=self.name,
+            priority=PRIORITY_NAMES[priority],
+        )
+        slot = Slot(self, ticket)
+        try:
+            yield slot
+        except BaseException:
+            # Failed calls keep their request but not the input + max_tokens reservation.
+            if not slot.settled:
+                self._settle(-ticket.tokens)
+            raise
+
+    @contextmanager
+    def boost(self, session: str, priority: int) -> Iterator[None]:
+        """
+        Priority inheritance: while the block runs, session's queued and new calls are
+        served at `priority` or better (e.g. a batch pre-parse an interactive run waits on).
+        """
+        with self._lock:
+            self._boosts.setdefault(session, []).append(priority)
+            for p, sessions in self._queues.items():
+                if p > priority and session in sessions:
+                    moved = sessions.pop(session)
+                    for ticket in moved:
+                        ticket.priority = priority
+                    self._queues[priority].setdefault(session, deque()).extend(moved)
+            self._dispatch_locked()
+        try:
+            yield
+        finally:
+            with self._lock:
+                boosts = self._boosts[session]
+                boosts.remove(priority)
+                if not boosts:
+                    del self._boosts[session]
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._depth_locked()
+
+    def _depth_locked(self) -> int:
+        return sum(len(q) for sessions in self._queues.values() for q in sessions.values())
+
+    def _head_locked(self) -> Optional[_Ticket]:
+        for sessions in self._queues.values():
+            for queue in sessions.values():
+                if queue:
+                    return queue[0]
+        return None
+
+    def _dispatch_locked(self) -> None:
+        now = time.monotonic()
+        while True:
+            ticket = self._head_locked()
+            if ticket is None:
+                break
+            if not (self._requests.available(1, now) and self._tokens.available(ticket.tokens, now)):
+                break
+            self._requests.take(1)
+            self._tokens.take(ticket.tokens)
+            sessions = self._queues[ticket.priority]
+            sessions[ticket.session].popleft()
+            if sessions[ticket.session]:
+                sessions.move_to_end(ticket.session)
+            else:
+                del sessions[ticket.session]
+            ticket.granted.set()
+        metrics.set_gauge("quota_queue_depth", self._depth_locked(), api=self.name)
+
+    def _remove_locked(self, ticket: _Ticket) -> None:
+        sessions = self._queues[ticket.priority]
+        queue = sessions.get(ticket.session)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del sessions[ticket.session]
+
+    def _settle(self, delta: int) -> None:
+        with self._lock:
+            self._tokens.adjust(delta)
+            self._dispatch_locked()
+
+
+# Held while building, so racing first calls cannot split one API's quota across two schedulers.
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(api: str) -> QuotaScheduler:
+    """Process-wide scheduler per API ("chat", "parse"); limits from THINKFLOW_<API>_RPM / _TPM."""
+    with _schedulers_lock:
+        return _scheduler(api)
+
+
+@lru_cache(maxsize=None)
+def _scheduler(api: str) -> QuotaScheduler:
+    limits = DEFAULT_LIMITS.get(api, {"rpm": 0, "tpm": 0})
+    rpm = int(os.environ.get(f"THINKFLOW_{api.upper()}_RPM", limits["rpm"]))
+    tpm = int(os.environ.get(f"THINKFLOW_{api.upper()}_TPM", limits["tpm"]))
+    return QuotaScheduler(api, rpm=rpm, tpm=tpm)
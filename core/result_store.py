@@ -0,0 +1,176 @@
+"""
+Persistent Result Store.
+Analysis results in SQLite keyed by a canonical hash of the input (text + document
+hashes + pipeline version), shared across sessions, with single-flight coalescing
+so identical concurrent requests wait on one computation.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, Union
+
+from core.session_store import data_dir
+from utils import metrics
+
+DEFAULT_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+_WAIT_SLICE_SECONDS = 0.25
+
+HIT = "hit"
+COALESCED = "coalesced"
+COMPUTED = "computed"
+
+
+def canonical_text(text: str) -> str:
+    """Normalize text so cosmetic differences (NFC/NFD, CRLF, trailing spaces, blank runs) hash the same."""
+    s = unicodedata.normalize("NFC", text or "")
+    s = s.replace("\r\n", "\n").replace("\r", "\n")
+    s = "\n".join(line.rstrip() for line in s.split("\n"))
+    s = re.sub(r"\n{3,}", "\n\n", s)
+    return s.strip()
+
+
+def context_key(text: str, doc_hashes: Iterable[str] = (), version: str = "") -> str:
+    """Cache key for one analysis request. Document order does not matter."""
+    h = hashlib.sha256()
+    h.update(version.encode("utf-8"))
+    h.update(b"\0")
+    h.update(canonical_text(text).encode("utf-8"))
+    for d in sorted(doc_hashes):
+        h.update(b"\0")
+        h.update(d.encode("ascii"))
+    return h.hexdigest()
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        # JSON text of the leader's value if should_store accepted it; each waiter decodes
+        # its own copy. None with no error: the value was not shareable.
+        self.payload: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+class ResultStore:
+    """SQLite result cache with in-process single-flight. Values must be JSON-serializable."""
+
+    def __init__(self, path: Union[str, Path, None] = None, max_age_seconds: int = DEFAULT_MAX_AGE_SECONDS):
+        self.path = Path(path) if path else data_dir() / "results.sqlite3"
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._flights: dict[str, _Flight] = {}
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        cutoff = time.time() - self.max_age_seconds
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE key = ? AND created >= ?", (key, cutoff)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE results SET hits = hits + 1 WHERE key = ?", (key,))
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key: str, value: Any) -> None:
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, created, hits) VALUES (?, ?, ?, 0)",
+                (key, payload, now),
+            )
+            self._conn.execute("DELETE FROM results WHERE created < ?", (now - self.max_age_seconds,))
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        should_store: Callable[[Any], bool] = lambda _: True,
+        should_abort: Optional[Callable[[], bool]] = None,
+        retry_errors: tuple[type[BaseException], ...] = (),
+    ) -> tuple[Any, str]:
+        """
+        Return (value, status) where status is "hit", "coalesced" or "computed".
+        Concurrent callers with the same key share one compute() call; only the
+        leader runs it. Errors from compute() propagate to every waiter. Every
+        caller gets its own copy of the value, so callers may mutate it.
+
+        Args:
+            should_store: Persist and share only values it accepts (e.g. skip partial
+                results); waiters on a rejected value compute their own.
+            should_abort: Polled while waiting on another caller's computation.
+            retry_errors: Leader errors that waiters should not inherit (e.g. the
+                leader's own cancellation); a waiter seeing one computes itself.
+        """
+        while True:
+            cached = self.get(key)
+            if cached is not None:
+                metrics.incr("result_store", outcome=HIT)
+                return cached, HIT
+
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = _Flight()
+                    self._flights[key] = flight
+
+            if leader:
+                break
+            while not flight.done.wait(_WAIT_SLICE_SECONDS):
+                if should_abort is not None and should_abort():
+                    raise InterruptedError("aborted while waiting for identical analysis")
+            if flight.payload is not None:
+                metrics.incr("result_store", outcome=COALESCED)
+                return json.loads(flight.payload), COALESCED
+            if flight.error is not None and not isinstance(flight.error, retry_errors):
+                raise flight.error
+
+        try:
+            # The previous leader may have stored the value between our get() and taking the lock.
+            cached = self.get(key)
+            if cached is not None:
+                flight.payload = json.dumps(cached, ensure_ascii=False)
+                metrics.incr("result_store", outcome=HIT)
+                return cached, HIT
+            value = compute()
+            if should_store(value):
+                flight.payload = json.dumps(value, ensure_ascii=False)
+                self.put(key, value)
+            metrics.incr("result_store", outcome=COMPUTED)
+            return value, COMPUTED
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+
+# lru_cache alone may build the store twice when the first calls race (separate flights).
+_store_lock = threading.Lock()
+
+
+def get_result_store() -> ResultStore:
+    """Process-wide result store (THINKFLOW_RESULT_MAX_AGE sets retention in seconds)."""
+    with _store_lock:
+        return _result_store()
+
+
+@lru_cache(maxsize=1)
+def _result_store() -> ResultStore:
+    max_age = int(os.environ.get("THINKFLOW_RESULT_MAX_AGE", DEFAULT_MAX_AGE_SECONDS))
+    return ResultStore(max_age_seconds=max_age)
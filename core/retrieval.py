@@ -0,0 +1,296 @@
+"""
+Local Context Retrieval.
+BM25 over chunks of the attached documents, so each chain gets only the passages it
+needs under its own token budget. The user's thought dump and the refinement blocks
+(previous plan, edit requests) are always sent whole. No external service; small
+inputs pass through whole.
+
+Evaluate against the labelled fixture (recall = hand-picked lines each chain must keep):
+    python -m core.retrieval [fixture.json]
+"""
+
+import json
+import math
+import os
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Any, Optional
+
+from utils import metrics
+
+# Per-chain query terms and context token budget.
+CHAIN_RETRIEVAL: dict[str, dict[str, Any]] = {
+    "gap": {
+        "query": "목표 프로젝트 과제 마감 마감일 기한 까지 담당 혼자 협업 팀 goal deadline due owner",
+        "budget": 1200,
+        "dated": True,
+        "imperative": False,
+    },
+    "executive": {
+        "query": "목표 배경 문제 해결 개요 핵심 성과 지표 KPI 전환 유입 goal problem summary",
+        "budget": 2500,
+        "dated": False,
+        "imperative": False,
+    },
+    "structure": {
+        "query": "목표 전략 단계 계획 방법 실행 구조 goal strategy plan step",
+        "budget": 3500,
+        "dated": False,
+        "imperative": True,
+    },
+    "action": {
+        "query": "해야 할 하기 준비 작성 제출 완료 정리 확인 연락 일정 마감 까지 todo task deadline",
+        "budget": 3500,
+        "dated": True,
+        "imperative": True,
+    },
+    "strategic": {
+        "query": "마감 까지 우선 먼저 중요 필수 생략 선택 리소스 시간 예산 priority deadline",
+        "budget": 2000,
+        "dated": True,
+        "imperative": False,
+    },
+}
+
+# Section headers in the combined context (core.pipeline): each attached document starts
+# with DOCUMENT_MARKER; refinement contexts end with the previous plan and the requests.
+DOCUMENT_MARKER = "[참고 자료]"
+REFINE_PLAN_MARKER = "[이전 계획]"
+REFINE_REQUEST_MARKER = "[사용자 수정 요청]"
+_SECTION_RE = re.compile(r"\n\s*\n(?=\[참고 자료\]|\[이전 계획\]|\[사용자 수정 요청\])")
+
+EVAL_FIXTURE_PATH = Path(__file__).with_name("retrieval_eval.json")
+
+CHUNK_CHARS = 600
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+_FEATURE_BOOST = 1.5
+
+_DATE_RE = re.compile(
+    r"\d{4}-\d{1,2}-\d{1,2}|\d{1,2}\s*월\s*\d{1,2}\s*일|\d{1,2}/\d{1,2}|D-\d+|까지|마감|deadline|due",
+    re.IGNORECASE,
+)
+_IMPERATIVE_RE = re.compile(r"(하기|해야|할 것|할것|하자|해야 함|필요|준비|제출|작성|완료|정리|확인|연락|예약)")
+_TAG_RE = re.compile(r"<[^>]+>")
+_WORD_RE = re.compile(r"[0-9a-z]+|[가-힣]+")
+
+
+def retrieval_enabled() -> bool:
+    return os.environ.get("THINKFLOW_RETRIEVAL", "1").strip().lower() not in ("0", "false", "off")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: ~4 ASCII chars or ~1.5 Hangul/other chars per token."""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return int(ascii_chars / 4 + (len(text) - ascii_chars) / 1.5) + 1
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased words; Hangul words also contribute character bigrams (particles stay attached)."""
+    tokens: list[str] = []
+    for word in _WORD_RE.findall(_TAG_RE.sub(" ", text).lower()):
+        tokens.append(word)
+        if len(word) > 2 and "가" <= word[0] <= "힣":
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def chunk_context(text: str, max_chars: int = CHUNK_CHARS, separate: Optional[re.Pattern] = None) -> list[str]:
+    """
+    Split on blank lines and block-level HTML tags, packing small pieces up to max_chars.
+    Pieces matching separate get a chunk of their own, so a dated or to-do line is
+    never priced and ranked together with the background around it.
+    """
+    pieces = re.split(r"\n\s*\n|(?<=</p>)|(?<=</h\d>)|(?<=</li>)|(?<=</table>)|(?<=<br>)", text or "")
+    chunks: list[str] = []
+    current = ""
+    for piece in pieces:
+        piece = (piece or "").strip()
+        if not piece:
+            continue
+        while len(piece) > max_chars:
+            cut = piece.rfind(" ", 0, max_chars)
+            cut = cut if cut > max_chars // 2 else max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(piece[:cut].strip())
+            piece = piece[cut:].strip()
+        alone = separate is not None and separate.search(_TAG_RE.sub(" ", piece)) is not None
+        if current and (alone or len(current) + len(piece) + 1 > max_chars):
+            chunks.append(current)
+            current = ""
+        if alone:
+            chunks.append(piece)
+            continue
+        current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 over pre-tokenized chunks."""
+
+    def __init__(self, chunks: list[str]):
+        self.docs = [Counter(tokenize(c)) for c in chunks]
+        self.lengths = [sum(d.values()) for d in self.docs]
+        self.avg_len = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        df: Counter = Counter()
+        for d in self.docs:
+            df.update(d.keys())
+        n = len(self.docs)
+        self.idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+
+    def scores(self, query: str) -> list[float]:
+        terms = tokenize(query)
+        out: list[float] = []
+        for doc, length in zip(self.docs, self.lengths):
+            score = 0.0
+            norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * length / (self.avg_len or 1))
+            for t in terms:
+                tf = doc.get(t)
+                if tf:
+                    score += self.idf.get(t, 0.0) * tf * (_BM25_K1 + 1) / (tf + norm)
+            out.append(score)
+        return out
+
+
+def split_sections(context: str) -> list[tuple[bool, str]]:
+    """
+    (searchable, text) per section of a combined context, in order. Attached documents
+    are searchable; the thought dump and refinement blocks are not. A context without
+    document headers (older callers) keeps its first chunk pinned and the rest searchable.
+    """
+    parts = [p.strip() for p in _SECTION_RE.split((context or "").strip()) if p.strip()]
+    if parts and not any(p.startswith(DOCUMENT_MARKER) for p in parts):
+        if not parts[0].startswith((REFINE_PLAN_MARKER, REFINE_REQUEST_MARKER)):
+            chunks = chunk_context(parts[0])
+            if len(chunks) > 1:
+                return [(False, chunks[0]), (True, "\n\n".join(chunks[1:]))] + [(False, p) for p in parts[1:]]
+    return [(p.startswith(DOCUMENT_MARKER), p) for p in parts]
+
+
+def _feature_re(spec: dict[str, Any]) -> Optional[re.Pattern]:
+    """Pattern for the lines a chain must not lose: dates/deadlines and/or to-dos."""
+    parts = [p.pattern for p, on in ((_DATE_RE, spec["dated"]), (_IMPERATIVE_RE, spec["imperative"])) if on]
+    return re.compile("|".join(parts), re.IGNORECASE) if parts else None
+
+
+def select_context(context: str, chain: str, budget: int = 0) -> str:
+    """
+    Return the context with only the document passages most relevant to chain, in
+    original order, within the chain's token budget. The thought dump, document
+    headers and refinement blocks are always kept (even over budget). Passages with
+    the chain's features (dates, to-dos) are packed before the rest, best BM25 score
+    first within each group. Contexts already within budget are returned unchanged.
+    """
+    spec = CHAIN_RETRIEVAL.get(chain)
+    context = (context or "").strip()
+    if spec is None or not retrieval_enabled():
+        return context
+    budget = budget or spec["budget"]
+    total = estimate_tokens(context)
+    if total <= budget:
+        return context
+
+    sections = split_sections(context)
+    features = _feature_re(spec)
+    # (section index, chunk) for every document passage; a document's first line is its header.
+    headers: dict[int, str] = {}
+    candidates: list[tuple[int, str]] = []
+    used = 0
+    for s_idx, (searchable, text) in enumerate(sections):
+        if not searchable:
+            used += estimate_tokens(text)
+            continue
+        header, body = (text.split("\n", 1) + [""])[:2] if text.startswith(DOCUMENT_MARKER) else ("", text)
+        if header:
+            headers[s_idx] = header
+            used += estimate_tokens(header)
+        candidates.extend((s_idx, chunk) for chunk in chunk_context(body, separate=features))
+    if not candidates:
+        return context
+
+    scores = BM25Index([c for _, c in candidates]).scores(spec["query"])
+    featured = [False] * len(candidates)
+    for i, (_, chunk) in enumerate(candidates):
+        plain = _TAG_RE.sub(" ", chunk)
+        if spec["dated"] and _DATE_RE.search(plain):
+            scores[i] += _FEATURE_BOOST
+        if spec["imperative"] and _IMPERATIVE_RE.search(plain):
+            scores[i] += _FEATURE_BOOST
+        featured[i] = features is not None and features.search(plain) is not None
+
+    keep: set[int] = set()
+    for i in sorted(range(len(candidates)), key=lambda i: (not featured[i], -scores[i], i)):
+        cost = estimate_tokens(candidates[i][1])
+        if used + cost > budget:
+            continue
+        keep.add(i)
+        used += cost
+
+    out: list[str] = []
+    for s_idx, (searchable, text) in enumerate(sections):
+        if not searchable:
+            out.append(text)
+            continue
+        passages = [c for i, (s, c) in enumerate(candidates) if s == s_idx and i in keep]
+        if s_idx in headers:
+            out.append("\n".join([headers[s_idx], *passages]) if passages else headers[s_idx])
+        elif passages:
+            out.append("\n\n".join(passages))
+    selected = "\n\n".join(out)
+    metrics.observe("retrieval_tokens_saved", total - estimate_tokens(selected), chain=chain)
+    return selected
+
+
+def _flat(text: str) -> str:
+    return " ".join(_TAG_RE.sub(" ", text).split())
+
+
+def evaluate(context: str, expected: list[str], chain: str = "action", budget: int = 0) -> dict[str, Any]:
+    """
+    Offline check for one context: token reduction and recall of the labelled lines
+    (expected) in what the chain would receive.
+    """
+    selected = select_context(context, chain, budget)
+    kept_text = _flat(selected)
+    kept = sum(1 for ln in expected if _flat(ln) in kept_text)
+    full_tokens = estimate_tokens(context)
+    selected_tokens = estimate_tokens(selected)
+    return {
+        "chain": chain,
+        "tokens_full": full_tokens,
+        "tokens_selected": selected_tokens,
+        "token_reduction": 1 - selected_tokens / full_tokens if full_tokens else 0.0,
+        "expected_lines": len(expected),
+        "recall": kept / len(expected) if expected else 1.0,
+    }
+
+
+def evaluate_fixture(path: Path = EVAL_FIXTURE_PATH) -> list[dict[str, Any]]:
+    """
+    evaluate() for every labelled case in a fixture:
+    {"cases": [{"name", "context", "budget"?, "expected": {chain: [lines]}}]}.
+    """
+    with open(path, encoding="utf-8") as fh:
+        cases = json.load(fh)["cases"]
+    return [
+        dict(evaluate(case["context"], lines, chain, case.get("budget", 0)), case=case["name"])
+        for case in cases
+        for chain, lines in case["expected"].items()
+    ]
+
+
+if __name__ == "__main__":
+    fixture = Path(sys.argv[1]) if len(sys.argv) > 1 else EVAL_FIXTURE_PATH
+    for r in evaluate_fixture(fixture):
+        print(
+            f"{r['case']:16s} {r['chain']:10s} tokens {r['tokens_full']:>6} -> {r['tokens_selected']:>6} "
+            f"({r['token_reduction']:.0%} less)  recall {r['recall']:.0%} of {r['expected_lines']}"
+        )
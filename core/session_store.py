@@ -0,0 +1,180 @@
+"""
+Disk-backed Session Store.
+Large per-session blobs (accumulated context, ICS bytes) live in a local SQLite file;
+st.session_state keeps only the session id and blob keys.
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Union
+
+from utils import metrics
+
+DEFAULT_QUOTA_BYTES = 16 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+_CLEANUP_INTERVAL_SECONDS = 300
+
+
+def data_dir() -> Path:
+    """Local directory for ThinkFlow stores (THINKFLOW_DATA_DIR or <tmp>/thinkflow)."""
+    base = os.environ.get("THINKFLOW_DATA_DIR", "").strip()
+    path = Path(base) if base else Path(tempfile.gettempdir()) / "thinkflow"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+class SessionStore:
+    """
+    SQLite blob store scoped by session id.
+    Each session has a byte quota (oldest blobs are evicted first, pinned blobs never)
+    and a TTL measured from its last write/read; expired sessions are removed lazily,
+    together with every per-session gauge.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path, None] = None,
+        quota_bytes: int = DEFAULT_QUOTA_BYTES,
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+    ):
+        self.path = Path(path) if path else data_dir() / "sessions.sqlite3"
+        self.quota_bytes = quota_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " session_id TEXT NOT NULL, key TEXT NOT NULL, data BLOB NOT NULL,"
+            " size INTEGER NOT NULL, updated REAL NOT NULL, pinned INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (session_id, key))"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(blobs)")}
+        if "pinned" not in columns:
+            self._conn.execute("ALTER TABLE blobs ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+
+    def put(self, session_id: str, key: str, data: Union[bytes, str], pinned: bool = False) -> str:
+        """
+        Store a blob and return its key (the handle kept in session_state). A pinned
+        blob (e.g. the context the shown plan was made from) is never evicted for
+        quota, only deleted or expired with its session.
+
+        Raises:
+            ValueError: If a single blob is larger than the session quota.
+        """
+        raw = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+        if len(raw) > self.quota_bytes:
+            raise ValueError(f"Blob '{key}' ({len(raw)} bytes) exceeds session quota ({self.quota_bytes} bytes)")
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs (session_id, key, data, size, updated, pinned) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, key, sqlite3.Binary(raw), len(raw), now, int(pinned)),
+            )
+            self._enforce_quota(session_id, key)
+            usage = self._usage_locked(session_id)
+        metrics.set_gauge("session_store_bytes", usage, session=session_id)
+        self._maybe_cleanup(now)
+        return key
+
+    def get(self, session_id: str, key: str) -> Optional[bytes]:
+        """Return blob bytes, or None if missing/evicted. Refreshes the session TTL."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM blobs WHERE session_id = ? AND key = ?", (session_id, key)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE blobs SET updated = ? WHERE session_id = ? AND key = ?",
+                    (time.time(), session_id, key),
+                )
+        return bytes(row[0]) if row is not None else None
+
+    def get_text(self, session_id: str, key: str) -> str:
+        """Return a stored blob decoded as UTF-8 ("" if missing)."""
+        raw = self.get(session_id, key)
+        return raw.decode("utf-8") if raw else ""
+
+    def delete(self, session_id: str, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM blobs WHERE session_id = ? AND key = ?", (session_id, key))
+            usage = self._usage_locked(session_id)
+        metrics.set_gauge("session_store_bytes", usage, session=session_id)
+
+    def clear_session(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM blobs WHERE session_id = ?", (session_id,))
+        metrics.remove_gauges(session=session_id)
+
+    def usage(self, session_id: str) -> int:
+        """Bytes currently stored for the session."""
+        with self._lock:
+            return self._usage_locked(session_id)
+
+    def cleanup(self, now: Optional[float] = None) -> int:
+        """Remove sessions idle longer than the TTL. Returns the number of sessions removed."""
+        cutoff = (now if now is not None else time.time()) - self.ttl_seconds
+        with self._lock:
+            expired = [
+                r[0]
+                for r in self._conn.execute(
+                    "SELECT session_id FROM blobs GROUP BY session_id HAVING MAX(updated) < ?", (cutoff,)
+                ).fetchall()
+            ]
+            for sid in expired:
+                self._conn.execute("DELETE FROM blobs WHERE session_id = ?", (sid,))
+        for sid in expired:
+            metrics.remove_gauges(session=sid)
+        if expired:
+            metrics.incr("session_store_expired", len(expired))
+        return len(expired)
+
+    def _usage_locked(self, session_id: str) -> int:
+        row = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM blobs WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return int(row[0])
+
+    def _enforce_quota(self, session_id: str, written: str) -> None:
+        """Evict least recently updated blobs (not pinned, not the one just written) until the session fits its quota."""
+        usage = self._usage_locked(session_id)
+        if usage <= self.quota_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM blobs WHERE session_id = ? AND pinned = 0 AND key != ? ORDER BY updated ASC",
+            (session_id, written),
+        ).fetchall()
+        for key, size in rows:
+            self._conn.execute("DELETE FROM blobs WHERE session_id = ? AND key = ?", (session_id, key))
+            metrics.incr("session_store_evictions")
+            usage -= size
+            if usage <= self.quota_bytes:
+                break
+
+    def _maybe_cleanup(self, now: float) -> None:
+        if now - self._last_cleanup < _CLEANUP_INTERVAL_SECONDS:
+            return
+        self._last_cleanup = now
+        self.cleanup(now)
+
+
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Process-wide store; quota/TTL configurable via THINKFLOW_SESSION_QUOTA_BYTES / THINKFLOW_SESSION_TTL."""
+    with _store_lock:
+        return _session_store()
+
+
+@lru_cache(maxsize=1)
+def _session_store() -> SessionStore:
+    quota = int(os.environ.get("THINKFLOW_SESSION_QUOTA_BYTES", DEFAULT_QUOTA_BYTES))
+    ttl = int(os.environ.get("THINKFLOW_SESSION_TTL", DEFAULT_TTL_SECONDS))
+    return SessionStore(quota_bytes=quota, ttl_seconds=ttl)
@@ -0,0 +1,104 @@
+"""
+Similar-Input Cache (opt-in).
+Reuses a recent analysis when the new context is nearly the same text, e.g. the user
+fixed a typo and clicked again. Local MinHash fingerprints over character shingles
+(core.dedupe); in-memory LRU. Numbers (dates, amounts) must match exactly, so a
+changed deadline is never answered from the cache. Entries are scoped (per session),
+so one user is never shown another user's plan.
+"""
+
+import copy
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Optional
+
+from core.dedupe import jaccard_estimate, minhash, normalize, shingles
+from utils import metrics
+
+# Whole contexts need a finer signature than paragraphs (estimate error ~ 1/sqrt(bins)).
+SIGNATURE_BINS = 256
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_MAX_ENTRIES = 256
+
+_NUMBER_RE = re.compile(r"\d+")
+
+
+def similar_cache_enabled() -> bool:
+    return os.environ.get("THINKFLOW_SIMILAR_CACHE", "0").strip().lower() in ("1", "true", "on")
+
+
+class _Entry:
+    def __init__(
+        self, scope: str, version: str, signature: tuple[int, ...], numbers: tuple[str, ...], result: dict[str, Any]
+    ):
+        self.scope = scope
+        self.version = version
+        self.signature = signature
+        self.numbers = numbers
+        self.result = result
+
+
+class SimilarCache:
+    """LRU of (fingerprint, result); lookups scan every entry, which is cheap at this size."""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._next_id = 0
+
+    @staticmethod
+    def fingerprint(context: str) -> tuple[tuple[int, ...], tuple[str, ...]]:
+        """(MinHash signature, sorted numbers) of the normalized context."""
+        return minhash(shingles(context), SIGNATURE_BINS), tuple(sorted(_NUMBER_RE.findall(normalize(context))))
+
+    def lookup(self, context: str, version: str, scope: str = "") -> Optional[tuple[dict[str, Any], float]]:
+        """
+        (result, similarity) of the closest entry in scope at or above the threshold,
+        else None. The result is a copy the caller may mutate.
+        """
+        signature, numbers = self.fingerprint(context)
+        best: Optional[tuple[int, float]] = None
+        with self._lock:
+            for entry_id, entry in self._entries.items():
+                if entry.scope != scope or entry.version != version or entry.numbers != numbers:
+                    continue
+                sim = jaccard_estimate(signature, entry.signature)
+                if sim >= self.threshold and (best is None or sim > best[1]):
+                    best = (entry_id, sim)
+            if best is None:
+                metrics.incr("similar_cache", outcome="miss")
+                return None
+            self._entries.move_to_end(best[0])
+            result = copy.deepcopy(self._entries[best[0]].result)
+        metrics.incr("similar_cache", outcome="hit")
+        return result, best[1]
+
+    def put(self, context: str, version: str, result: dict[str, Any], scope: str = "") -> None:
+        signature, numbers = self.fingerprint(context)
+        entry = _Entry(scope, version, signature, numbers, copy.deepcopy(result))
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_cache_lock = threading.Lock()
+
+
+def get_similar_cache() -> SimilarCache:
+    """Process-wide cache (THINKFLOW_SIMILAR_THRESHOLD, THINKFLOW_SIMILAR_CACHE_SIZE)."""
+    with _cache_lock:
+        return _similar_cache()
+
+
+@lru_cache(maxsize=1)
+def _similar_cache() -> SimilarCache:
+    threshold = float(os.environ.get("THINKFLOW_SIMILAR_THRESHOLD", DEFAULT_THRESHOLD))
+    size = int(os.environ.get("THINKFLOW_SIMILAR_CACHE_SIZE", DEFAULT_MAX_ENTRIES))
+    return SimilarCache(threshold=threshold, max_entries=size)
@@ -0,0 +1,263 @@
+"""
+Structured Output.
+JSON schemas for the JSON-producing chains, a lenient loader that repairs common
+model slips (code fences, trailing prose or commas, output cut off at max_tokens),
+type coercion for scalars the normalizers accept anyway ("2" for 2, "true" for true),
+and a small schema validator. Parse outcomes are counted per chain.
+"""
+
+import json
+import re
+from typing import Any, Optional
+
+from utils import metrics
+
+OK = "ok"
+REPAIRED = "repaired"
+INVALID = "invalid"
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*([\s\S]*?)(?:```|$)")
+_NULLABLE_STR = {"type": ["string", "null"]}
+_STR_LIST = {"type": "array", "items": {"type": "string"}}
+
+
+def _obj(properties: dict[str, Any], required: list[str]) -> dict[str, Any]:
+    return {"type": "object", "properties": properties, "required": required}
+
+
+_ACTION_ITEM = _obj(
+    {
+        "summary": {"type": "string"},
+        "due_date": _NULLABLE_STR,
+        "priority": {"type": ["string", "null"]},
+        "level": {"type": ["integer", "null"]},
+        "dependency": _NULLABLE_STR,
+        "ai_suggestion": _NULLABLE_STR,
+        "conditions": _NULLABLE_STR,
+        "estimated_time": _NULLABLE_STR,
+        "is_optional": {"type": ["boolean", "null"]},
+    },
+    ["summary"],
+)
+
+# What a chain's output must look like to be used as-is (missing optional fields are
+# filled in by the agent). Generation schemas are derived from these.
+SCHEMAS: dict[str, dict[str, Any]] = {
+    "gap": _obj({"ready": {"type": "boolean"}, "missing": _STR_LIST}, ["ready"]),
+    "executive": _obj(
+        {
+            "subject": {"type": "string"},
+            "overview": {"type": "string"},
+            "main_kpi": {"type": "string"},
+            "sub_metrics": {"type": "string"},
+        },
+        ["subject", "overview"],
+    ),
+    "action": {"type": "array", "items": _ACTION_ITEM},
+    "strategic": _obj(
+        {"must_finish_by": _STR_LIST, "prioritize": _STR_LIST, "can_skip": _STR_LIST},
+        ["must_finish_by", "prioritize", "can_skip"],
+    ),
+}
+# Structured-output APIs need an object at the root; array outputs are wrapped in this key.
+ROOT_KEYS = {"action": "actions"}
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def _strict(schema: dict[str, Any]) -> dict[str, Any]:
+    """Every property required, no extras (what strict JSON-schema generation expects)."""
+    out = dict(schema)
+    if schema.get("type") == "object":
+        props = {k: _strict(v) for k, v in schema["properties"].items()}
+        out.update(properties=props, required=list(props), additionalProperties=False)
+    elif schema.get("type") == "array":
+        out["items"] = _strict(schema["items"])
+    return out
+
+
+def response_format(chain: str) -> Optional[dict[str, Any]]:
+    """OpenAI-style response_format for schema-constrained generation, or None for free-text chains."""
+    schema = SCHEMAS.get(chain)
+    if schema is None:
+        return None
+    root = ROOT_KEYS.get(chain)
+    if root:
+        schema = _obj({root: schema}, [root])
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": f"thinkflow_{chain}", "strict": True, "schema": _strict(schema)},
+    }
+
+
+def validate(value: Any, schema: dict[str, Any], path: str = "$") -> list[str]:
+    """Errors for value against a schema subset (type, properties, required, items)."""
+    types = schema.get("type")
+    if types is not None:
+        names = types if isinstance(types, list) else [types]
+        if not any(_is_type(value, t) for t in names):
+            return [f"{path}: expected {'/'.join(names)}, got {type(value).__name__}"]
+    errors: list[str] = []
+    if isinstance(value, dict):
+        for key in schema.get("required", ()):
+            if key not in value:
+                errors.append(f"{path}.{key}: missing")
+        for key, sub in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate(value[key], sub, f"{path}.{key}"))
+    elif isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+def _is_type(value: Any, name: str) -> bool:
+    if name == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if name == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, _TYPES[name])
+
+
+_TRUE = ("true", "yes", "y", "1")
+_FALSE = ("false", "no", "n", "0")
+
+
+def coerce(value: Any, schema: dict[str, Any]) -> Any:
+    """
+    Convert scalars to the schema's type where the intent is unambiguous: numeric
+    strings to integers, "true"/"false" to booleans, numbers to strings, "null"/""
+    to null where allowed. Containers are coerced item by item; anything else is
+    returned unchanged for validate() to report.
+    """
+    types = schema.get("type")
+    names = types if isinstance(types, list) else [types] if types else []
+    if isinstance(value, dict):
+        props = schema.get("properties", {})
+        return {k: coerce(v, props[k]) if k in props else v for k, v in value.items()}
+    if isinstance(value, list):
+        return [coerce(v, schema["items"]) for v in value] if "items" in schema else value
+    if not names or any(_is_type(value, t) for t in names):
+        return value
+    if isinstance(value, str):
+        text = value.strip()
+        if "null" in names and text.lower() in ("", "null", "none"):
+            return None
+        if "integer" in names and re.fullmatch(r"[+-]?\d+", text):
+            return int(text)
+        if "boolean" in names and text.lower() in _TRUE + _FALSE:
+            return text.lower() in _TRUE
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        if "integer" in names and float(value).is_integer():
+            return int(value)
+        if "string" in names:
+            return str(value)
+    return value
+
+
+def _repair(text: str) -> Optional[str]:
+    """
+    Drop trailing commas and, if the text stops before its closing brackets, close them:
+    as it is when the last value is complete, else cut back to the last complete element.
+    Returns None if nothing usable is left.
+    """
+    out: list[str] = []
+    stack: list[str] = []
+    safe: Optional[tuple[int, tuple[str, ...]]] = None
+    in_str = escaped = False
+    for ch in text:
+        if in_str:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            if len(stack) == 1:
+                safe = (len(out) + 1, tuple(stack))
+        elif ch in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(ch)
+            if not stack:
+                return "".join(out)
+            safe = (len(out), tuple(stack))
+            continue
+        elif ch == "," and stack:
+            safe = (len(out), tuple(stack))
+        out.append(ch)
+    if not in_str and stack:
+        closed = "".join(out).rstrip().rstrip(",") + "".join(reversed(stack))
+        try:
+            json.loads(closed)
+            return closed
+        except json.JSONDecodeError:
+            pass
+    if safe is None:
+        return None
+    n, open_stack = safe
+    return "".join(out[:n]).rstrip().rstrip(",") + "".join(reversed(open_stack))
+
+
+def loads_lenient(raw: str) -> tuple[Any, bool]:
+    """
+    Parse the first JSON value in raw. Returns (value, repaired); raises ValueError
+    if no JSON value can be recovered.
+    """
+    text = (raw or "").strip()
+    fence = _FENCE_RE.search(text)
+    if fence:
+        text = fence.group(1).strip()
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise ValueError("no JSON value in output")
+    text = text[min(starts):]
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text)
+        return value, False
+    except json.JSONDecodeError:
+        pass
+    fixed = _repair(text)
+    if fixed is None:
+        raise ValueError("unrecoverable JSON output")
+    try:
+        return json.loads(fixed), True
+    except json.JSONDecodeError as e:
+        raise ValueError(f"unrecoverable JSON output: {e}") from e
+
+
+def parse(chain: str, raw: str) -> tuple[Any, str]:
+    """
+    Load and validate one chain's output. Returns (value, outcome) where outcome is
+    "ok", "repaired" or "invalid"; value is the best-effort parse (None if nothing
+    could be parsed) so callers can still salvage an invalid output.
+    """
+    try:
+        value, repaired = loads_lenient(raw)
+    except ValueError:
+        metrics.incr("chain_parse", chain=chain, outcome=INVALID)
+        return None, INVALID
+    root = ROOT_KEYS.get(chain)
+    if root and isinstance(value, dict) and root in value:
+        value = value[root]
+    value = coerce(value, SCHEMAS[chain])
+    errors = validate(value, SCHEMAS[chain])
+    outcome = INVALID if errors else REPAIRED if repaired else OK
+    metrics.incr("chain_parse", chain=chain, outcome=outcome)
+    return value, outcome
@@ -0,0 +1,98 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessage
+from openai import BadRequestError
+
+from core import agent as agent_module
+from core import structured
+from core.agent import ThinkFlowAgent
+
+OUTPUTS = {
+    "gap": json.dumps({"ready": True, "missing": []}),
+    "executive": json.dumps({"subject": "발표", "overview": "준비", "main_kpi": "11월 8일 발표", "sub_metrics": "리허설 2회"}),
+    "structure": "graph TD\nA[발표] --> B[자료]",
+    "action": json.dumps([{"summary": "슬라이드", "due_date": "2026-11-05", "level": 1}]),
+    "strategic": json.dumps(
+        {"must_finish_by": ["슬라이드는 11월 5일까지"], "prioritize": ["논문 요약"], "can_skip": ["데모"]}
+    ),
+}
+
+
+def _agent(monkeypatch, failing=(), calls=None):
+    def invoke(self, name, inputs, deadline=None):
+        if calls is not None:
+            calls.append(name)
+        if name in failing:
+            raise RuntimeError("429 Too Many Requests")
+        return OUTPUTS[name]
+
+    monkeypatch.setattr(ThinkFlowAgent, "_invoke", invoke)
+    return ThinkFlowAgent(model="solar-pro")
+
+
+def test_fixture_outputs_match_the_schemas():
+    for name in structured.SCHEMAS:
+        assert structured.parse(name, OUTPUTS[name])[1] == structured.OK, name
+
+
+def test_analyze_complete(monkeypatch):
+    calls = []
+    result = _agent(monkeypatch, calls=calls).analyze("11월 8일 발표 준비, 혼자")
+    assert "partial" not in result and "failed" not in result
+    assert sorted(calls) == sorted(OUTPUTS)  # every chain ran once: nothing was retried
+    assert result["actions"][0]["summary"] == "슬라이드"
+    assert result["executive_summary"]["main_kpi"] == "11월 8일 발표"
+    comments = result["strategic_comments"]
+    assert comments["must_finish_by"] == ["슬라이드는 11월 5일까지"]
+    assert comments["prioritize"] == ["논문 요약"] and comments["can_skip"] == ["데모"]
+
+
+def test_failed_chains_mark_result_partial(monkeypatch):
+    result = _agent(monkeypatch, failing=("action", "structure")).analyze("11월 8일 발표 준비, 혼자")
+    assert result["partial"] is True
+    assert result["failed"] == ["structure", "action"]
+    assert set(result["skipped"]) == {"structure", "action"}
+    assert result["mermaid"] == "" and result["actions"] == []
+    assert result["executive_summary"]["subject"] == "발표"
+
+
+def _bad_request(body):
+    return BadRequestError("400", response=SimpleNamespace(request=None, status_code=400, headers={}), body=body)
+
+
+class _Chain:
+    def __init__(self, error, calls, constrained):
+        self.error, self.calls, self.constrained = error, calls, constrained
+
+    def invoke(self, inputs):
+        self.calls.append(self.constrained)
+        if self.constrained or self.error.get("always"):
+            raise _bad_request(self.error["body"])
+        return AIMessage(content=OUTPUTS["gap"])
+
+
+@pytest.mark.parametrize(
+    "body, always, disabled",
+    [
+        ({"code": "invalid_request", "param": "response_format"}, False, True),
+        ({"code": "context_length_exceeded", "param": "messages"}, True, False),
+    ],
+)
+def test_schema_fallback_only_disables_on_schema_errors(monkeypatch, body, always, disabled):
+    calls = []
+    monkeypatch.setattr(agent_module, "_unstructured_models", set())
+    monkeypatch.setattr(
+        ThinkFlowAgent, "_chain", lambda self, name, model, timeout=None, constrained=False: _Chain(
+            {"body": body, "always": always}, calls, constrained
+        )
+    )
+    agent = ThinkFlowAgent(model="solar-pro")
+    if always:
+        with pytest.raises(BadRequestError):
+            agent._invoke("gap", {"context": "메모"})
+    else:
+        assert agent._invoke("gap", {"context": "메모"}) == OUTPUTS["gap"]
+    assert calls == [True, False]
+    assert ("solar-pro" in agent_module._unstructured_models) is disabled
@@ -0,0 +1,51 @@
+import threading
+import time
+
+import pytest
+
+from core import deadline as deadline_module
+from core.deadline import Deadline, DeadlineExceeded
+
+
+def test_call_returns_value_and_raises_errors():
+    d = Deadline()
+    assert d.call(lambda x: x * 2, 21) == 42
+    with pytest.raises(ValueError):
+        d.call(lambda: (_ for _ in ()).throw(ValueError("boom")))
+
+
+def test_call_gives_up_at_the_deadline():
+    release = threading.Event()
+    t0 = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        Deadline(0.3).call(release.wait, 5)
+    assert time.monotonic() - t0 < 2
+    release.set()
+
+
+def test_call_gives_up_on_cancel():
+    release = threading.Event()
+    d = Deadline()
+    threading.Timer(0.2, d.cancel).start()
+    with pytest.raises(InterruptedError):
+        d.call(release.wait, 5)
+    release.set()
+
+
+def test_helper_threads_are_bounded(monkeypatch):
+    monkeypatch.setattr(deadline_module, "_executor", None)
+    monkeypatch.setenv("THINKFLOW_CALL_THREADS", "2")
+    release = threading.Event()
+    for _ in range(5):
+        with pytest.raises(DeadlineExceeded):
+            Deadline(0.15).call(release.wait, 5)
+    # Five abandoned calls, but only two threads: the queued ones were dropped, never started.
+    assert len(deadline_module._executor._threads) == 2
+    release.set()
+    deadline_module._executor.shutdown(wait=True)
+
+
+def test_timeout_is_capped_by_remaining_budget():
+    assert Deadline().timeout(30) == 30
+    assert 0 < Deadline(5).timeout(30) <= 5
+    assert Deadline(0.01).timeout(30) == deadline_module.MIN_CALL_TIMEOUT_SECONDS
@@ -0,0 +1,46 @@
+from core.dedupe import dedupe_sources, identifiers, jaccard_estimate, minhash, shingles, split_paragraphs
+
+PARA = "슬라이드 초안은 11월 5일까지 만들고 리허설은 두 번 한다."
+
+
+def test_split_paragraphs_on_blank_lines_and_blocks():
+    assert split_paragraphs("a\n\nb") == ["a", "b"]
+    assert split_paragraphs("<p>a</p><p>b</p>") == ["<p>a</p>", "<p>b</p>"]
+
+
+def test_exact_duplicate_across_sources_keeps_first():
+    out = dedupe_sources([("memo", f"{PARA}\n\n첫 번째 메모의 다른 문단입니다."), ("notes.pdf", f"<p>{PARA}</p>")])
+    assert out["texts"][0].startswith(PARA)
+    assert out["texts"][1] == ""
+    removed = out["removed"][0]
+    assert removed["source"] == "notes.pdf"
+    assert removed["duplicate_of"] == {"source": "memo", "paragraph": 0}
+    assert out["tokens_removed"] > 0
+
+
+def test_near_duplicate_is_removed_distinct_is_kept():
+    near = PARA.replace("두 번", "두번") + " "
+    distinct = "참고 논문 세 편을 읽고 핵심 주장을 한 쪽으로 정리한다."
+    out = dedupe_sources([("memo", PARA), ("doc", f"{near}\n\n{distinct}")])
+    assert out["texts"][1] == distinct
+    assert out["removed"][0]["similarity"] >= 0.8
+
+
+def test_short_paragraphs_and_untouched_sources_are_unchanged():
+    text = "목차\n\n\n목차"
+    out = dedupe_sources([("memo", text)])
+    assert out["texts"] == [text] and out["removed"] == []
+
+
+def test_minhash_similarity_tracks_overlap():
+    a = minhash(shingles(PARA))
+    assert jaccard_estimate(a, a) == 1.0
+    assert jaccard_estimate(a, minhash(shingles("전혀 관계없는 문장으로 이루어진 문단"))) < 0.3
+
+
+def test_drafts_with_other_dates_or_people_are_kept():
+    draft = "분기 보고서 초안은 김 대리가 11월 12일까지 작성하고, 팀 리뷰를 거쳐 최종본을 고객사에 전달한다. 일정이 밀리면 바로 공유한다."
+    for later in (draft.replace("12일", "19일"), draft.replace("김 대리", "박 과장")):
+        out = dedupe_sources([("초안 v1", draft), ("초안 v2", later)])
+        assert out["removed"] == [] and out["texts"] == [draft, later]
+    assert identifiers("박과장님과 김 대리") == ((), ("김대리", "박과장"))
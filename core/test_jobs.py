@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from core.jobs import CANCELLED, DONE, FAILED, FINISHED_STATES, JobCancelledError, LocalJobBackend
+
+
+@pytest.fixture
+def service(tmp_path):
+    return LocalJobBackend(tmp_path / "jobs.sqlite3", max_workers=2)
+
+
+def _wait_finished(service, job_id):
+    for _ in range(500):
+        status = service.poll(job_id)
+        if status["status"] in FINISHED_STATES:
+            return status
+        threading.Event().wait(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_finished_status_implies_result_is_ready(service):
+    for _ in range(50):
+        job_id = service.submit("t", lambda ctx: {"ok": True})
+        assert _wait_finished(service, job_id)["status"] == DONE
+        assert service.result(job_id, timeout=0) == {"ok": True}
+
+
+def test_failed_job(service):
+    def boom(ctx):
+        raise ValueError("nope")
+
+    job_id = service.submit("t", boom)
+    status = _wait_finished(service, job_id)
+    assert status["status"] == FAILED and status["error"] == "nope"
+    with pytest.raises(RuntimeError):
+        service.result(job_id, timeout=0)
+
+
+def test_cancelled_job(service):
+    started = threading.Event()
+
+    def wait(ctx):
+        started.set()
+        ctx.cancel_event.wait(5)
+        raise JobCancelledError(ctx.job_id)
+
+    job_id = service.submit("t", wait)
+    started.wait(5)
+    assert service.cancel(job_id)
+    assert _wait_finished(service, job_id)["status"] == CANCELLED
+    with pytest.raises(JobCancelledError):
+        service.result(job_id, timeout=0)
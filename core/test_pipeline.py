@@ -0,0 +1,46 @@
+import io
+
+import pytest
+
+from core import processor
+from core.jobs import LocalJobBackend
+from core.pipeline import compact_refinement_context, preparse_job
+
+
+@pytest.fixture
+def ocr_calls(monkeypatch):
+    calls = []
+
+    def post(endpoint, name, document, timeout):
+        calls.append(name)
+        return [{"page": 1, "content": {"html": f"<p>{name}</p>"}}]
+
+    monkeypatch.setenv("UPSTAGE_API_KEY", "test")
+    monkeypatch.setattr(processor, "_post_document", post)
+    return calls
+
+
+def _scan(fmt: str) -> bytes:
+    from PIL import Image, ImageDraw
+
+    img = Image.new("RGB", (240, 320), "white")
+    ImageDraw.Draw(img).rectangle((20, 40, 200, 90), fill="black")
+    buf = io.BytesIO()
+    img.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def test_preparse_dedupes_images_across_files(tmp_path, ocr_calls):
+    service = LocalJobBackend(tmp_path / "jobs.sqlite3", max_workers=1)
+    files = [("scan.png", _scan("PNG")), ("scan-copy.jpg", _scan("JPEG"))]
+    job_id = service.submit("preparse", preparse_job, files)
+    docs = service.result(job_id, timeout=30)
+    assert [d["name"] for d in docs] == ["scan.png", "scan-copy.jpg"]
+    assert ocr_calls == ["scan.png"]
+
+
+def test_refinement_context_keeps_latest_plan_and_requests():
+    context = compact_refinement_context("메모", "[이전 계획]\n1. a", "첫 요청")
+    context = compact_refinement_context(context, "[이전 계획]\n1. b", "둘째 요청")
+    assert context.count("[이전 계획]") == 1 and "1. b" in context
+    assert context.index("첫 요청") < context.index("둘째 요청")
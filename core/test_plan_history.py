@@ -0,0 +1,69 @@
+from core.plan_history import PlanHistory, describe_delta, diff_plans
+
+
+def _plan(*actions, subject="발표"):
+    return {
+        "executive_summary": {"subject": subject},
+        "mermaid": "graph TD\nA-->B",
+        "strategic_comments": {},
+        "actions": [dict(a) for a in actions],
+    }
+
+
+A = {"summary": "슬라이드", "due_date": "2026-11-05"}
+B = {"summary": "리허설", "due_date": "2026-11-07"}
+
+
+def test_unchanged_actions_and_sections_are_shared():
+    h = PlanHistory()
+    v1 = h.commit(_plan(A, B), "ctx:1")
+    v2 = h.commit(_plan(A, dict(B, due_date="2026-11-06")), "ctx:2")
+    s1, s2 = h.get(v1).snapshot, h.get(v2).snapshot
+    assert s2["actions"][0] is s1["actions"][0]
+    assert s2["executive_summary"] is s1["executive_summary"]
+    assert h.get(v2).delta["changed"] == [{"summary": "리허설", "fields": ["due_date"]}]
+
+
+def test_identical_commit_returns_current():
+    h = PlanHistory()
+    v1 = h.commit(_plan(A), "ctx:1")
+    assert h.commit(_plan(A), "ctx:1") == v1
+    assert h.commit(_plan(A), "ctx:2") != v1
+
+
+def test_checkout_returns_a_copy_and_undo_target():
+    h = PlanHistory()
+    v1 = h.commit(_plan(A), "ctx:1")
+    h.commit(_plan(A, B), "ctx:2")
+    assert h.undo_target() == v1
+    plan = h.checkout(v1)
+    plan["actions"][0]["summary"] = "edited"
+    assert h.get(v1).snapshot["actions"][0]["summary"] == "슬라이드"
+    assert h.current == v1
+
+
+def test_duplicate_summaries_are_matched_in_order():
+    old = _plan(A, dict(A, due_date="2026-11-01"))
+    new = _plan(A, dict(A, due_date="2026-11-02"))
+    delta = diff_plans(old, new)
+    assert delta["added"] == [] and delta["removed"] == []
+    assert delta["changed"] == [{"summary": "슬라이드", "fields": ["due_date"]}]
+    delta = diff_plans(_plan(A), _plan(A, A))
+    assert delta["added"] == ["슬라이드"]
+    assert describe_delta(delta) == "액션 1개 추가"
+
+
+def test_versions_are_bounded_by_count_and_bytes():
+    h = PlanHistory(max_versions=3)
+    for i in range(5):
+        h.commit(_plan(dict(A, summary=f"a{i}")), f"ctx:{i}")
+    assert [v.id for v in h.versions()] == [3, 4, 5]
+    assert h.released_contexts() == ["ctx:0", "ctx:1"]
+    assert h.released_contexts() == []
+
+    h = PlanHistory(max_bytes=2000)
+    for i in range(20):
+        h.commit(_plan(dict(A, summary="x" * 200 + str(i))), "ctx:same")
+    assert h.approx_bytes() <= 2000
+    assert h.versions()[-1].id == h.current == 20
+    assert h.released_contexts() == []  # still used by the kept versions
@@ -0,0 +1,108 @@
+import io
+
+from PIL import Image, ImageDraw
+
+from core import preprocess
+from core.processor import classify_page_text
+
+BOILERPLATE = "Scanned with CamScanner"
+LECTURE = "Raft elects a leader per term; followers time out and start an election when heartbeats stop."
+
+
+def scan(seed: int, size: tuple[int, int] = (200, 280)) -> Image.Image:
+    """A grayscale page with a seed-dependent block pattern (distinct scans for distinct seeds)."""
+    img = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(img)
+    for i in range(6):
+        x = (seed * 37 + i * 53) % (size[0] - 60)
+        y = 10 + i * (size[1] - 20) // 6
+        draw.rectangle((x, y, x + 50, y + 20), fill=0)
+    return img
+
+
+def build_pdf(pages: list[tuple[str, "Image.Image | None"]]) -> bytes:
+    """Minimal PDF: each page draws an optional grayscale image and a line of text (its text layer)."""
+    objects: list[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    add(b"<< /Type /Catalog /Pages 2 0 R >>")
+    add(b"")  # page tree, filled in below
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    kids = []
+    for text, image in pages:
+        resources = f"/Font << /F1 {font} 0 R >>"
+        ops = b""
+        if image is not None:
+            gray = image.convert("L")
+            data = gray.tobytes()
+            xobj = add(
+                f"<< /Type /XObject /Subtype /Image /Width {gray.width} /Height {gray.height} "
+                f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Length {len(data)} >>\nstream\n".encode()
+                + data + b"\nendstream"
+            )
+            resources += f" /XObject << /Im0 {xobj} 0 R >>"
+            ops += b"q 200 0 0 280 0 0 cm /Im0 Do Q\n"
+        if text:
+            escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            ops += f"BT /F1 8 Tf 4 4 Td ({escaped}) Tj ET\n".encode("latin-1")
+        content = add(f"<< /Length {len(ops)} >>\nstream\n".encode() + ops + b"\nendstream")
+        kids.append(add(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 280] /Resources << {resources} >> "
+            f"/Contents {content} 0 R >>".encode()
+        ))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>".encode()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for n, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(f"{n} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for off in offsets:
+        out.write(f"{off:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def _prepare(pdf: bytes) -> dict:
+    from pypdf import PdfReader
+
+    return preprocess.prepare_pdf("doc.pdf", memoryview(pdf), PdfReader(io.BytesIO(pdf)), classify_page_text)
+
+
+def test_scans_sharing_a_boilerplate_text_layer_are_kept():
+    prepared = _prepare(build_pdf([(BOILERPLATE, scan(1)), (BOILERPLATE, scan(2)), (BOILERPLATE, scan(3))]))
+    assert prepared["dropped"] == {}
+    assert prepared["page_map"] == [1, 2, 3]
+
+
+def test_duplicate_pages_are_dropped():
+    pdf = build_pdf([(LECTURE, None), (BOILERPLATE, scan(1)), (LECTURE, None), (BOILERPLATE, scan(1))])
+    prepared = _prepare(pdf)
+    assert prepared["dropped"] == {3: 1, 4: 2}
+    assert prepared["page_map"] == [1, 2]
+    assert prepared["bytes_out"] == len(prepared["data"])
+
+
+def test_large_image_is_downscaled():
+    img = scan(4, size=(4000, 3000))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    prepared = preprocess.prepare_image("board.png", memoryview(buf.getvalue()))
+    with Image.open(io.BytesIO(prepared["data"])) as out:
+        assert max(out.size) == preprocess.MAX_IMAGE_EDGE
+    assert prepared["name"] == "board.png" and prepared["bytes_out"] < prepared["bytes_in"]
+
+
+def test_small_image_passes_through():
+    buf = io.BytesIO()
+    scan(5).save(buf, format="PNG", optimize=True)
+    view = memoryview(buf.getvalue())
+    prepared = preprocess.prepare_image("scan.png", view)
+    assert prepared["hash"] is not None
+    assert preprocess.find_duplicate(preprocess.prepare_image("again.png", view)["hash"], [("scan.png", prepared["hash"])]) == "scan.png"
@@ -0,0 +1,74 @@
+import io
+
+import pytest
+
+from core.processor import classify_page_text, parse_documents
+from core.test_preprocess import build_pdf, scan
+from loadtest.stub import Latency, StubUpstage
+
+LOCAL = "Slides first draft is due on November 5; rehearse twice before the talk."
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = StubUpstage(Latency(0.0), Latency(0.0))
+    base = server.start()
+    monkeypatch.setenv("UPSTAGE_DOCUMENT_PARSE_URL", f"{base}/v1/document-digitization")
+    monkeypatch.setenv("UPSTAGE_API_KEY", "test")
+    yield server
+    server.stop()
+
+
+def _image(seed: int) -> bytes:
+    from PIL import Image, ImageDraw
+
+    img = Image.new("L", (200, 280), 255)
+    ImageDraw.Draw(img).rectangle((10 + seed, 10, 120 + seed, 40), fill=0)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_image_is_sent_to_document_parse(stub):
+    [doc] = parse_documents([("scan.png", _image(1))])
+    assert doc["text"] == stub.fixtures["parse_html"]
+    assert doc["pages"] == [{"page": 1, "method": "ocr", "span": [0, len(doc["text"])]}]
+    assert stub.counts() == {"parse:ok": 1}
+
+
+def test_missing_api_key(monkeypatch):
+    monkeypatch.delenv("UPSTAGE_API_KEY", raising=False)
+    with pytest.raises(ValueError):
+        parse_documents([("scan.png", _image(2))])
+
+
+def test_http_error_is_reported(stub):
+    stub.error_rate = 1.0
+    with pytest.raises(ValueError, match="scan.png"):
+        parse_documents([("scan.png", _image(3))])
+
+
+def test_classify_page_text():
+    assert classify_page_text(LOCAL) == "local"
+    assert classify_page_text("Scanned with CamScanner") == "ocr"  # too short to be the page
+    assert classify_page_text("(cid:12)(cid:34)" * 40 + " ab") == "ocr"  # broken glyph mapping
+    assert classify_page_text("�" * 10 + LOCAL) == "ocr"
+
+
+def test_mixed_pdf_is_reassembled_in_page_order(stub):
+    pdf = build_pdf([(LOCAL, None), ("", scan(1)), (LOCAL.replace("5", "6"), None), ("", scan(2))])
+    [doc] = parse_documents([("mixed.pdf", pdf)])
+    html = stub.fixtures["parse_html"]
+    assert [(p["page"], p["method"]) for p in doc["pages"]] == [(1, "local"), (2, "ocr"), (3, "local"), (4, "ocr")]
+    parts = [doc["text"][slice(*p["span"])] for p in doc["pages"]]
+    assert "November 5" in parts[0] and "November 6" in parts[2]
+    assert parts[1] == html and parts[3] == html
+    assert [p["span"][0] for p in doc["pages"]] == sorted(p["span"][0] for p in doc["pages"])
+    assert stub.counts() == {"parse:ok": 1}  # both scanned pages in one request
+
+
+def test_unreadable_pdf_is_uploaded_whole(stub):
+    pdf = build_pdf([(LOCAL, None), ("", scan(3))])
+    [doc] = parse_documents([("truncated.pdf", pdf[: len(pdf) // 2])])
+    assert doc["text"] and all(p["method"] == "ocr" for p in doc["pages"])
+    assert stub.counts() == {"parse:ok": 1}
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from core.deadline import Deadline, DeadlineExceeded
+from core.quota import BATCH, INTERACTIVE, QuotaScheduler, TokenBucket, caller, current_session
+
+
+def test_token_bucket_refills_and_caps():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    bucket.take(60)
+    assert not bucket.available(1, now)
+    assert bucket.available(1, now + 1.0)
+    assert bucket.available(10_000, now + 3600)  # capped requests wait for a full bucket
+    assert TokenBucket(0).available(10**9, now)
+
+
+def test_caller_sets_current_session():
+    assert current_session() == "anonymous"
+    with caller("s1", BATCH):
+        assert current_session() == "s1"
+    assert current_session() == "anonymous"
+
+
+def _queue(scheduler, order, session, priority):
+    """Enqueue one call for session and return its thread; the granted order is appended to order."""
+    def run():
+        with caller(session, priority), scheduler.acquire():
+            order.append(session)
+
+    t = threading.Thread(target=run)
+    t.start()
+    return t
+
+
+def test_interactive_first_then_round_robin():
+    scheduler = QuotaScheduler("test", rpm=1)
+    with scheduler.acquire():
+        pass  # bucket now empty; everything below queues
+    order: list[str] = []
+    threads = [_queue(scheduler, order, s, p) for s, p in
+               (("a", BATCH), ("a", BATCH), ("b", BATCH), ("c", INTERACTIVE))]
+    while scheduler.depth() < 4:
+        time.sleep(0.01)
+    for n in range(1, 5):  # release one request at a time
+        with scheduler._lock:
+            scheduler._requests.level = 1
+            scheduler._dispatch_locked()
+        give_up = time.monotonic() + 5
+        while len(order) < n and time.monotonic() < give_up:
+            time.sleep(0.01)
+    for t in threads:
+        t.join(5)
+    assert order[0] == "c"
+    assert order[1:] == ["a", "b", "a"]
+
+
+def test_deadline_while_queued_leaves_no_ticket():
+    scheduler = QuotaScheduler("test", rpm=1)
+    with scheduler.acquire():
+        pass
+    with pytest.raises(DeadlineExceeded):
+        with scheduler.acquire(deadline=Deadline(0.2)):
+            pass
+    assert scheduler.depth() == 0
+
+
+def test_settle_refunds_unused_tokens():
+    scheduler = QuotaScheduler("test", tpm=1000)
+    with scheduler.acquire(800) as slot:
+        slot.settle(100)
+    assert scheduler._tokens.level == pytest.approx(900, abs=1)
+
+
+def test_failed_call_refunds_its_reservation():
+    scheduler = QuotaScheduler("test", tpm=1000)
+    with pytest.raises(RuntimeError):
+        with scheduler.acquire(800):
+            raise RuntimeError("500")
+    assert scheduler._tokens.level == pytest.approx(1000, abs=1)
+
+
+def test_boost_lends_priority_to_the_session_waited_on():
+    scheduler = QuotaScheduler("test", rpm=1)
+    with scheduler.acquire():
+        pass
+    order: list[str] = []
+    threads = [_queue(scheduler, order, "other", INTERACTIVE), _queue(scheduler, order, "preparse", BATCH)]
+    while scheduler.depth() < 2:
+        time.sleep(0.01)
+    with scheduler.boost("preparse", INTERACTIVE):
+        assert scheduler._queues[INTERACTIVE].keys() == {"other", "preparse"}
+        later = _queue(scheduler, order, "preparse", BATCH)  # new calls inherit the boost too
+        while scheduler.depth() < 3:
+            time.sleep(0.01)
+        assert len(scheduler._queues[INTERACTIVE]["preparse"]) == 2
+    for n in range(1, 4):
+        with scheduler._lock:
+            scheduler._requests.level = 1
+            scheduler._dispatch_locked()
+        give_up = time.monotonic() + 5
+        while len(order) < n and time.monotonic() < give_up:
+            time.sleep(0.01)
+    for t in (*threads, later):
+        t.join(5)
+    assert order == ["other", "preparse", "preparse"]
+    assert scheduler._boosts == {}
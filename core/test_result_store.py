@@ -0,0 +1,78 @@
+import threading
+import time
+
+from core.result_store import COALESCED, COMPUTED, HIT, ResultStore
+
+
+def test_every_caller_gets_its_own_copy(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    started, release = threading.Event(), threading.Event()
+
+    def compute():
+        started.set()
+        release.wait(5)
+        return {"actions": [{"summary": "a"}]}
+
+    results = {}
+
+    def leader():
+        results["leader"] = store.get_or_compute("k", compute)
+
+    t = threading.Thread(target=leader)
+    t.start()
+    started.wait(5)
+    waiters = [threading.Thread(target=lambda i=i: results.__setitem__(i, store.get_or_compute("k", compute))) for i in range(2)]
+    for w in waiters:
+        w.start()
+    time.sleep(0.2)
+    release.set()
+    t.join()
+    for w in waiters:
+        w.join()
+
+    values = [results["leader"][0], results[0][0], results[1][0]]
+    statuses = [results["leader"][1], results[0][1], results[1][1]]
+    assert statuses[0] == COMPUTED
+    assert all(s in (COALESCED, HIT) for s in statuses[1:])
+    values[1]["actions"].insert(0, {"summary": "mine"})
+    assert values[0]["actions"] == [{"summary": "a"}]
+    assert values[2]["actions"] == [{"summary": "a"}]
+
+
+def test_hits_are_independent(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    store.get_or_compute("k", lambda: {"x": [1]})
+    first, status = store.get_or_compute("k", lambda: None)
+    assert status == HIT
+    first["x"].append(2)
+    assert store.get_or_compute("k", lambda: None)[0] == {"x": [1]}
+
+
+def test_rejected_values_are_not_stored(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    store.get_or_compute("k", lambda: {"partial": True}, should_store=lambda v: not v.get("partial"))
+    assert store.get("k") is None
+
+
+def test_waiters_do_not_receive_rejected_values(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite3")
+    started, release = threading.Event(), threading.Event()
+    shareable = lambda v: not v.get("similar_to_previous")
+
+    def leader_compute():
+        started.set()
+        release.wait(5)
+        return {"owner": "leader", "similar_to_previous": True}
+
+    results = {}
+    t = threading.Thread(target=lambda: results.__setitem__("leader", store.get_or_compute("k", leader_compute, shareable)))
+    t.start()
+    started.wait(5)
+    w = threading.Thread(target=lambda: results.__setitem__("waiter", store.get_or_compute("k", lambda: {"owner": "waiter"}, shareable)))
+    w.start()
+    time.sleep(0.2)
+    release.set()
+    t.join()
+    w.join()
+    assert results["leader"][0]["owner"] == "leader"
+    assert results["waiter"] == ({"owner": "waiter"}, COMPUTED)
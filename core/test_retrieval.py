@@ -0,0 +1,72 @@
+import json
+
+from core.retrieval import (
+    CHAIN_RETRIEVAL,
+    DOCUMENT_MARKER,
+    EVAL_FIXTURE_PATH,
+    REFINE_PLAN_MARKER,
+    REFINE_REQUEST_MARKER,
+    estimate_tokens,
+    evaluate_fixture,
+    select_context,
+    split_sections,
+)
+
+MEMO = "발표 준비. 11월 8일 발표, 혼자 준비함."
+FILLER = "\n\n".join(f"배경 설명 {i}번 문단입니다. 합의 알고리즘의 역사와 여러 변형을 길게 소개하는 내용이다." * 3 for i in range(30))
+
+
+def _context(*blocks: str) -> str:
+    return "\n\n".join([MEMO, f"{DOCUMENT_MARKER} notes.pdf\n{FILLER}", *blocks])
+
+
+def test_small_context_is_unchanged():
+    assert select_context(MEMO, "action") == MEMO
+
+
+def test_thought_dump_and_refinement_blocks_are_always_kept():
+    plan = f"{REFINE_PLAN_MARKER}\n주제: 발표\n1. 슬라이드 (마감: 2026-11-05)"
+    request = f"{REFINE_REQUEST_MARKER}\n리허설을 하루 앞당겨 주세요."
+    context = _context(plan, request)
+    for chain in ("gap", "executive", "structure", "action", "strategic"):
+        selected = select_context(context, chain, budget=200)
+        assert selected.startswith(MEMO)
+        assert plan in selected and request in selected
+        assert f"{DOCUMENT_MARKER} notes.pdf" in selected
+        assert estimate_tokens(selected) < estimate_tokens(context)
+
+
+def test_document_passages_fit_the_remaining_budget():
+    context = _context()
+    selected = select_context(context, "action", budget=400)
+    assert estimate_tokens(selected) <= 400 + estimate_tokens(f"{DOCUMENT_MARKER} notes.pdf")
+
+
+def test_sections_without_document_headers_pin_first_chunk():
+    sections = split_sections(MEMO + "\n\n" + FILLER)
+    assert sections[0][0] is False and sections[0][1].startswith(MEMO)
+    assert sections[1][0] is True
+
+
+def test_labelled_fixture():
+    with open(EVAL_FIXTURE_PATH, encoding="utf-8") as fh:
+        cases = {c["name"]: c for c in json.load(fh)["cases"]}
+    results = evaluate_fixture()
+    assert len(results) == sum(len(c["expected"]) for c in cases.values())
+    for r in results:
+        assert r["token_reduction"] > 0
+        assert r["recall"] == 1.0, (r["case"], r["chain"])
+        # Cases without a budget run at the production chain budgets.
+        assert r["tokens_selected"] <= (cases[r["case"]].get("budget") or CHAIN_RETRIEVAL[r["chain"]]["budget"])
+    assert any("budget" not in c for c in cases.values())
+    # The pinned lines of every case are always among the kept ones.
+    for r, case in ((r, cases[r["case"]]) for r in results):
+        selected = select_context(case["context"], r["chain"], case.get("budget", 0))
+        assert case["context"].split("\n\n")[0] in selected
+
+
+def test_dated_lines_are_not_packed_with_background():
+    todo = "11월 5일까지 슬라이드 초안 완성하기."
+    context = _context() + "\n\n" + todo
+    selected = select_context(context, "gap", budget=150)
+    assert todo in selected
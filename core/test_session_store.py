@@ -0,0 +1,49 @@
+from core.session_store import SessionStore
+from utils import metrics
+
+
+def test_quota_evicts_oldest_unpinned_blob(tmp_path):
+    store = SessionStore(tmp_path / "s.sqlite3", quota_bytes=100)
+    store.put("s", "last_context", "c" * 40, pinned=True)
+    store.put("s", "old", b"o" * 40)
+    store.put("s", "ics", b"i" * 40)
+    assert store.get("s", "old") is None
+    assert store.get_text("s", "last_context") == "c" * 40
+    assert store.get("s", "ics") == b"i" * 40
+
+
+def test_pinned_blob_survives_repeated_writes(tmp_path):
+    store = SessionStore(tmp_path / "s.sqlite3", quota_bytes=100)
+    store.put("s", "last_context", "c" * 60, pinned=True)
+    for i in range(5):
+        store.put("s", "ics", b"i" * (50 + i))
+    assert store.get_text("s", "last_context") == "c" * 60
+
+
+def test_expiry_drops_every_session_gauge(tmp_path):
+    metrics.reset()
+    store = SessionStore(tmp_path / "s.sqlite3", ttl_seconds=10)
+    store.put("gone", "k", b"x")
+    metrics.set_gauge("session_state_bytes", 10, session="gone")
+    metrics.set_gauge("session_memory_bytes", 11, session="gone")
+    metrics.set_gauge("session_state_bytes", 10, session="gone-too-long")
+    assert store.cleanup(now=10**12) == 1
+    gauges = metrics.snapshot()["gauges"]
+    assert not [k for k in gauges if "session=gone}" in k or "session=gone," in k]
+    assert "session_state_bytes{session=gone-too-long}" in gauges
+
+
+def test_existing_store_without_pinned_column(tmp_path):
+    import sqlite3
+
+    path = tmp_path / "s.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE blobs (session_id TEXT NOT NULL, key TEXT NOT NULL, data BLOB NOT NULL,"
+        " size INTEGER NOT NULL, updated REAL NOT NULL, PRIMARY KEY (session_id, key))"
+    )
+    conn.commit()
+    conn.close()
+    store = SessionStore(path)
+    store.put("s", "k", b"v", pinned=True)
+    assert store.get("s", "k") == b"v"
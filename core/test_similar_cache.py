@@ -0,0 +1,39 @@
+from core.similar_cache import SimilarCache
+
+CONTEXT = (
+    "기말 발표 준비. 11월 8일 발표, 혼자 준비. 참고 논문 3편을 읽고 요약해야 하고 슬라이드 초안은 "
+    "11월 5일까지 만들어야 함. 리허설도 두 번 하고 싶음. 발표 주제는 분산 시스템의 합의 알고리즘이고, "
+    "청중은 같은 수업을 듣는 학생들이라 배경 설명을 너무 길게 하지 않으려고 함. 데모를 넣을지 고민 중."
+)
+EDITED = CONTEXT.replace("고민 중", "고민중")
+
+
+def test_near_duplicate_hits_within_scope():
+    cache = SimilarCache()
+    cache.put(CONTEXT, "v1", {"actions": [{"summary": "a"}]}, scope="s1")
+    found = cache.lookup(EDITED, "v1", scope="s1")
+    assert found is not None and found[1] >= cache.threshold
+
+
+def test_other_scope_and_version_miss():
+    cache = SimilarCache()
+    cache.put(CONTEXT, "v1", {"actions": []}, scope="s1")
+    assert cache.lookup(CONTEXT, "v1", scope="s2") is None
+    assert cache.lookup(CONTEXT, "v2", scope="s1") is None
+
+
+def test_changed_number_misses():
+    cache = SimilarCache()
+    cache.put(CONTEXT, "v1", {"actions": []}, scope="s1")
+    assert cache.lookup(CONTEXT.replace("8일", "9일"), "v1", scope="s1") is None
+
+
+def test_entries_are_copied_on_put_and_get():
+    cache = SimilarCache()
+    result = {"actions": [{"summary": "a"}]}
+    cache.put(CONTEXT, "v1", result, scope="s1")
+    result["actions"].append({"summary": "later edit"})
+    first, _ = cache.lookup(CONTEXT, "v1", scope="s1")
+    first["actions"].insert(0, {"summary": "mine"})
+    second, _ = cache.lookup(CONTEXT, "v1", scope="s1")
+    assert second == {"actions": [{"summary": "a"}]}
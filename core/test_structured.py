@@ -0,0 +1,36 @@
+import pytest
+
+from core import structured
+
+
+def test_repair_keeps_last_complete_key():
+    value, repaired = structured.loads_lenient('{"subject":"a","overview":"c"')
+    assert repaired and value == {"subject": "a", "overview": "c"}
+
+
+def test_repair_cuts_incomplete_value():
+    value, _ = structured.loads_lenient('{"subject":"a","overview":"unfinis')
+    assert value == {"subject": "a"}
+    value, _ = structured.loads_lenient('[{"summary":"x"},{"summary":"y","level":')
+    assert value == [{"summary": "x"}, {"summary": "y"}]
+
+
+def test_fences_and_trailing_commas():
+    value, _ = structured.loads_lenient('```json\n{"ready": true, "missing": [],}\n```')
+    assert value == {"ready": True, "missing": []}
+    with pytest.raises(ValueError):
+        structured.loads_lenient("no json here")
+
+
+def test_parse_coerces_scalars_before_validating():
+    value, outcome = structured.parse("gap", '{"ready": "false", "missing": ["마감일"]}')
+    assert outcome == structured.OK and value["ready"] is False
+    raw = '{"actions": [{"summary": "초안", "due_date": "2026-11-05", "level": "2", "is_optional": "true"}]}'
+    value, outcome = structured.parse("action", raw)
+    assert outcome == structured.OK
+    assert value[0]["level"] == 2 and value[0]["is_optional"] is True
+
+
+def test_parse_reports_uncoercible_values():
+    _, outcome = structured.parse("gap", '{"ready": "maybe", "missing": []}')
+    assert outcome == structured.INVALID
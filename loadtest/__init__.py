@@ -0,0 +1,5 @@
+"""
+Load Testing.
+Drives the pipeline with simulated concurrent users against a local Upstage stand-in
+(loadtest.stub), without network access or API keys. See loadtest.__main__.
+"""
@@ -0,0 +1,202 @@
+"""
+End-to-end load test.
+N simulated users each repeat the app's journey, upload -> analyze -> refine -> ICS
+export, through the same job service, quota scheduler and stores the app uses,
+against the local stub (no network, no API key). Reports p50/p95/p99 latency and
+throughput per stage, plus queueing and cache counters.
+
+    python -m loadtest --users 8 --iterations 3 --chat-latency 0.8:3 --parse-latency 1.5:5 --error-rate 0.02
+
+Quota limits, worker count and deadlines come from the usual THINKFLOW_* variables.
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Any
+
+from loadtest.stub import Latency, StubUpstage
+from utils import metrics
+
+STAGES = ("upload", "analyze", "refine", "ics")
+REFINE_REQUEST = "리허설을 하루 앞당기고, 선택 항목은 빼 주세요."
+
+
+def _thought(user: int, iteration: int, shared: bool) -> str:
+    tag = "" if shared else f" (사용자 {user}, {iteration + 1}회차)"
+    return (
+        f"기말 발표 준비{tag}. 11월 8일 발표, 혼자 준비. 참고 논문 3편을 읽고 요약해야 하고 "
+        "슬라이드 초안은 11월 5일까지 만들어야 함. 리허설도 두 번 하고 싶음."
+    )
+
+
+def _scan_pdf(pages: int, seed: int) -> bytes:
+    """A scanned-looking PDF (image pages, no text layer) that differs per seed, so every upload is OCR'd."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    images = []
+    for _ in range(max(1, pages)):
+        img = Image.new("L", (420, 594), 255)
+        draw = ImageDraw.Draw(img)
+        for _ in range(40):
+            x, y = rng.randrange(20, 380), rng.randrange(20, 560)
+            draw.rectangle((x, y, x + rng.randrange(10, 40), y + 6), fill=rng.randrange(0, 120))
+        images.append(img)
+    buf = io.BytesIO()
+    images[0].save(buf, format="PDF", save_all=True, append_images=images[1:])
+    return buf.getvalue()
+
+
+class Recorder:
+    """Per-stage latencies (successful runs) and error messages."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.samples: dict[str, list[float]] = {s: [] for s in STAGES}
+        self.errors: dict[str, list[str]] = {s: [] for s in STAGES}
+
+    def run(self, stage: str, fn, *args: Any) -> Any:
+        t0 = time.perf_counter()
+        try:
+            value = fn(*args)
+        except Exception as e:
+            with self._lock:
+                self.errors[stage].append(f"{type(e).__name__}: {e}")
+            return None
+        with self._lock:
+            self.samples[stage].append(time.perf_counter() - t0)
+        return value
+
+
+def _user(user: int, args: argparse.Namespace, rec: Recorder) -> None:
+    from core.jobs import get_job_service, get_preparse_service
+    from core.pipeline import analysis_job, compact_refinement_context, plan_summary, preparse_job
+    from core.quota import BATCH, INTERACTIVE, caller
+    from utils.helpers import generate_ics
+
+    service = get_job_service()
+    preparse_service = get_preparse_service()
+    session = f"loadtest-{user}"
+
+    def submit(priority: int, fn, *fn_args: Any) -> Any:
+        jobs = preparse_service if fn is preparse_job else service
+        with caller(session, priority):
+            job_id = jobs.submit("loadtest", fn, *fn_args)
+        return jobs.result(job_id, timeout=args.timeout)
+
+    for it in range(args.iterations):
+        seed = 0 if args.shared_inputs else user * 1000 + it
+        upload = (f"notes-{seed}.pdf", _scan_pdf(args.pages, seed))
+        # The app pre-parses on upload (batch priority), then analyzes on click.
+        rec.run("upload", submit, BATCH, preparse_job, [upload])
+        out = rec.run("analyze", submit, INTERACTIVE, analysis_job, _thought(user, it, args.shared_inputs), [upload])
+        result = (out or {}).get("result")
+        if not result or result.get("need_clarification"):
+            continue
+        context = compact_refinement_context(out["context"], plan_summary(result), REFINE_REQUEST)
+        refined = rec.run("refine", submit, INTERACTIVE, analysis_job, context, [])
+        actions = ((refined or {}).get("result") or {}).get("actions") or result.get("actions") or []
+        rec.run("ics", generate_ics, actions)
+
+
+def _counters(snapshot: dict[str, Any], prefix: str) -> dict[str, float]:
+    return {k: v for k, v in sorted(snapshot["counters"].items()) if k.startswith(prefix)}
+
+
+def report(rec: Recorder, wall: float, stub: StubUpstage) -> dict[str, Any]:
+    snap = metrics.snapshot()
+    stages = {}
+    for stage in STAGES:
+        samples = rec.samples[stage]
+        stages[stage] = {
+            "ok": len(samples),
+            "errors": len(rec.errors[stage]),
+            "p50": metrics.percentile(samples, 50),
+            "p95": metrics.percentile(samples, 95),
+            "p99": metrics.percentile(samples, 99),
+            "per_second": len(samples) / wall if wall else 0.0,
+        }
+    return {
+        "wall_seconds": wall,
+        "stages": stages,
+        "quota_wait": {k: v for k, v in snap["histograms"].items() if k.startswith("quota_wait_seconds")},
+        "result_store": _counters(snap, "result_store"),
+        "chain_parse": _counters(snap, "chain_parse"),
+        "stub_requests": stub.counts(),
+        "sample_errors": {s: sorted(set(e))[:3] for s, e in rec.errors.items() if e},
+    }
+
+
+def _print_report(r: dict[str, Any]) -> None:
+    print(f"\nwall time {r['wall_seconds']:.1f}s")
+    print(f"{'stage':8s} {'ok':>5s} {'err':>5s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'ops/s':>7s}")
+    for stage, s in r["stages"].items():
+        print(
+            f"{stage:8s} {s['ok']:>5d} {s['errors']:>5d} {s['p50']:>7.2f}s {s['p95']:>7.2f}s "
+            f"{s['p99']:>7.2f}s {s['per_second']:>7.2f}"
+        )
+    for name, h in r["quota_wait"].items():
+        print(f"{name}: n={h['count']} p50={h['p50']:.2f}s p95={h['p95']:.2f}s max={h['max']:.2f}s")
+    for section in ("result_store", "chain_parse", "stub_requests"):
+        if r[section]:
+            print(f"{section}: " + ", ".join(f"{k}={v:g}" for k, v in r[section].items()))
+    for stage, errors in r["sample_errors"].items():
+        print(f"{stage} errors: " + " | ".join(errors))
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m loadtest", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=4, help="concurrent simulated users")
+    parser.add_argument("--iterations", type=int, default=2, help="journeys per user")
+    parser.add_argument("--pages", type=int, default=2, help="pages per uploaded scan")
+    parser.add_argument("--chat-latency", default="0.5:2", help="Solar latency median[:p95] in seconds")
+    parser.add_argument("--parse-latency", default="1:4", help="Document Parse latency median[:p95] in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub requests failing with 429/500")
+    parser.add_argument("--seed", type=int, default=None, help="seed for stub latency and errors")
+    parser.add_argument("--shared-inputs", action="store_true", help="every user sends the same text and file")
+    parser.add_argument("--timeout", type=float, default=600, help="give up waiting on one job after this long")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    stub = StubUpstage(
+        Latency.parse(args.chat_latency), Latency.parse(args.parse_latency), args.error_rate, seed=args.seed
+    )
+    base = stub.start()
+    os.environ["UPSTAGE_API_BASE"] = f"{base}/v1/solar"
+    os.environ["UPSTAGE_DOCUMENT_PARSE_URL"] = f"{base}/v1/document-digitization"
+    os.environ["UPSTAGE_API_KEY"] = "loadtest"
+    # Fresh stores, so results from earlier runs are not served from the result cache.
+    os.environ["THINKFLOW_DATA_DIR"] = tempfile.mkdtemp(prefix="thinkflow-loadtest-")
+    metrics.reset()
+
+    rec = Recorder()
+    threads = [
+        threading.Thread(target=_user, args=(u, args, rec), name=f"loadtest-user-{u}", daemon=True)
+        for u in range(args.users)
+    ]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    stub.stop()
+
+    r = report(rec, wall, stub)
+    if args.json:
+        json.dump(r, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        _print_report(r)
+    return 1 if any(s["errors"] for s in r["stages"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
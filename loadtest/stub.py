@@ -0,0 +1,222 @@
+"""
+Local Upstage Stand-in.
+A small HTTP server that answers the two Upstage APIs ThinkFlow calls, Solar chat
+completions (OpenAI format) and Document Parse, with recorded fixtures shaped like
+the utils/prompts output formats. Latency is log-normal (median and p95 per API)
+and a share of requests fails with 429/500, so the client retry and quota paths run.
+
+Point the app at it with:
+    UPSTAGE_API_BASE=http://127.0.0.1:<port>/v1/solar
+    UPSTAGE_DOCUMENT_PARSE_URL=http://127.0.0.1:<port>/v1/document-digitization
+
+Run on its own with:
+    python -m loadtest.stub [port]
+"""
+
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Optional
+
+from core.retrieval import estimate_tokens
+from core.structured import ROOT_KEYS
+from utils.prompts import (
+    ACTION_PROMPT,
+    EXECUTIVE_SUMMARY_PROMPT,
+    GAP_ANALYSIS_PROMPT,
+    STRATEGIC_COMMENTS_PROMPT,
+    STRUCTURE_PROMPT,
+)
+
+FIXTURES_PATH = Path(__file__).with_name("fixtures.json")
+_CHAIN_PROMPTS = {
+    "gap": GAP_ANALYSIS_PROMPT,
+    "executive": EXECUTIVE_SUMMARY_PROMPT,
+    "structure": STRUCTURE_PROMPT,
+    "action": ACTION_PROMPT,
+    "strategic": STRATEGIC_COMMENTS_PROMPT,
+}
+# PDF page objects ("/Type /Pages" is the page tree, not a page).
+_PDF_PAGE_RE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+# Normal quantile of 0.95, to turn (median, p95) into a log-normal sigma.
+_Z95 = 1.6449
+
+
+class Latency:
+    """Log-normal delay with the given median and 95th percentile (seconds)."""
+
+    def __init__(self, median: float, p95: Optional[float] = None):
+        self.median = max(0.0, median)
+        p95 = p95 if p95 is not None else median
+        self.sigma = math.log(p95 / median) / _Z95 if median > 0 and p95 > median else 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        """"0.8" or "0.8:3" (median:p95)."""
+        median, _, p95 = spec.partition(":")
+        return cls(float(median), float(p95) if p95 else None)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(rng.gauss(0.0, self.sigma)) if self.sigma else self.median
+
+
+def _prompt_marker(template: str) -> str:
+    """First line of a prompt template; unique per chain, so it identifies the chain."""
+    return template.strip().splitlines()[0][:40]
+
+
+class StubUpstage:
+    """
+    Stand-in server. Fixtures: {"chat": {chain: output text}, "parse_html": str};
+    chat outputs are returned as recorded, so a fixture can also exercise the repair path.
+    """
+
+    def __init__(
+        self,
+        chat_latency: Latency = Latency(0.0),
+        parse_latency: Latency = Latency(0.0),
+        error_rate: float = 0.0,
+        fixtures_path: Path = FIXTURES_PATH,
+        seed: Optional[int] = None,
+    ):
+        self.chat_latency = chat_latency
+        self.parse_latency = parse_latency
+        self.error_rate = error_rate
+        with open(fixtures_path, encoding="utf-8") as fh:
+            self.fixtures = json.load(fh)
+        self._markers = {name: _prompt_marker(p.template) for name, p in _CHAIN_PROMPTS.items()}
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._counts: dict[str, int] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    # ---- server lifecycle ----
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serve on a background thread; returns the base URL (port 0 picks a free port)."""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                status, payload = stub.handle(self.path, body)
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="stub-upstage", daemon=True).start()
+        return f"http://{host}:{self._server.server_address[1]}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def counts(self) -> dict[str, int]:
+        """Requests served per "<api>:<outcome>" (e.g. "chat:action", "parse:error")."""
+        with self._rng_lock:
+            return dict(self._counts)
+
+    # ---- request handling ----
+
+    def _count(self, key: str) -> None:
+        with self._rng_lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def _draw(self, latency: Latency) -> tuple[float, bool]:
+        with self._rng_lock:
+            return latency.sample(self._rng), self._rng.random() < self.error_rate
+
+    def _error(self, api: str) -> tuple[int, dict[str, Any]]:
+        self._count(f"{api}:error")
+        with self._rng_lock:
+            status = self._rng.choice((429, 500))
+        return status, {"error": {"message": f"stub {api} error", "type": "stub", "code": status}}
+
+    def handle(self, path: str, body: bytes) -> tuple[int, dict[str, Any]]:
+        if path.rstrip("/").endswith("/chat/completions"):
+            delay, fail = self._draw(self.chat_latency)
+            time.sleep(delay)
+            return self._error("chat") if fail else (200, self._chat(json.loads(body or b"{}")))
+        if "document-digitization" in path:
+            delay, fail = self._draw(self.parse_latency)
+            time.sleep(delay)
+            return self._error("parse") if fail else (200, self._parse(body))
+        return 404, {"error": {"message": f"no stub for {path}"}}
+
+    def _chain_for(self, prompt: str) -> Optional[str]:
+        for name, marker in self._markers.items():
+            if marker in prompt:
+                return name
+        return None
+
+    def _chat(self, request: dict[str, Any]) -> dict[str, Any]:
+        messages = request.get("messages") or []
+        prompt = "\n".join(str(m.get("content") or "") for m in messages)
+        chain = self._chain_for(prompt)
+        content = self.fixtures["chat"].get(chain or "", "")
+        if chain in ROOT_KEYS and request.get("response_format"):
+            # Schema-constrained requests get the array wrapped in its root key, as the API does.
+            content = json.dumps({ROOT_KEYS[chain]: json.loads(content)}, ensure_ascii=False)
+        self._count(f"chat:{chain or 'unknown'}")
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(content)
+        return {
+            "id": f"stub-{time.monotonic_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _parse(self, body: bytes) -> dict[str, Any]:
+        pages = len(_PDF_PAGE_RE.findall(body)) if b"%PDF-" in body[:4096] else 1
+        self._count("parse:ok")
+        html = self.fixtures["parse_html"]
+        return {
+            "api": "2.0",
+            "model": "document-parse-stub",
+            "elements": [
+                {"id": i, "page": i + 1, "category": "paragraph", "content": {"html": html, "text": "", "markdown": ""}}
+                for i in range(max(pages, 1))
+            ],
+            "usage": {"pages": max(pages, 1)},
+        }
+
+
+if __name__ == "__main__":
+    stub = StubUpstage(Latency(0.5, 2.0), Latency(1.0, 4.0), error_rate=0.02)
+    base = stub.start(port=int(sys.argv[1]) if len(sys.argv) > 1 else 0)
+    print(f"UPSTAGE_API_BASE={base}/v1/solar")
+    print(f"UPSTAGE_DOCUMENT_PARSE_URL={base}/v1/document-digitization")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
@@ -1,13 +1,40 @@
 """
-Helpers: ICS calendar generation, Mermaid diagram cleaning, Live Mermaid renderer.
+Helpers: ICS calendar generation, Mermaid diagram cleaning, Live Mermaid renderer,
+logic-tree level of detail.
 """
 
+import hashlib
+import os
 import re
+import threading
+from collections import OrderedDict, deque
 from datetime import date, datetime
-from typing import Any
+from typing import Any, Iterable
 
 from ics import Calendar, Event
 
+# Logic-tree level of detail: deeper levels and nodes past the budget fold into summary nodes.
+TREE_MAX_DEPTH = int(os.environ.get("THINKFLOW_TREE_MAX_DEPTH", 4))
+TREE_MAX_NODES = int(os.environ.get("THINKFLOW_TREE_MAX_NODES", 60))
+# Hard cap on drawn nodes, expanded branches included, so browser render time stays bounded.
+TREE_HARD_MAX_NODES = 300
+
+_RENDER_CACHE_MAX_ENTRIES = 64
+_render_cache: "OrderedDict[tuple[str, int], str]" = OrderedDict()
+_render_cache_lock = threading.Lock()
+
+_NODE_ID_RE = re.compile(r"\s*([A-Za-z0-9_\uac00-\ud7a3]+)")
+# Links: "-- text -->" style (text between the dashes) first, then plain arrows; an
+# optional |label| follows either.
+_EDGE_RE = re.compile(
+    r"\s*(?:(?:--|-\.|==)(?![->.=])\s*(?P<text>[^|]*?)\s*(?:-{2,}>|-{3,}|\.-+>|\.-+|={2,}>|={3,})"
+    r"|<?(?:-{2,}>|-{3,}|-\.+->|-\.+-|={2,}>|={3,}|--[xo]))"
+    r"\s*(?:\|(?P<label>[^|]*)\|)?"
+)
+_AMP_RE = re.compile(r"\s*&")
+_BRACKETS = {"[": "]", "(": ")", "{": "}"}
+_SKIP_LINE_RE = re.compile(r"^\s*(graph|flowchart|classDef|class|style|linkStyle|subgraph|end|click|%%)\b", re.I)
+
 
 def format_dday(due: str | datetime | None) -> str:
     """Format due date as D-day (D-5, D+3, D-day)."""
@@ -78,7 +105,7 @@ def _sanitize_mermaid_code(code: str) -> str:
         return f"[{inner}]" if inner else "[Node]"
 
     s = re.sub(r"\[([^\]]*)\]", fix_label, s)
-    s = re.sub(r"\(([^)]*)\)", lambda m: f"({m.group(1).replace('"', "'")})", s)
+    s = re.sub(r"\(([^)]*)\)", lambda m: "(" + m.group(1).replace('"', "'") + ")", s)
     if not re.search(r"^\s*(graph|flowchart)\s+", s, re.I):
         s = "graph TD\n" + s
     return s
@@ -94,11 +121,237 @@ def render_mermaid(code: str, height: int = 500) -> str:
     """
     Produce HTML block with Mermaid.js (CDN) to render the diagram.
     Uses div.mermaid + startOnLoad for reliable display. Fallback: empty string.
+    Memoized by code hash and height (reruns re-render the same tree).
     """
+    key = (hashlib.sha256((code or "").encode("utf-8")).hexdigest(), height)
+    with _render_cache_lock:
+        if key in _render_cache:
+            _render_cache.move_to_end(key)
+            return _render_cache[key]
     cleaned = _normalize_mermaid_for_graph(clean_mermaid(code or ""))
-    if not cleaned.strip():
-        return ""
-    return _mermaid_html(cleaned, height=height)
+    html = _mermaid_html(cleaned, height=height) if cleaned.strip() else ""
+    with _render_cache_lock:
+        _render_cache[key] = html
+        while len(_render_cache) > _RENDER_CACHE_MAX_ENTRIES:
+            _render_cache.popitem(last=False)
+    return html
+
+
+def _split_statements(code: str) -> list[str]:
+    """Lines split further on ";" outside labels (brackets and quotes)."""
+    statements: list[str] = []
+    current: list[str] = []
+    depth, quoted = 0, False
+    for ch in code:
+        if ch == "\n" or (ch == ";" and depth == 0 and not quoted):
+            statements.append("".join(current))
+            current, depth, quoted = [], 0, False
+            continue
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch in "[({":
+            depth += 1
+        elif not quoted and ch in "])}" and depth:
+            depth -= 1
+        current.append(ch)
+    statements.append("".join(current))
+    return statements
+
+
+def _match_shape(line: str, pos: int) -> int:
+    """
+    End of the bracketed label starting at pos (balanced, quotes respected), pos if
+    there is none. Covers every shape: [a], (a), ((a)), {a}, {{a}}, [(a)], [/a/], >a].
+
+    Raises:
+        ValueError: If the brackets never close.
+    """
+    if pos < len(line) and line[pos] == ">":
+        end = line.find("]", pos)
+        if end < 0:
+            raise ValueError(f"unclosed label: {line[pos:]!r}")
+        return end + 1
+    if pos >= len(line) or line[pos] not in _BRACKETS:
+        return pos
+    stack: list[str] = []
+    quoted = False
+    for i in range(pos, len(line)):
+        ch = line[i]
+        if ch == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif ch in _BRACKETS:
+            stack.append(_BRACKETS[ch])
+        elif stack and ch == stack[-1]:
+            stack.pop()
+            if not stack:
+                return i + 1
+    raise ValueError(f"unclosed label: {line[pos:]!r}")
+
+
+def _parse_mermaid_graph(code: str) -> tuple[dict[str, str], dict[str, list[tuple[str, str]]]]:
+    """
+    Nodes ({id: label shape, e.g. "[목표]"}) and edges ({parent: [(child, edge label)]}) of a
+    graph TD in first-seen order. Statements are node/edge chains, "A & B --> C" groups
+    included; directives (style, classDef, subgraph, ...) are skipped.
+
+    Raises:
+        ValueError: If a statement is not a chain this parser understands.
+    """
+    nodes: dict[str, str] = {}
+    children: dict[str, list[tuple[str, str]]] = {}
+    for line in _split_statements(code):
+        if not line.strip() or _SKIP_LINE_RE.match(line):
+            continue
+        pos = 0
+        prev: list[str] = []
+        label = ""
+        while True:
+            group: list[str] = []
+            while True:
+                m = _NODE_ID_RE.match(line, pos)
+                if not m:
+                    raise ValueError(f"cannot parse Mermaid statement: {line.strip()!r}")
+                node = m.group(1)
+                end = _match_shape(line, m.end())
+                shape = line[m.end():end].strip()
+                if shape or node not in nodes:
+                    nodes[node] = shape or nodes.get(node, "")
+                group.append(node)
+                pos = end
+                amp = _AMP_RE.match(line, pos)
+                if not amp:
+                    break
+                pos = amp.end()
+            for parent in prev:
+                for node in group:
+                    children.setdefault(parent, []).append((node, label))
+            e = _EDGE_RE.match(line, pos)
+            if not e:
+                break
+            prev, label, pos = group, (e.group("label") or e.group("text") or "").strip(), e.end()
+        if line[pos:].strip():
+            raise ValueError(f"cannot parse Mermaid statement: {line.strip()!r}")
+    return nodes, children
+
+
+def limit_mermaid_detail(
+    code: str,
+    max_depth: int = TREE_MAX_DEPTH,
+    max_nodes: int = TREE_MAX_NODES,
+    expanded: Iterable[str] = (),
+) -> dict[str, Any]:
+    """
+    Level of detail for a graph TD: keep nodes breadth-first up to max_depth levels
+    and max_nodes nodes; each kept node whose children were cut gets one summary node
+    counting the hidden nodes below it. Children of `expanded` node ids are always drawn
+    (up to TREE_HARD_MAX_NODES). Small graphs, and graphs with a statement the parser
+    does not understand, come back unchanged.
+
+    Returns:
+        {"code": Mermaid code to render, "nodes": total nodes, "shown": drawn nodes,
+         "collapsed": {node id: {"label", "hidden"}}, "expanded": {node id: label} of expanded ids in the graph}
+    """
+    cleaned = clean_mermaid(code or "")
+    try:
+        nodes, children = _parse_mermaid_graph(cleaned)
+    except ValueError:
+        return {"code": cleaned, "nodes": 0, "shown": 0, "collapsed": {}, "expanded": {}}
+    expanded_set = {n for n in expanded if n in nodes}
+    out: dict[str, Any] = {
+        "code": cleaned,
+        "nodes": len(nodes),
+        "shown": len(nodes),
+        "collapsed": {},
+        "expanded": {n: _node_text(n, nodes[n]) for n in nodes if n in expanded_set},
+    }
+    if not nodes:
+        return out
+    has_parent = {c for edges in children.values() for c, _ in edges}
+    roots = [n for n in nodes if n not in has_parent] or [next(iter(nodes))]
+
+    # Everything some root reaches; nodes below a depth cut are folded, not restarted from.
+    reachable: set[str] = set()
+    _mark_reachable(roots, children, reachable)
+
+    kept: dict[str, None] = {}
+    queue = deque((r, 0, False) for r in roots)
+    seen = set(roots)
+    unvisited = iter(nodes)
+    while True:
+        if not queue:
+            # Parts of the graph no root reaches (cycles) start from their first node.
+            rest = next((n for n in unvisited if n not in seen and n not in reachable), None)
+            if rest is None:
+                break
+            seen.add(rest)
+            _mark_reachable([rest], children, reachable)
+            queue.append((rest, 0, False))
+        node, depth, forced = queue.popleft()
+        if len(kept) >= TREE_HARD_MAX_NODES or (len(kept) >= max_nodes and not forced):
+            continue
+        kept[node] = None
+        if depth >= max_depth and node not in expanded_set:
+            continue
+        for child, _ in children.get(node, ()):
+            if child not in seen:
+                seen.add(child)
+                queue.append((child, depth + 1, node in expanded_set))
+    if len(kept) == len(nodes):
+        return out
+
+    # Each hidden node is counted once, under the first kept node (breadth-first) that reaches it.
+    hidden: dict[str, int] = {}
+    assigned: set[str] = set(kept)
+    for node in kept:
+        stack = [c for c, _ in children.get(node, ()) if c not in assigned]
+        assigned.update(stack)
+        count = 0
+        while stack:
+            count += 1
+            for c, _ in children.get(stack.pop(), ()):
+                if c not in assigned:
+                    assigned.add(c)
+                    stack.append(c)
+        if count:
+            hidden[node] = count
+
+    lines = ["graph TD"]
+    for node in kept:
+        lines.append(f"    {node}{nodes[node]}")
+    for node in kept:
+        for child, label in children.get(node, ()):
+            if child in kept:
+                lines.append(f"    {node} -->{f'|{label}|' if label else ''} {child}")
+        if node in hidden:
+            lines.append(f"    {node} -.-> {node}_more[+{hidden[node]}개 하위 항목]")
+    if hidden:
+        lines.append("    classDef collapsed fill:#f3f4f6,stroke:#d1d5db,color:#6b7280,stroke-dasharray:4 4")
+        lines.append("    class " + ",".join(f"{n}_more" for n in hidden) + " collapsed")
+    out.update(
+        code="\n".join(lines),
+        shown=len(kept),
+        collapsed={n: {"label": _node_text(n, nodes[n]), "hidden": c} for n, c in hidden.items()},
+    )
+    return out
+
+
+def _mark_reachable(starts: list[str], children: dict[str, list[tuple[str, str]]], reachable: set[str]) -> None:
+    """Add starts and every node below them to reachable."""
+    stack = [n for n in starts if n not in reachable]
+    reachable.update(stack)
+    while stack:
+        for child, _ in children.get(stack.pop(), ()):
+            if child not in reachable:
+                reachable.add(child)
+                stack.append(child)
+
+
+def _node_text(node: str, shape: str) -> str:
+    """Display text of a node: its label without the shape brackets, else the id."""
+    text = shape.strip("[](){}/\\>").strip().strip('"').strip() if shape else ""
+    return text or node
 
 
 def clean_mermaid(text: str) -> str:
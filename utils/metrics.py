@@ -0,0 +1,107 @@
+"""
+Metrics: lightweight in-process counters, gauges and histograms.
+Thread-safe; read with snapshot() for logging or a debug panel.
+"""
+
+import math
+import threading
+from typing import Any
+
+_MAX_SAMPLES = 1024
+
+_lock = threading.Lock()
+_counters: dict[str, float] = {}
+_gauges: dict[str, float] = {}
+_histograms: dict[str, dict[str, Any]] = {}
+
+
+def _key(name: str, labels: dict[str, Any]) -> str:
+    if not labels:
+        return name
+    inner = ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+    return f"{name}{{{inner}}}"
+
+
+def incr(name: str, value: float = 1, **labels: Any) -> None:
+    """Increase a counter (e.g. incr("chain_calls", chain="action"))."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels: Any) -> None:
+    """Set a gauge to its current value."""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def remove_gauge(name: str, **labels: Any) -> None:
+    """Drop a gauge (e.g. when a session is cleaned up)."""
+    key = _key(name, labels)
+    with _lock:
+        _gauges.pop(key, None)
+
+
+def remove_gauges(**labels: Any) -> None:
+    """Drop every gauge carrying all of these labels (e.g. remove_gauges(session=sid))."""
+    wanted = {f"{k}={v}" for k, v in labels.items()}
+    with _lock:
+        for key in [k for k in _gauges if "{" in k]:
+            if wanted <= set(key[key.index("{") + 1:-1].split(",")):
+                del _gauges[key]
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    """Record one sample in a histogram (keeps count/sum/min/max + recent samples)."""
+    key = _key(name, labels)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = {"count": 0, "sum": 0.0, "min": value, "max": value, "samples": []}
+            _histograms[key] = h
+        h["count"] += 1
+        h["sum"] += value
+        h["min"] = min(h["min"], value)
+        h["max"] = max(h["max"], value)
+        samples = h["samples"]
+        samples.append(value)
+        if len(samples) > _MAX_SAMPLES:
+            del samples[: len(samples) - _MAX_SAMPLES]
+
+
+def percentile(samples: list[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..100). Returns 0.0 for empty input."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+def snapshot() -> dict[str, Any]:
+    """Return a copy of all metrics. Histograms are summarized (count, mean, p50/p95/max)."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        hists = {k: dict(v, samples=list(v["samples"])) for k, v in _histograms.items()}
+    summary: dict[str, dict[str, float]] = {}
+    for key, h in hists.items():
+        samples = h["samples"]
+        summary[key] = {
+            "count": h["count"],
+            "mean": h["sum"] / h["count"] if h["count"] else 0.0,
+            "min": h["min"],
+            "max": h["max"],
+            "p50": percentile(samples, 50),
+            "p95": percentile(samples, 95),
+        }
+    return {"counters": counters, "gauges": gauges, "histograms": summary}
+
+
+def reset() -> None:
+    """Clear all metrics (used by benchmarks between runs)."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
@@ -0,0 +1,227 @@
+"""
+Rerun Profiling (opt-in).
+Times one Streamlit script run block by block (lap()), times chosen calls inside
+the blocks (timed()) and samples the run's call stacks.
+Enable with THINKFLOW_PROFILE=1 or the ?profile=1 query parameter. Each rerun writes
+<dir>/rerun-<time>.folded, collapsed stacks rooted at the block name (flamegraph.pl,
+speedscope, inferno), appends its block timings to <dir>/reruns.jsonl and rewrites
+<dir>/summary.json with per-block p50/p95/max over recent reruns.
+<dir> is THINKFLOW_PROFILE_DIR, default <THINKFLOW_DATA_DIR>/profiles.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Iterator, Optional
+
+from utils import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_SECONDS = 0.005
+DEFAULT_KEEP = 100
+_MAX_DEPTH = 128
+
+_active: ContextVar[Optional["RerunProfiler"]] = ContextVar("rerun_profiler", default=None)
+_log_lock = threading.Lock()
+
+
+def profiling_enabled(query_value: Optional[str] = None) -> bool:
+    """THINKFLOW_PROFILE env var or the ?profile= query parameter."""
+    flags = (os.environ.get("THINKFLOW_PROFILE", ""), query_value or "")
+    return any(v.strip().lower() in ("1", "true", "on") for v in flags)
+
+
+def profile_dir() -> Path:
+    base = os.environ.get("THINKFLOW_PROFILE_DIR", "").strip()
+    if base:
+        path = Path(base)
+    else:
+        from core.session_store import data_dir
+
+        path = data_dir() / "profiles"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RerunProfiler:
+    """
+    Section timers plus a sampling profiler for one thread: a helper thread reads that
+    thread's stack every `interval` seconds, so overhead stays flat however deep the
+    rendering code goes.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL_SECONDS, label: str = ""):
+        self.interval = interval
+        self.label = label
+        self.sections: dict[str, float] = {}
+        self.calls: dict[str, float] = {}
+        self.stacks: Counter = Counter()
+        self._section = "setup"
+        self._section_start = 0.0
+        self._started = 0.0
+        self._thread_id = 0
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread_id = threading.get_ident()
+        self._started = self._section_start = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample_loop, name="rerun-profiler", daemon=True)
+        self._sampler.start()
+
+    def lap(self, section: str) -> None:
+        """Close the current block and start timing `section`."""
+        now = time.perf_counter()
+        self.sections[self._section] = self.sections.get(self._section, 0.0) + now - self._section_start
+        self._section, self._section_start = section, now
+
+    def stop(self) -> float:
+        """Stop sampling; returns the rerun's total seconds."""
+        self.lap("")
+        self.sections.pop("", None)
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        return time.perf_counter() - self._started
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            names: list[str] = []
+            while frame is not None and len(names) < _MAX_DEPTH:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join([self._section, *reversed(names)])] += 1
+
+    def folded(self) -> str:
+        """Collapsed-stack text: one "block;outer;...;inner count" line per distinct stack."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Time one call inside a block, e.g. render_mermaid (no-op when profiling is off)."""
+    profiler = _active.get()
+    if profiler is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.calls[name] = profiler.calls.get(name, 0.0) + time.perf_counter() - t0
+
+
+def lap(section: str) -> None:
+    """Mark the start of a dashboard block in the profiled rerun (no-op when profiling is off)."""
+    profiler = _active.get()
+    if profiler is not None:
+        profiler.lap(section)
+
+
+@contextmanager
+def rerun(enabled: bool, label: str = "") -> Iterator[None]:
+    """
+    Profile the enclosed script run when enabled. Output is written even when the run
+    ends early (st.stop(), st.rerun()); write failures are logged, never raised.
+    """
+    if not enabled:
+        yield
+        return
+    interval = float(os.environ.get("THINKFLOW_PROFILE_INTERVAL", DEFAULT_INTERVAL_SECONDS))
+    profiler = RerunProfiler(interval=interval, label=label)
+    token = _active.set(profiler)
+    profiler.start()
+    try:
+        yield
+    finally:
+        total = profiler.stop()
+        _active.reset(token)
+        metrics.observe("rerun_seconds", total)
+        for section, seconds in profiler.sections.items():
+            metrics.observe("rerun_section_seconds", seconds, section=section)
+        for name, seconds in profiler.calls.items():
+            metrics.observe("rerun_call_seconds", seconds, call=name)
+        try:
+            _write(profiler, total)
+        except OSError as e:
+            logger.warning("rerun profile not written: %s", e)
+
+
+def summary(snapshot: Optional[dict] = None) -> dict[str, dict[str, float]]:
+    """
+    Rolling timings (count, mean, p50, p95, max) from the in-process metrics: "total",
+    one entry per block and "call:<name>" per timed() call.
+    """
+    hists = (snapshot or metrics.snapshot())["histograms"]
+    out: dict[str, dict[str, float]] = {}
+    for key, h in hists.items():
+        if key == "rerun_seconds":
+            out["total"] = h
+        elif key.startswith("rerun_section_seconds{section="):
+            out[key[len("rerun_section_seconds{section="):-1]] = h
+        elif key.startswith("rerun_call_seconds{call="):
+            out["call:" + key[len("rerun_call_seconds{call="):-1]] = h
+    return out
+
+
+@contextmanager
+def _locked(out: Path) -> Iterator[None]:
+    """Hold reruns.jsonl for one append-and-trim, across threads and (with fcntl) processes."""
+    with _log_lock, open(out / "reruns.lock", "a") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _write(profiler: RerunProfiler, total: float) -> None:
+    out = profile_dir()
+    stamp = time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() % 1_000_000_000:09d}"
+    (out / f"rerun-{stamp}.folded").write_text(profiler.folded(), encoding="utf-8")
+    record = {
+        "time": time.time(),
+        "label": profiler.label,
+        "total": round(total, 4),
+        "sections": {k: round(v, 4) for k, v in profiler.sections.items()},
+        "calls": {k: round(v, 4) for k, v in profiler.calls.items()},
+        "samples": sum(profiler.stacks.values()),
+    }
+    # Keep the newest THINKFLOW_PROFILE_KEEP reruns (0 keeps everything).
+    keep = int(os.environ.get("THINKFLOW_PROFILE_KEEP", DEFAULT_KEEP))
+    log = out / "reruns.jsonl"
+    with _locked(out):
+        with open(log, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if keep > 0:
+            lines = log.read_text(encoding="utf-8").splitlines(keepends=True)
+            if len(lines) > 2 * keep:
+                log.write_text("".join(lines[-keep:]), encoding="utf-8")
+        # Written aside and swapped in, so a reader never sees a half-written file.
+        tmp = out / f"summary.json.{os.getpid()}.tmp"
+        tmp.write_text(json.dumps(summary(), indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, out / "summary.json")
+    if keep > 0:
+        for old in sorted(out.glob("rerun-*.folded"))[:-keep]:
+            old.unlink(missing_ok=True)
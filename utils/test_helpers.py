@@ -0,0 +1,54 @@
+from utils.helpers import _parse_mermaid_graph, limit_mermaid_detail
+
+
+def _tree(width: int, depth: int) -> str:
+    lines = ["graph TD", "R[목표]"]
+    level = ["R"]
+    for d in range(depth):
+        nxt = []
+        for parent in level:
+            for i in range(width):
+                child = f"{parent}_{i}"
+                lines.append(f"{parent} --> {child}[항목 {d}-{i}]")
+                nxt.append(child)
+        level = nxt
+    return "\n".join(lines)
+
+
+def test_small_graph_is_unchanged():
+    code = "graph TD\nA[목표] --> B[자료]"
+    out = limit_mermaid_detail(code)
+    assert out["code"] == code and out["collapsed"] == {}
+    assert out["nodes"] == out["shown"] == 2
+
+
+def test_large_tree_is_folded_and_expandable():
+    code = _tree(width=3, depth=4)  # 1 + 3 + 9 + 27 + 81 nodes
+    out = limit_mermaid_detail(code, max_depth=2, max_nodes=60)
+    assert out["nodes"] == 121 and out["shown"] == 13
+    assert sum(c["hidden"] for c in out["collapsed"].values()) == 121 - 13
+    assert "R_0_0_more[+12개 하위 항목]" in out["code"]
+    opened = limit_mermaid_detail(code, max_depth=2, max_nodes=60, expanded=["R_0_0"])
+    assert "R_0_0_0" in opened["code"] and opened["expanded"] == {"R_0_0": "항목 1-0"}
+
+
+def test_text_edges_groups_and_semicolons():
+    nodes, children = _parse_mermaid_graph("graph TD\nA -- 조사 --> B & C\nA[a; b] --> D;D --> E")
+    assert list(nodes) == ["A", "B", "C", "D", "E"]
+    assert nodes["A"] == "[a; b]"
+    assert children == {"A": [("B", "조사"), ("C", "조사"), ("D", "")], "D": [("E", "")]}
+    nodes, children = _parse_mermaid_graph("graph TD\nA & B -->|x| C")
+    assert children == {"A": [("C", "x")], "B": [("C", "x")]}
+
+
+def test_nested_brackets_in_labels_survive_folding():
+    code = "graph TD\n" + "\n".join(f'R --> N{i}("자료 (논문 {i})")' for i in range(70))
+    out = limit_mermaid_detail(code, max_nodes=10)
+    assert 'N0("자료 (논문 0)")' in out["code"]
+    assert out["collapsed"]["R"]["label"] == "R"
+
+
+def test_unparseable_graph_is_returned_unfolded():
+    code = "graph TD\n" + "\n".join(f"R --> N{i}" for i in range(70)) + "\nthis is not (mermaid"
+    out = limit_mermaid_detail(code, max_nodes=10)
+    assert out["code"] == code and out["collapsed"] == {}
@@ -0,0 +1,32 @@
+import json
+import threading
+
+from utils import profiling
+
+
+def _profiler(label: str) -> profiling.RerunProfiler:
+    p = profiling.RerunProfiler(label=label)
+    p.sections = {"dashboard": 0.01}
+    return p
+
+
+def test_concurrent_writes_keep_whole_records(tmp_path, monkeypatch):
+    monkeypatch.setenv("THINKFLOW_PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("THINKFLOW_PROFILE_KEEP", "5")
+
+    def writer(n):
+        for i in range(20):
+            profiling._write(_profiler(f"{n}-{i}"), 0.01)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    profiling._write(_profiler("last"), 0.01)
+    records = [json.loads(line) for line in (tmp_path / "reruns.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert 5 <= len(records) <= 10
+    assert records[-1]["label"] == "last"
+    assert len(list(tmp_path.glob("rerun-*.folded"))) == 5
+    assert isinstance(json.loads((tmp_path / "summary.json").read_text(encoding="utf-8")), dict)
+    assert not list(tmp_path.glob("summary.json.*"))